@@ -0,0 +1,118 @@
+# ruff: noqa: B008
+"""Compare the requests/sec of the review reads against the previous ORM path.
+
+The previous path loaded identity-mapped ORM objects, validated them into the pydantic models
+and let FastAPI validate and encode them a second time against `response_model`. It is rebuilt
+here as a reference app reading the same database as `review_app.main.app`.
+
+Usage: python -m benchmarks.read_paths [--users 50] [--reviews 5000] [--requests 2000]
+
+DATABASE_URL can point to any database with a sync driver, a temporary SQLite file is used by
+default. The database is seeded by the script with the `ScaleInitialization` of the tests, so it
+must be empty and the script run from the root of the repository.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import typing as ty
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/read_paths.db'
+
+import anyio
+import httpx
+from fastapi import Depends, FastAPI, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+import review_app.database.models as sqlm
+from review_app import main, schemas
+from review_app.database import database, service
+from test.database.initializer_helper import ScaleInitialization, Skew
+
+legacy_app = FastAPI()
+
+
+def _legacy_get_review(db: service.DatabaseService, review_id: int) -> schemas.Review:
+    review = db.session.get(sqlm.Review, review_id, options=service._REVIEW_LOAD_OPTIONS)
+    return schemas.Review.model_validate(review)
+
+
+def _legacy_get_user_reviews(db: service.DatabaseService, user_id: int, limit: int) -> list[schemas.Review]:
+    if db.session.get(sqlm.User, user_id) is None:
+        raise service.NotFoundError(f'User with id {user_id} not found')
+    statement = (
+        select(sqlm.Review)
+        .where(sqlm.Review.user_id == user_id)
+        .order_by(sqlm.Review.id)
+        .limit(limit)
+        .options(*service._REVIEW_LOAD_OPTIONS)
+    )
+    return [schemas.Review.model_validate(review) for review in db.session.scalars(statement)]
+
+
+# Same dependency and threadpool dispatch as `main`, only the materialization and serialization differ
+@legacy_app.get('/reviews/{review_id}', response_model=schemas.Review)
+async def legacy_read_review(review_id: int, db: service.DatabaseService = Depends(main.get_database_service)):
+    return await run_in_threadpool(_legacy_get_review, db, review_id=review_id)
+
+
+@legacy_app.get('/users/{user_id}/reviews', response_model=list[schemas.Review])
+async def legacy_read_user_reviews(
+    user_id: int,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: service.DatabaseService = Depends(main.get_database_service),
+):
+    return await run_in_threadpool(_legacy_get_user_reviews, db, user_id=user_id, limit=limit)
+
+
+def seed(n_users: int, n_reviews: int) -> None:
+    with database.engine.begin() as connection:
+        ScaleInitialization(users=n_users, media=100, reviews=n_reviews, skew=Skew.UNIFORM).populate(connection)
+
+
+async def requests_per_second(app: FastAPI, urls: list[str]) -> float:
+    """Requests served per second, sent one after the other straight to the ASGI app, so the
+    result is not drowned by the network stack or the threads of `TestClient`."""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        start = time.perf_counter()
+        for url in urls:
+            response = await client.get(url)
+            assert response.status_code == 200, response.text
+        return len(urls) / (time.perf_counter() - start)
+
+
+async def get_json(app: FastAPI, url: str) -> ty.Any:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        return (await client.get(url)).json()
+
+
+def main_(arguments: ty.Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args(arguments)
+
+    seed(args.users, args.reviews)
+    rng = random.Random(0)
+    routes = {
+        'GET /reviews/{id}': [f'/reviews/{rng.randint(1, args.reviews)}' for _ in range(args.requests)],
+        'GET /users/{id}/reviews': [f'/users/{rng.randint(1, args.users)}/reviews' for _ in range(args.requests)],
+    }
+    apps = {'orm': legacy_app, 'fast': main.app}
+    print(f'{"route":<26}{"orm req/s":>12}{"fast req/s":>12}{"speedup":>10}')
+    for route, urls in routes.items():
+        # Same responses from both apps, then one warm up pass before measuring
+        assert anyio.run(get_json, legacy_app, urls[0]) == anyio.run(get_json, main.app, urls[0])
+        for app in apps.values():
+            anyio.run(requests_per_second, app, urls[:100])
+        results = {name: anyio.run(requests_per_second, app, urls) for name, app in apps.items()}
+        print(f'{route:<26}{results["orm"]:>12.0f}{results["fast"]:>12.0f}{results["fast"] / results["orm"]:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main_()
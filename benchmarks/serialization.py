@@ -0,0 +1,99 @@
+"""Microbenchmark of the serialization of each response schema of `review_app.main`.
+
+Three ways of turning the models returned by the service into a JSON body are timed:
+* `response_model`: What FastAPI does with a returned model: validate it again against
+  `response_model`, dump it to JSON compatible Python objects and encode those with `json.dumps`.
+* `dump_json`: The path of `main._json_response`, pydantic-core writing the JSON bytes straight
+  from the models with the serializer of the schema (a `TypeAdapter` for the lists).
+* `orjson`: The models dumped to Python objects and encoded by orjson, when it is installed.
+
+Usage: python benchmarks/serialization.py [--items 100] [--number 1000]
+"""
+
+import argparse
+import functools
+import json
+import timeit
+import typing as ty
+
+import pydantic
+
+from review_app import schemas
+
+try:
+    import orjson
+except ImportError:  # Optional, only compared against when installed
+    orjson = None
+
+
+def _samples(items: int) -> dict[str, tuple[ty.Any, ty.Any]]:
+    """Response value of each schema, with `items` items for the lists, by name."""
+    media_type = schemas.MediaType(id=1, name='Book')
+    author = schemas.Author(id=1, name='J.R.R. Tolkien', alive=False)
+    media = schemas.Media(
+        id=1, title='The Lord of the Rings', media_type_id=1, author_id=1, media_type=media_type, author=author
+    )
+    rated_media = schemas.RatedMedia(**media.model_dump(), rating_count=2, rating_average=4.5, rating_score=3.25)
+    user = schemas.User(id=1, name='John Doe', age=25)
+    review = schemas.Review(
+        id=1, media_id=1, user_id=1, rating=5, review='One of the classics, a must read!', media=media, user=user
+    )
+    return {
+        'User': (schemas.User, user),
+        'MediaType': (schemas.MediaType, media_type),
+        'Author': (schemas.Author, author),
+        'Media': (schemas.Media, media),
+        'Review': (schemas.Review, review),
+        f'list[Review] ({items})': (list[schemas.Review], [review] * items),
+        f'list[Media] ({items})': (list[schemas.Media], [media] * items),
+        f'list[RatedMedia] ({items})': (list[schemas.RatedMedia], [rated_media] * items),
+        f'GetManyResult[Review] ({items})': (
+            schemas.GetManyResult[schemas.Review],
+            schemas.GetManyResult[schemas.Review](items=[review] * items, not_found=[]),
+        ),
+        f'BulkResult[Review] ({items})': (
+            schemas.BulkResult[schemas.Review],
+            schemas.BulkResult[schemas.Review](created=[review] * items, errors=[]),
+        ),
+    }
+
+
+def _serializers(schema: ty.Any) -> dict[str, ty.Callable[[ty.Any], bytes | str]]:
+    adapter = pydantic.TypeAdapter(schema)
+    serializers: dict[str, ty.Callable[[ty.Any], bytes | str]] = {
+        'response_model': lambda value: json.dumps(
+            adapter.dump_python(adapter.validate_python(value, from_attributes=True), mode='json'),
+            ensure_ascii=False,
+            separators=(',', ':'),
+        ),
+        'dump_json': adapter.dump_json,
+    }
+    if orjson is not None:
+        serializers['orjson'] = lambda value: orjson.dumps(adapter.dump_python(value, mode='json'))
+    return serializers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100, help='Items of the list responses')
+    parser.add_argument('--number', type=int, default=1000, help='Serializations timed per schema and path')
+    args = parser.parse_args()
+
+    names = ['response_model', 'dump_json', *(['orjson'] if orjson is not None else [])]
+    print(f'{"schema":<32}' + ''.join(f'{name + " us":>20}' for name in names) + f'{"speedup":>10}')
+    for name, (schema, value) in _samples(args.items).items():
+        serializers = _serializers(schema)
+        # Same JSON document whatever the path
+        assert json.loads(serializers['dump_json'](value)) == json.loads(serializers['response_model'](value))
+        times = {
+            path: min(timeit.repeat(functools.partial(serialize, value), number=args.number, repeat=3))
+            / args.number
+            * 1e6
+            for path, serialize in serializers.items()
+        }
+        speedup = times['response_model'] / times['dump_json']
+        print(f'{name:<32}' + ''.join(f'{times[path]:>20.2f}' for path in names) + f'{speedup:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
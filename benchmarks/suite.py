@@ -0,0 +1,412 @@
+"""HTTP benchmark suite covering every route of `review_app.main`.
+
+The suite seeds a database at the requested scale and starts the app with uvicorn in a
+subprocess. It then drives each route with concurrent clients and records the p50/p95/p99
+latency, the throughput and the statements run per request. Results are saved as a JSON
+baseline, which later runs can be compared against:
+
+    python -m benchmarks.suite --users 100000 --reviews 1000000 --save baseline.json
+    python -m benchmarks.suite --users 100000 --reviews 1000000 --compare baseline.json
+
+It runs from the root of the repository, as a module, since the database is seeded by the
+`ScaleInitialization` of the tests.
+
+The comparison exits with status 1 when a route regresses more than `--tolerance`.
+
+By default the database is a temporary SQLite file. `--database postgres` uses a testcontainers
+Postgres instead (Docker is needed), and `--async-driver` runs the app in async mode. The
+clients share one Python process, so with a single route's throughput above a few thousand
+requests/sec the clients themselves become the bottleneck.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as ty
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass, field
+
+import httpx
+from sqlalchemy import Engine, create_engine, event, make_url, select
+
+import review_app.database.models as sqlm
+from test.database.initializer_helper import ScaleInitialization, Skew
+
+BULK_SIZE = 100
+
+
+@dataclass
+class Scale:
+    users: int
+    media: int
+    reviews: int
+    authors: int
+    media_types: int
+    # Authors with reviewed media, the ones with a highest rated media, known once seeded
+    reviewed_authors: list[int] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class Route:
+    name: str
+    method: str
+    url: Callable[[random.Random, Scale], str]
+    body: Callable[[random.Random, Scale], ty.Any] | None = None
+
+
+@dataclass
+class RouteResult:
+    requests: int
+    errors: int
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries_per_request: float
+
+
+def _user(rng: random.Random, scale: Scale) -> dict[str, ty.Any]:
+    return {'name': f'User {rng.randrange(10**9)}', 'age': rng.randint(12, 90)}
+
+
+def _media(rng: random.Random, scale: Scale) -> dict[str, ty.Any]:
+    return {
+        'title': f'Media {rng.randrange(10**9)}',
+        'media_type_id': rng.randint(1, scale.media_types),
+        'author_id': rng.randint(1, scale.authors),
+    }
+
+
+def _review(rng: random.Random, scale: Scale) -> dict[str, ty.Any]:
+    return {
+        'media_id': rng.randint(1, scale.media),
+        'user_id': rng.randint(1, scale.users),
+        'rating': rng.randint(1, 5),
+        'review': f'Review {rng.randrange(10**9)}',
+    }
+
+
+def _ids(rng: random.Random, count: int) -> str:
+    """100 random ids out of `count`, as the get many routes take them."""
+    return ','.join(str(rng.randint(1, count)) for _ in range(100))
+
+
+# Reads first, so the writes do not change the data they run on
+ROUTES = [
+    Route('GET /users/{id}', 'GET', lambda rng, scale: f'/users/{rng.randint(1, scale.users)}'),
+    Route('GET /users/{id}/reviews', 'GET', lambda rng, scale: f'/users/{rng.randint(1, scale.users)}/reviews'),
+    Route(
+        'GET /users/{id}/reviews?stream',
+        'GET',
+        lambda rng, scale: f'/users/{rng.randint(1, scale.users)}/reviews?stream=true',
+    ),
+    Route('GET /media_types/{id}', 'GET', lambda rng, scale: f'/media_types/{rng.randint(1, scale.media_types)}'),
+    Route('GET /reviews/{id}', 'GET', lambda rng, scale: f'/reviews/{rng.randint(1, scale.reviews)}'),
+    Route('GET /media/{id}', 'GET', lambda rng, scale: f'/media/{rng.randint(1, scale.media)}'),
+    Route('GET /authors/{id}', 'GET', lambda rng, scale: f'/authors/{rng.randint(1, scale.authors)}'),
+    Route(
+        'GET /authors/{id}/highest_rated_media',
+        'GET',
+        lambda rng, scale: f'/authors/{rng.choice(scale.reviewed_authors)}/highest_rated_media',
+    ),
+    Route('GET /authors/{id}/stats', 'GET', lambda rng, scale: f'/authors/{rng.randint(1, scale.authors)}/stats'),
+    Route('GET /users?ids', 'GET', lambda rng, scale: f'/users?ids={_ids(rng, scale.users)}'),
+    Route('GET /reviews?ids', 'GET', lambda rng, scale: f'/reviews?ids={_ids(rng, scale.reviews)}'),
+    Route('GET /media?ids', 'GET', lambda rng, scale: f'/media?ids={_ids(rng, scale.media)}'),
+    Route('GET /authors?ids', 'GET', lambda rng, scale: f'/authors?ids={_ids(rng, scale.authors)}'),
+    Route('GET /rankings/media', 'GET', lambda rng, scale: '/rankings/media'),
+    Route(
+        'GET /rankings/media?media_type_id',
+        'GET',
+        lambda rng, scale: f'/rankings/media?media_type_id={rng.randint(1, scale.media_types)}',
+    ),
+    # A word of every seeded title or review along with one of a single row
+    Route('GET /media/search', 'GET', lambda rng, scale: f'/media/search?q=media+{rng.randint(1, scale.media)}'),
+    Route('GET /reviews/search', 'GET', lambda rng, scale: f'/reviews/search?q=review+{rng.randint(1, scale.reviews)}'),
+    Route(
+        'GET /analytics/ratings/{group}',
+        'GET',
+        lambda rng, scale: f'/analytics/ratings/{rng.choice(["media", "author", "media_type", "user"])}',
+    ),
+    Route('GET /status/pool', 'GET', lambda rng, scale: '/status/pool'),
+    Route('GET /status/cache', 'GET', lambda rng, scale: '/status/cache'),
+    Route('GET /metrics', 'GET', lambda rng, scale: '/metrics'),
+    Route('POST /users/', 'POST', lambda rng, scale: '/users/', _user),
+    Route(
+        'POST /media_types/',
+        'POST',
+        lambda rng, scale: '/media_types/',
+        lambda rng, scale: {'name': f'Type {rng.randrange(10**9)}'},
+    ),
+    Route(
+        'POST /authors/',
+        'POST',
+        lambda rng, scale: '/authors/',
+        lambda rng, scale: {'name': f'Author {rng.randrange(10**9)}', 'alive': rng.random() < 0.5},
+    ),
+    Route('POST /media/', 'POST', lambda rng, scale: '/media/', _media),
+    Route('POST /reviews/', 'POST', lambda rng, scale: '/reviews/', _review),
+    Route(
+        'POST /users/bulk',
+        'POST',
+        lambda rng, scale: '/users/bulk',
+        lambda rng, scale: [_user(rng, scale) for _ in range(BULK_SIZE)],
+    ),
+    Route(
+        'POST /media/bulk',
+        'POST',
+        lambda rng, scale: '/media/bulk',
+        lambda rng, scale: [_media(rng, scale) for _ in range(BULK_SIZE)],
+    ),
+    Route(
+        'POST /reviews/bulk',
+        'POST',
+        lambda rng, scale: '/reviews/bulk',
+        lambda rng, scale: [_review(rng, scale) for _ in range(BULK_SIZE)],
+    ),
+]
+
+
+# Seeding ----------------------------------------------------------------------
+def seed(engine: Engine, scale: Scale, skew: Skew, random_seed: int) -> None:
+    """Fill an empty database with `ScaleInitialization`, in chunks so memory stays flat at any scale,
+    then record the authors with reviewed media in `scale`. Ids are sequential from 1, which the
+    routes rely on to pick existing rows."""
+    sqlm.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        ScaleInitialization(
+            users=scale.users,
+            media=scale.media,
+            reviews=scale.reviews,
+            authors=scale.authors,
+            media_types=scale.media_types,
+            skew=skew,
+            seed=random_seed,
+        ).populate(connection)
+        reviewed_authors = (
+            select(sqlm.Media.author_id)
+            .where(sqlm.Media.author_id.is_not(None), sqlm.Media.rating_count > 0)
+            .distinct()
+            .order_by(sqlm.Media.author_id)
+        )
+        scale.reviewed_authors = list(connection.scalars(reviewed_authors))
+
+
+# Measurements -----------------------------------------------------------------
+async def _drive(
+    client: httpx.AsyncClient, route: Route, scale: Scale, rng: random.Random, concurrency: int, requests: int
+) -> tuple[list[float], int, float]:
+    """Send `requests` requests to a route from `concurrency` concurrent clients, returning the
+    latencies in seconds, the number of failed requests and the elapsed time."""
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def client_loop() -> None:
+        nonlocal errors
+        for _ in pending:
+            body = route.body(rng, scale) if route.body else None
+            start = time.perf_counter()
+            response = await client.request(route.method, route.url(rng, scale), json=body)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def _queries_per_request(route: Route, scale: Scale, rng: random.Random, samples: int) -> float:
+    """Average number of statements run by a route, measured in this process through the ASGI app
+    since the statements of the uvicorn server cannot be observed from here."""
+    from review_app import main  # Imported once DATABASE_URL is set
+    from review_app.database import database
+
+    count = 0
+
+    def on_execute(*args: ty.Any) -> None:
+        nonlocal count
+        count += 1
+
+    event.listen(database.engine, 'before_cursor_execute', on_execute)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://suite') as client:
+            for _ in range(samples):
+                body = route.body(rng, scale) if route.body else None
+                await client.request(route.method, route.url(rng, scale), json=body)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', on_execute)
+    return count / samples
+
+
+async def benchmark(
+    base_url: str, routes: list[Route], scale: Scale, rng: random.Random, concurrency: int, requests: int
+) -> dict[str, RouteResult]:
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for route in routes:
+            # Warm up the connections, the pool of the app and its cache
+            await _drive(client, route, scale, rng, concurrency, min(requests, 10 * concurrency))
+            latencies, errors, elapsed = await _drive(client, route, scale, rng, concurrency, requests)
+            percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+            results[route.name] = RouteResult(
+                requests=requests,
+                errors=errors,
+                requests_per_second=round(requests / elapsed, 1),
+                p50_ms=round(percentiles[49] * 1000, 3),
+                p95_ms=round(percentiles[94] * 1000, 3),
+                p99_ms=round(percentiles[98] * 1000, 3),
+                # The same requests on every run, the counts of different ones vary with their data
+                queries_per_request=await _queries_per_request(route, scale, random.Random(route.name), samples=5),
+            )
+            print(_format_result(route.name, results[route.name]), flush=True)
+    return results
+
+
+def _format_result(name: str, result: RouteResult) -> str:
+    return (
+        f'{name:<40}{result.requests_per_second:>10.0f}{result.p50_ms:>10.2f}{result.p95_ms:>10.2f}'
+        f'{result.p99_ms:>10.2f}{result.queries_per_request:>9.1f}{result.errors:>8}'
+    )
+
+
+def compare(results: dict[str, RouteResult], baseline: dict[str, ty.Any], tolerance: float) -> list[str]:
+    """Names of the routes slower than the baseline by more than `tolerance`: a relative increase of
+    their p95 latency or of their statements per request, or a relative decrease of their throughput."""
+    regressions = []
+    print(f'\n{"route":<40}{"req/s":>10}{"p95":>10}{"queries":>10}  vs baseline')
+    for name, result in results.items():
+        base = baseline['routes'].get(name)
+        if base is None:
+            continue
+        throughput = result.requests_per_second / base['requests_per_second'] - 1
+        p95 = result.p95_ms / base['p95_ms'] - 1
+        queries = result.queries_per_request - base['queries_per_request']
+        regressed = throughput < -tolerance or p95 > tolerance or queries > tolerance * base['queries_per_request']
+        print(f'{name:<40}{throughput:>+10.1%}{p95:>+10.1%}{queries:>+10.1f}  {"REGRESSION" if regressed else "ok"}')
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+# Setup ------------------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def database_url(database: str) -> Iterator[str]:
+    if database == 'sqlite':
+        with tempfile.TemporaryDirectory() as directory:
+            yield f'sqlite:///{directory}/suite.db'
+        return
+    from testcontainers.postgres import PostgresContainer  # Dev dependency, needs Docker
+
+    with PostgresContainer('postgres:16-alpine') as postgres:
+        yield postgres.get_connection_url()
+
+
+@contextlib.contextmanager
+def uvicorn_server(env: dict[str, str], workers: int) -> Iterator[str]:
+    """Run the app in a uvicorn subprocess, yielding its base URL once it accepts requests."""
+    port = _free_port()
+    command = [sys.executable, '-m', 'uvicorn', 'review_app.main:app', '--port', str(port)]
+    command += ['--workers', str(workers), '--log-level', 'warning']
+    server = subprocess.Popen(command, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            with contextlib.suppress(httpx.TransportError):
+                if httpx.get(f'{base_url}/status/pool').status_code == 200:
+                    break
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError('The uvicorn server did not start')
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main_(arguments: ty.Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', choices=['sqlite', 'postgres'], default='sqlite')
+    parser.add_argument('--async-driver', action='store_true', help='Run the app in async mode')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--media', type=int, default=1000)
+    parser.add_argument('--reviews', type=int, default=10_000)
+    parser.add_argument('--authors', type=int, default=100)
+    parser.add_argument('--media-types', type=int, default=5)
+    parser.add_argument(
+        '--skew', choices=[skew.value for skew in Skew], default='uniform', help='How the reviews spread over media'
+    )
+    parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per route')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers')
+    parser.add_argument('--routes', default='', help='Only run the routes containing this text')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random data and requests')
+    parser.add_argument('--save', help='Save the results as a JSON baseline to this path')
+    parser.add_argument('--compare', help='Compare the results against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative change allowed by --compare')
+    args = parser.parse_args(arguments)
+
+    scale = Scale(args.users, args.media, args.reviews, args.authors, args.media_types)
+    routes = [route for route in ROUTES if args.routes in route.name]
+    rng = random.Random(args.seed)
+    with database_url(args.database) as url:
+        seed_engine = create_engine(url)
+        start = time.perf_counter()
+        seed(seed_engine, scale, Skew(args.skew), args.seed)
+        seed_engine.dispose()
+        print(f'Seeded {scale} in {time.perf_counter() - start:.1f}s')
+
+        if args.async_driver:
+            driver = 'sqlite+aiosqlite' if args.database == 'sqlite' else 'postgresql+asyncpg'
+            url = make_url(url).set(drivername=driver).render_as_string(hide_password=False)
+        # The app of this process, used to count the statements, reads the same database
+        os.environ['DATABASE_URL'] = url
+        with uvicorn_server(dict(os.environ), args.workers) as base_url:
+            print(f'\n{"route":<40}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}{"errors":>8}')
+            results = asyncio.run(benchmark(base_url, routes, scale, rng, args.concurrency, args.requests))
+
+    report = {
+        'metadata': {
+            'database': args.database,
+            'async_driver': args.async_driver,
+            'scale': {name: value for name, value in asdict(scale).items() if name != 'reviewed_authors'},
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'workers': args.workers,
+            'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'routes': {name: asdict(result) for name, result in results.items()},
+    }
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} route(s) regressed: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_())
@@ -0,0 +1,38 @@
+"""media_rating_aggregates
+
+Revision ID: 3b8f2c61a4d7
+Revises: dfda689d9786
+Create Date: 2026-10-16 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f2c61a4d7'
+down_revision: Union[str, None] = 'dfda689d9786'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('media', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('media', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the aggregates from the existing reviews
+    media = sa.table('media', sa.column('id'), sa.column('rating_count'), sa.column('rating_sum'))
+    review = sa.table('review', sa.column('media_id'), sa.column('rating'))
+    media_reviews = sa.select().select_from(review).where(review.c.media_id == media.c.id)
+    op.execute(
+        media.update().values(
+            rating_count=media_reviews.add_columns(sa.func.count()).scalar_subquery(),
+            rating_sum=media_reviews.add_columns(sa.func.coalesce(sa.func.sum(review.c.rating), 0)).scalar_subquery(),
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('media', 'rating_sum')
+    op.drop_column('media', 'rating_count')
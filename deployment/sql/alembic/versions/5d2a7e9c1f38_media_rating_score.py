@@ -0,0 +1,58 @@
+"""media_rating_score
+
+Revision ID: 5d2a7e9c1f38
+Revises: 9c4e1f0b7a25
+Create Date: 2026-10-17 09:41:05.227361
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a7e9c1f38'
+down_revision: Union[str, None] = '9c4e1f0b7a25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Prior of the scores, as `review_app.database.models.RATING_PRIOR_MEAN` and `RATING_PRIOR_WEIGHT`
+# when the migration was written
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 10
+
+
+def upgrade() -> None:
+    op.add_column(
+        'media', sa.Column('rating_score', sa.Float(), server_default=str(RATING_PRIOR_MEAN), nullable=False)
+    )
+
+    # Backfill the scores from the rating aggregates
+    media = sa.table('media', sa.column('rating_count'), sa.column('rating_sum'), sa.column('rating_score'))
+    op.execute(
+        media.update().values(
+            rating_score=(media.c.rating_sum + RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT)
+            / sa.cast(media.c.rating_count + RATING_PRIOR_WEIGHT, sa.Float())
+        )
+    )
+
+    op.create_index(
+        'ix_media_rating_score',
+        'media',
+        [sa.text('rating_score DESC'), 'id'],
+        unique=False,
+        postgresql_include=['rating_count'],
+    )
+    op.create_index(
+        'ix_media_media_type_id_rating_score',
+        'media',
+        ['media_type_id', sa.text('rating_score DESC'), 'id'],
+        unique=False,
+        postgresql_include=['rating_count'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_media_type_id_rating_score', table_name='media')
+    op.drop_index('ix_media_rating_score', table_name='media')
+    op.drop_column('media', 'rating_score')
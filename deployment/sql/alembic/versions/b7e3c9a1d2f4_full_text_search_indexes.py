@@ -0,0 +1,61 @@
+"""full_text_search_indexes
+
+Revision ID: b7e3c9a1d2f4
+Revises: 5d2a7e9c1f38
+Create Date: 2026-10-17 14:12:37.508113
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from review_app.database.models import sqlite_search_statements
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c9a1d2f4'
+down_revision: Union[str, None] = '5d2a7e9c1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Columns searched, the SQLite full-text search of each one is an FTS5 table `<table>_search`
+SEARCHED_COLUMNS = [('media', 'title'), ('review', 'review')]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Inverted indexes of the full-text search, on the same expressions as the queries of the service
+        op.create_index(
+            'ix_media_title_search',
+            'media',
+            [sa.text("to_tsvector('english', title)")],
+            unique=False,
+            postgresql_using='gin',
+        )
+        op.create_index(
+            'ix_review_review_search',
+            'review',
+            [sa.text("to_tsvector('english', review)")],
+            unique=False,
+            postgresql_using='gin',
+        )
+    elif dialect == 'sqlite':
+        for table_name, column in SEARCHED_COLUMNS:
+            for statement in sqlite_search_statements(table_name, column):
+                op.execute(statement)
+            # Index the rows already there
+            op.execute(f"INSERT INTO {table_name}_search({table_name}_search) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_review_review_search', table_name='review')
+        op.drop_index('ix_media_title_search', table_name='media')
+    elif dialect == 'sqlite':
+        for table_name, _ in reversed(SEARCHED_COLUMNS):
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table_name}_search_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {table_name}_search')
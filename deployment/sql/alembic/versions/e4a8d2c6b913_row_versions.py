@@ -0,0 +1,51 @@
+"""row_versions
+
+Revision ID: e4a8d2c6b913
+Revises: b7e3c9a1d2f4
+Create Date: 2026-10-17 18:20:41.630518
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from review_app.database.models import sqlite_search_statements
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a8d2c6b913'
+down_revision: Union[str, None] = 'b7e3c9a1d2f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['user_account', 'media_type', 'author', 'media', 'review']
+
+
+def upgrade() -> None:
+    # Versions of the conditional requests, the existing rows start at their first version
+    columns = [
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    ]
+    if op.get_bind().dialect.name != 'sqlite':
+        for table in TABLES:
+            for column in columns:
+                op.add_column(table, column.copy())
+        return
+
+    # SQLite only adds columns with a constant default to tables with rows, they are recreated instead
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            for column in columns:
+                batch_op.add_column(column.copy())
+    # Along with the triggers of the full-text search
+    for table, column in [('media', 'title'), ('review', 'review')]:
+        for statement in sqlite_search_statements(table, column):
+            if statement.startswith('CREATE TRIGGER'):
+                op.execute(statement)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,381 @@
+"""Analytics of the review ratings, computed with NumPy.
+
+The `(media_id, user_id, rating)` columns of the reviews are read in chunks of `chunk_size` rows
+into NumPy arrays: on Postgres with psycopg2 from a binary COPY, parsed in place, elsewhere from a
+streamed query. Each chunk is only added to the histograms of the ratings of each group with
+`np.bincount`, so the memory depends on the number of groups and of distinct ratings, never on
+the number of reviews or on the values of the ids. The histograms of the authors and media types
+are sums of the ones of their media, and everything else is derived from the histograms, exactly:
+counts, means, variances and percentiles (nearest rank, the percentiles of integer ratings are ratings).
+
+`python -m review_app.analytics` exports them as CSV, see `--help`.
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import sys
+import threading
+import time
+import typing as ty
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import Connection, func, select
+
+import review_app.database.models as sqlm  # sqlm = sql models
+from review_app.database import database
+
+Group = ty.Literal['media', 'author', 'media_type', 'user']
+GROUPS: tuple[Group, ...] = ty.get_args(Group)
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0)
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Rows of a binary COPY of three int4 columns: the number of fields, then the length and the
+# big-endian value of each field. The columns are NOT NULL, so every row has this layout
+_COPY_ROW = np.dtype(
+    [
+        ('fields', '>i2'),
+        ('media_id_length', '>i4'),
+        ('media_id', '>i4'),
+        ('user_id_length', '>i4'),
+        ('user_id', '>i4'),
+        ('rating_length', '>i4'),
+        ('rating', '>i4'),
+    ]
+)
+_COPY_HEADER_LENGTH = 19
+_COPY_TRAILER_LENGTH = 2
+
+
+class ReviewChunk(ty.NamedTuple):
+    media_id: np.ndarray
+    user_id: np.ndarray
+    rating: np.ndarray
+
+
+@dataclass
+class RatingHistograms:
+    """Number of reviews of each group (rows) by rating (columns), for the groups with reviews."""
+
+    ids: np.ndarray  # Id of the group of each row, increasing
+    ratings: np.ndarray  # Rating of each column, increasing
+    counts: np.ndarray
+
+    def count(self) -> np.ndarray:
+        return self.counts.sum(axis=1)
+
+    def mean(self) -> np.ndarray:
+        return self.counts @ self.ratings / self.count()
+
+    def variance(self) -> np.ndarray:
+        """Population variance of the ratings of each group."""
+        deviations = self.ratings[np.newaxis, :] - self.mean()[:, np.newaxis]
+        return (self.counts * deviations**2).sum(axis=1) / self.count()
+
+    def percentiles(self, percentiles: Sequence[float]) -> np.ndarray:
+        """Nearest rank `percentiles` of each group (rows): the smallest rating reached by at least
+        that percentage of its reviews."""
+        _check_percentiles(percentiles)
+        percentiles = np.asarray(percentiles, dtype=np.float64)
+        cumulative = self.counts.cumsum(axis=1)
+        ranks = np.maximum(np.ceil(percentiles[np.newaxis, :] / 100 * self.count()[:, np.newaxis]), 1)
+        columns = (cumulative[:, np.newaxis, :] < ranks[:, :, np.newaxis]).sum(axis=2)
+        return self.ratings[columns]
+
+    def rows(self, selection: slice) -> 'RatingHistograms':
+        return RatingHistograms(self.ids[selection], self.ratings, self.counts[selection])
+
+    def sum_by(self, group_ids: np.ndarray) -> 'RatingHistograms':
+        """Histograms of the groups of the rows, `group_ids` holding the one of each row, with
+        negative ids for the rows in no group."""
+        in_group = group_ids >= 0
+        ids, rows = np.unique(group_ids[in_group], return_inverse=True)
+        counts = np.zeros((len(ids), len(self.ratings)), dtype=np.int64)
+        np.add.at(counts, rows, self.counts[in_group])
+        return RatingHistograms(ids, self.ratings, counts)
+
+
+def parse_percentiles(text: str) -> list[float]:
+    """Comma separated percentiles, e.g. `50,90,99`."""
+    percentiles = [float(percentile) for percentile in text.split(',')]
+    _check_percentiles(percentiles)
+    return percentiles
+
+
+def _check_percentiles(percentiles: Iterable[float]) -> None:
+    if not all(0 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError('Percentiles must be between 0 and 100')
+
+
+class _HistogramCounter:
+    """Histograms of the ratings added in chunks, by id. Only the ids seen have a row, kept sorted,
+    so however large or sparse the ids are the memory depends on their number. The columns grow to
+    the range of the ratings seen."""
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self.lowest_rating = 0
+        # Histograms of ids not in `ids` yet, merged into them once there are as many rows
+        self._pending: list[tuple[np.ndarray, np.ndarray]] = []
+        self._pending_rows = 0
+
+    def add(self, ids: np.ndarray, ratings: np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        self._widen(int(ratings.min()), int(ratings.max()))
+        # Histograms of the chunk by its own ids, then added to the rows of these ids
+        chunk_ids, rows = np.unique(ids, return_inverse=True)
+        width = self.counts.shape[1]
+        cells = rows.astype(np.int64) * width + (ratings - self.lowest_rating)
+        chunk_counts = np.bincount(cells, minlength=len(chunk_ids) * width).reshape(len(chunk_ids), width)
+        positions = np.searchsorted(self.ids, chunk_ids)
+        seen = positions < len(self.ids)
+        seen[seen] = self.ids[positions[seen]] == chunk_ids[seen]
+        self.counts[positions[seen]] += chunk_counts[seen]
+        self._pending.append((chunk_ids[~seen], chunk_counts[~seen]))
+        self._pending_rows += len(chunk_ids) - np.count_nonzero(seen)
+        if self._pending_rows >= len(self.ids):
+            self._merge()
+
+    def _merge(self) -> None:
+        if not self._pending:
+            return
+        ids = np.concatenate([ids for ids, _ in self._pending])
+        counts = np.concatenate([counts for _, counts in self._pending])
+        self._pending, self._pending_rows = [], 0
+        if len(ids) == 0:
+            return
+        # Sum the histograms of the same id from different chunks
+        order = np.argsort(ids, kind='stable')
+        ids, counts = ids[order], counts[order]
+        starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+        ids, counts = ids[starts], np.add.reduceat(counts, starts, axis=0)
+        positions = np.searchsorted(self.ids, ids)
+        self.ids = np.insert(self.ids, positions, ids)
+        self.counts = np.insert(self.counts, positions, counts, axis=0)
+
+    def _widen(self, lowest: int, highest: int) -> None:
+        width = self.counts.shape[1]
+        if width == 0:
+            self.lowest_rating = lowest
+        lowest = min(lowest, self.lowest_rating)
+        highest = max(highest, self.lowest_rating + width - 1)
+        before = self.lowest_rating - lowest
+        after = highest - lowest + 1 - width - before
+        if before or after:
+            self.counts = np.pad(self.counts, ((0, 0), (before, after)))
+            self._pending = [(ids, np.pad(counts, ((0, 0), (before, after)))) for ids, counts in self._pending]
+            self.lowest_rating = lowest
+
+    def histograms(self) -> RatingHistograms:
+        self._merge()
+        ratings = self.lowest_rating + np.arange(self.counts.shape[1])
+        return RatingHistograms(self.ids, ratings, self.counts)
+
+
+def read_reviews(
+    connection: Connection, consume: ty.Callable[[ReviewChunk], None], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> None:
+    """Pass the columns of every review to `consume`, in chunks of up to `chunk_size` rows."""
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        review = sqlm.Review.__table__
+        reader = _CopyReader(consume, chunk_size)
+        with connection.connection.driver_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY (SELECT media_id, user_id, rating FROM {review.name}) TO STDOUT (FORMAT binary)', reader
+            )
+        reader.close()
+        return
+    statement = select(sqlm.Review.media_id, sqlm.Review.user_id, sqlm.Review.rating)
+    result = connection.execution_options(yield_per=chunk_size).execute(statement)
+    for rows in result.partitions():
+        values = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows))
+        consume(ReviewChunk(*values.reshape(-1, 3).T))
+
+
+class _CopyReader:
+    """File receiving a binary COPY of the reviews, passing its rows to `consume` by chunks of
+    `chunk_size`. The COPY writes every row on its own, they are only joined by chunk."""
+
+    def __init__(self, consume: ty.Callable[[ReviewChunk], None], chunk_size: int):
+        self.consume = consume
+        self.chunk_size = chunk_size
+        self.pieces: list[bytes] = []
+        self.size = 0
+        self.header_read = False
+
+    def write(self, data: bytes) -> None:
+        self.pieces.append(data)
+        self.size += len(data)
+        if not self.header_read:
+            self._read_header()
+        if self.header_read and self.size >= self.chunk_size * _COPY_ROW.itemsize:
+            self._parse(self.chunk_size)
+
+    def close(self) -> None:
+        self._parse((self.size - _COPY_TRAILER_LENGTH) // _COPY_ROW.itemsize)
+
+    def _read_header(self) -> None:
+        data = b''.join(self.pieces)
+        self.pieces = [data]
+        if len(data) < _COPY_HEADER_LENGTH:
+            return
+        # Signature, flags, then the length of the header extension
+        extension_length = int.from_bytes(data[_COPY_HEADER_LENGTH - 4 : _COPY_HEADER_LENGTH], 'big')
+        if len(data) >= _COPY_HEADER_LENGTH + extension_length:
+            self._keep(data[_COPY_HEADER_LENGTH + extension_length :])
+            self.header_read = True
+
+    def _parse(self, n_rows: int) -> None:
+        data = b''.join(self.pieces)
+        rows = np.frombuffer(data, dtype=_COPY_ROW, count=n_rows)
+        self._keep(data[n_rows * _COPY_ROW.itemsize :])
+        if n_rows:
+            self.consume(ReviewChunk(*(rows[name].astype(np.int64) for name in ReviewChunk._fields)))
+
+    def _keep(self, data: bytes) -> None:
+        self.pieces, self.size = [data], len(data)
+
+
+def load_rating_histograms(
+    connection: Connection, groups: Iterable[Group] = GROUPS, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> dict[Group, RatingHistograms]:
+    """Histograms of the ratings of each of `groups`, in a single pass over the reviews."""
+    groups = list(dict.fromkeys(groups))
+    by_media, by_user = _HistogramCounter(), _HistogramCounter()
+    count_users = 'user' in groups
+    count_media = any(group != 'user' for group in groups)
+
+    def consume(chunk: ReviewChunk) -> None:
+        if count_media:
+            by_media.add(chunk.media_id, chunk.rating)
+        if count_users:
+            by_user.add(chunk.user_id, chunk.rating)
+
+    read_reviews(connection, consume, chunk_size)
+    histograms: dict[Group, RatingHistograms] = {}
+    media = by_media.histograms()
+    if {'author', 'media_type'} & set(groups):
+        # The media are read after the reviews, so every media reviewed is there
+        statement = select(sqlm.Media.id, func.coalesce(sqlm.Media.author_id, -1), sqlm.Media.media_type_id)
+        values = np.fromiter(itertools.chain.from_iterable(connection.execute(statement)), dtype=np.int64)
+        values = values.reshape(-1, 3)
+        values = values[np.argsort(values[:, 0])]
+        positions = np.searchsorted(values[:, 0], media.ids)
+        if 'author' in groups:
+            histograms['author'] = media.sum_by(values[positions, 1])
+        if 'media_type' in groups:
+            histograms['media_type'] = media.sum_by(values[positions, 2])
+    if 'media' in groups:
+        histograms['media'] = media
+    if count_users:
+        histograms['user'] = by_user.histograms()
+    return {group: histograms[group] for group in groups}
+
+
+class HistogramsMemo:
+    """Histograms of each group loaded in the last `ttl` seconds, kept by the process. The pages of the
+    analytics of a group are sliced from the same arrays instead of reading all the reviews again,
+    and are up to `ttl` behind them."""
+
+    def __init__(self, ttl: float = 60, timer: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._timer = timer
+        self._histograms: dict[Group, tuple[float, RatingHistograms]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, group: Group, loader: Callable[[], RatingHistograms]) -> RatingHistograms:
+        """The histograms of `group`, loaded by `loader` when they are missing or expired. The loads
+        are not serialized, the identical requests made at the same time are coalesced by the service."""
+        with self._lock:
+            expires_at, histograms = self._histograms.get(group, (0.0, None))
+        if histograms is not None and expires_at > self._timer():
+            return histograms
+        histograms = loader()
+        with self._lock:
+            self._histograms[group] = (self._timer() + self.ttl, histograms)
+        return histograms
+
+
+default_memo = HistogramsMemo(ttl=float(os.getenv('ANALYTICS_TTL', '60')))
+
+
+def write_csv(histograms: dict[Group, RatingHistograms], percentiles: Sequence[float], file: ty.TextIO) -> None:
+    """One line per group with reviews: its count, mean, variance, percentiles and histogram."""
+    if not histograms:
+        return
+    # Every group counts every review, so they all have the same ratings
+    ratings = next(iter(histograms.values())).ratings.tolist()
+    writer = csv.writer(file)
+    writer.writerow(
+        [
+            'group',
+            'id',
+            'count',
+            'mean',
+            'variance',
+            *(f'p{percentile:g}' for percentile in percentiles),
+            *(f'rating_{rating}' for rating in ratings),
+        ]
+    )
+    for group, group_histograms in histograms.items():
+        columns = zip(
+            group_histograms.ids.tolist(),
+            group_histograms.count().tolist(),
+            group_histograms.mean().tolist(),
+            group_histograms.variance().tolist(),
+            group_histograms.percentiles(percentiles).tolist(),
+            group_histograms.counts.tolist(),
+            strict=True,
+        )
+        writer.writerows(
+            [group, *values, *group_percentiles, *counts] for *values, group_percentiles, counts in columns
+        )
+
+
+def _load(groups: Sequence[Group], chunk_size: int) -> dict[Group, RatingHistograms]:
+    if database.ASYNC_MODE:
+
+        async def load() -> dict[Group, RatingHistograms]:
+            async with database.AsyncSessionLocal() as session:
+                return await session.run_sync(
+                    lambda sync_session: load_rating_histograms(sync_session.connection(), groups, chunk_size)
+                )
+
+        return asyncio.run(load())
+    with database.SessionLocal() as session:
+        return load_rating_histograms(session.connection(), groups, chunk_size)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Export the rating analytics of the database at DATABASE_URL as CSV.')
+    parser.add_argument('--group', choices=GROUPS, action='append', help='Group to export, repeatable (default: all)')
+    parser.add_argument(
+        '--percentiles',
+        default=','.join(f'{percentile:g}' for percentile in DEFAULT_PERCENTILES),
+        help='Comma separated percentiles, between 0 and 100',
+    )
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Reviews read at once')
+    parser.add_argument('--output', default='-', help='CSV file to write (default: the standard output)')
+    args = parser.parse_args(argv)
+    try:
+        percentiles = parse_percentiles(args.percentiles)
+    except ValueError:
+        parser.error('--percentiles must be comma separated numbers between 0 and 100')
+
+    histograms = _load(args.group or GROUPS, args.chunk_size)
+    if args.output == '-':
+        write_csv(histograms, percentiles, sys.stdout)
+        return
+    with open(args.output, 'w', newline='') as file:
+        write_csv(histograms, percentiles, file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Read-through cache for the lookups of the database service.
+
+The backend is chosen with the CACHE_BACKEND environment variable:
+* `memory` (default): In-process LRU cache with a TTL.
+* `redis`: Any Redis compatible server at REDIS_URL, shared by every worker. Needs the `redis` package.
+* `none`: Disables the cache.
+"""
+
+import abc
+import os
+import threading
+import time
+import typing as ty
+from collections import OrderedDict
+from collections.abc import Callable
+
+import pydantic
+
+T = ty.TypeVar('T', bound=pydantic.BaseModel)
+
+
+class Cache(abc.ABC):
+    """Cache of pydantic models by key, counting its hits and misses."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def get(self, key: str, model: type[T]) -> T | None:
+        """Get the value stored under `key`, as an instance of `model`, or None if there is none."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: pydantic.BaseModel) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def get_or_load(self, key: str, model: type[T], loader: Callable[[], T]) -> T:
+        """Get the value stored under `key`, loading and storing it on a miss. Errors raised by
+        `loader` are propagated and nothing is stored."""
+        value = self.get(key, model)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        self.set(key, value)
+        return value
+
+
+class LRUCache(Cache):
+    """In-process cache holding up to `maxsize` values, each of them for `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, timer: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._values: OrderedDict[str, tuple[float, pydantic.BaseModel]] = OrderedDict()
+
+    def get(self, key: str, model: type[T]) -> T | None:
+        with self._lock:
+            try:
+                expires_at, value = self._values[key]
+            except KeyError:
+                return None
+            if expires_at <= self._timer():
+                del self._values[key]
+                return None
+            self._values.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: pydantic.BaseModel) -> None:
+        with self._lock:
+            self._values[key] = (self._timer() + self.ttl, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class RedisCache(Cache):
+    """Cache stored in a Redis compatible server, values are kept as JSON for `ttl` seconds.
+
+    `client` is a synchronous `redis.Redis` or any object with the same `get`, `set` and
+    `delete` methods.
+    """
+
+    def __init__(self, client: ty.Any, ttl: float = 60, prefix: str = 'review_app:'):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str, model: type[T]) -> T | None:
+        raw_value = self.client.get(self.prefix + key)
+        return None if raw_value is None else model.model_validate_json(raw_value)
+
+    def set(self, key: str, value: pydantic.BaseModel) -> None:
+        self.client.set(self.prefix + key, value.model_dump_json(), px=int(self.ttl * 1000))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+
+def create_cache() -> Cache | None:
+    """Create the cache configured through the environment."""
+    backend = os.getenv('CACHE_BACKEND', 'memory')
+    ttl = float(os.getenv('CACHE_TTL', '60'))
+    if backend == 'memory':
+        return LRUCache(maxsize=int(os.getenv('CACHE_MAXSIZE', '1024')), ttl=ttl)
+    if backend == 'redis':
+        import redis  # Optional dependency, only needed for this backend
+
+        return RedisCache(redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')), ttl=ttl)
+    if backend == 'none':
+        return None
+    raise ValueError(f'Unknown cache backend {backend!r}')
+
+
+default_cache = create_cache()
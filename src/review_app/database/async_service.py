@@ -0,0 +1,151 @@
+import functools
+import typing as ty
+from collections.abc import AsyncIterator, Callable, Coroutine
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import review_app.database.models as sqlm  # sqlm = sql models
+import review_app.schemas as pm  # pm = pydantic models
+from review_app import analytics
+from review_app.cache import Cache, default_cache
+from review_app.database import database
+from review_app.database.service import DatabaseService, NotFoundError, _review_from_row, coalesce_key
+from review_app.singleflight import AsyncSingleFlight, default_async_flights
+
+P = ty.ParamSpec('P')
+R = ty.TypeVar('R')
+
+
+def _delegate(
+    method: Callable[ty.Concatenate[DatabaseService, P], R],
+) -> Callable[ty.Concatenate['AsyncDatabaseService', P], Coroutine[ty.Any, ty.Any, R]]:
+    """Build the coroutine version of a `DatabaseService` method.
+
+    The sync method runs through `AsyncSession.run_sync`, which drives the async driver from
+    the sync ORM code without blocking the event loop, so both services share their queries.
+    """
+
+    @functools.wraps(method)
+    async def async_method(self: 'AsyncDatabaseService', *args: P.args, **kwargs: P.kwargs) -> R:
+        return await self.session.run_sync(
+            lambda session: method(
+                DatabaseService(session, cache=self.cache, histograms_memo=self.histograms_memo), *args, **kwargs
+            )
+        )
+
+    return async_method
+
+
+def _coalesced(
+    method: Callable[ty.Concatenate['AsyncDatabaseService', P], Coroutine[ty.Any, ty.Any, R]],
+) -> Callable[ty.Concatenate['AsyncDatabaseService', P], Coroutine[ty.Any, ty.Any, R]]:
+    """Share the result of a read with the identical calls made while it runs, see `review_app.singleflight`.
+
+    The shared read runs on a session of its own: the callers waiting for it may outlive the one
+    starting it, e.g. when its client goes away, and with it the session of its request.
+    """
+
+    @functools.wraps(method)
+    async def coalesced(self: 'AsyncDatabaseService', *args: P.args, **kwargs: P.kwargs) -> R:
+        if self.flights is None:
+            return await method(self, *args, **kwargs)
+
+        async def read() -> R:
+            async with self.session_factory() as session:
+                service = AsyncDatabaseService(session, cache=self.cache, histograms_memo=self.histograms_memo)
+                return await method(service, *args, **kwargs)
+
+        return await self.flights.do(coalesce_key(method.__name__, *args, **kwargs), read)
+
+    return coalesced
+
+
+class AsyncDatabaseService:
+    """Asyncio version of `DatabaseService`, used when the app runs in async mode."""
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        cache: Cache | None = None,
+        flights: AsyncSingleFlight | None = None,
+        session_factory: Callable[[], AsyncSession] | None = None,
+        histograms_memo: analytics.HistogramsMemo | None = None,
+    ):
+        self.session = session
+        self.cache = cache
+        # The sync methods delegated to run without flights, the reads are coalesced across tasks here
+        self.flights = flights
+        # Sessions of the coalesced reads, new sessions bound like `session` by default
+        self.session_factory = session_factory or functools.partial(AsyncSession, session.bind)
+        self.histograms_memo = histograms_memo
+
+    @staticmethod
+    async def create_database_service() -> AsyncIterator['AsyncDatabaseService']:
+        """Dependency that provides a service with its own session, which is always closed (returning
+        its connection to the pool) once the request is done."""
+        async with database.AsyncSessionLocal() as session:
+            yield AsyncDatabaseService(
+                session,
+                cache=default_cache,
+                flights=default_async_flights,
+                session_factory=database.AsyncSessionLocal,
+                histograms_memo=analytics.default_memo,
+            )
+
+    # User -----------------------------------------------------------------------
+    create_user = _delegate(DatabaseService.create_user)
+    bulk_create_users = _delegate(DatabaseService.bulk_create_users)
+    get_user = _coalesced(_delegate(DatabaseService.get_user))
+    get_user_many = _coalesced(_delegate(DatabaseService.get_user_many))
+    get_user_reviews = _coalesced(_delegate(DatabaseService.get_user_reviews))
+
+    async def stream_user_reviews(
+        self, user_id: int, after: int | None = None, chunk_size: int = 500
+    ) -> AsyncIterator[pm.Review]:
+        """Async version of `DatabaseService.stream_user_reviews`, the existence of the user is checked
+        when awaiting and the reviews are fetched while iterating the returned async iterator."""
+        if await self.session.get(sqlm.User, user_id) is None:
+            raise NotFoundError(f'User with id {user_id} not found')
+        statement = DatabaseService._user_reviews_statement(user_id=user_id, after=after)
+        return self._iterate_reviews(statement.execution_options(yield_per=chunk_size))
+
+    async def _iterate_reviews(self, statement: Select[ty.Any]) -> AsyncIterator[pm.Review]:
+        async for row in await self.session.stream(statement):
+            yield _review_from_row(row)
+
+    # Review ---------------------------------------------------------------------
+    create_review = _delegate(DatabaseService.create_review)
+    bulk_create_reviews = _delegate(DatabaseService.bulk_create_reviews)
+    bulk_write_reviews = _delegate(DatabaseService.bulk_write_reviews)
+    get_review = _coalesced(_delegate(DatabaseService.get_review))
+    get_review_many = _coalesced(_delegate(DatabaseService.get_review_many))
+    search_reviews = _coalesced(_delegate(DatabaseService.search_reviews))
+
+    # Media ----------------------------------------------------------------------
+    create_media = _delegate(DatabaseService.create_media)
+    bulk_create_media = _delegate(DatabaseService.bulk_create_media)
+    get_media = _coalesced(_delegate(DatabaseService.get_media))
+    get_media_version = _coalesced(_delegate(DatabaseService.get_media_version))
+    get_media_many = _coalesced(_delegate(DatabaseService.get_media_many))
+    search_media = _coalesced(_delegate(DatabaseService.search_media))
+    get_top_rated_media = _coalesced(_delegate(DatabaseService.get_top_rated_media))
+
+    # MediaType ------------------------------------------------------------------
+    create_media_type = _delegate(DatabaseService.create_media_type)
+    get_media_type = _coalesced(_delegate(DatabaseService.get_media_type))
+    get_media_type_by_name = _coalesced(_delegate(DatabaseService.get_media_type_by_name))
+
+    # Author ---------------------------------------------------------------------
+    create_author = _delegate(DatabaseService.create_author)
+    get_author = _coalesced(_delegate(DatabaseService.get_author))
+    get_author_version = _coalesced(_delegate(DatabaseService.get_author_version))
+    get_author_many = _coalesced(_delegate(DatabaseService.get_author_many))
+    get_author_stats = _coalesced(_delegate(DatabaseService.get_author_stats))
+    get_author_highest_rated_media = _coalesced(_delegate(DatabaseService.get_author_highest_rated_media))
+    get_author_highest_rated_media_version = _coalesced(
+        _delegate(DatabaseService.get_author_highest_rated_media_version)
+    )
+
+    # Analytics ------------------------------------------------------------------
+    get_rating_analytics = _coalesced(_delegate(DatabaseService.get_rating_analytics))
@@ -1,17 +1,126 @@
+import itertools
 import os
+import threading
+import typing as ty
+from collections.abc import Sequence
+from contextvars import ContextVar
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 
 from . import models
 
 SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./test.db')
+# Connection pool configuration, defaults are the ones of sqlalchemy's QueuePool
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '10'))
+DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', '-1'))  # Seconds, -1 means never
+DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+# Optional read replicas, comma separated URLs using the same driver as DATABASE_URL
+DATABASE_READ_URLS = [url.strip() for url in os.getenv('DATABASE_READ_URLS', '').split(',') if url.strip()]
+DATABASE_READ_STRATEGY = os.getenv('DATABASE_READ_STRATEGY', 'round_robin')  # or least_connections
+DATABASE_STICKY_SECONDS = int(os.getenv('DATABASE_STICKY_SECONDS', '5'))  # Reads from primary after a write
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,  # connect_args={"check_same_thread": False}
-)
+_ENGINE_OPTIONS = {
+    'pool_size': DATABASE_POOL_SIZE,
+    'max_overflow': DATABASE_MAX_OVERFLOW,
+    'pool_recycle': DATABASE_POOL_RECYCLE,
+    'pool_pre_ping': DATABASE_POOL_PRE_PING,
+}
+
+# The app runs in async mode when DATABASE_URL uses an asyncio driver, like postgresql+asyncpg
+# or sqlite+aiosqlite. In that case `engine` is the sync facade of the async engine, which is
+# still the one to use for events and pool inspection.
+ASYNC_MODE = make_url(SQLALCHEMY_DATABASE_URL).get_dialect().is_async
+
+if ASYNC_MODE:
+    async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **_ENGINE_OPTIONS)
+    engine = async_engine.sync_engine
+    read_engines = [create_async_engine(url, **_ENGINE_OPTIONS).sync_engine for url in DATABASE_READ_URLS]
+else:
+    async_engine = None
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,  # connect_args={"check_same_thread": False}
+        **_ENGINE_OPTIONS,
+    )
+    read_engines = [create_engine(url, **_ENGINE_OPTIONS) for url in DATABASE_READ_URLS]
 # Create all tables in the database, used for testing locally
 if 'sqlite' in SQLALCHEMY_DATABASE_URL:
-    models.Base.metadata.create_all(bind=engine)
+    sqlite_url = make_url(SQLALCHEMY_DATABASE_URL).set(drivername='sqlite')
+    models.Base.metadata.create_all(bind=create_engine(sqlite_url) if ASYNC_MODE else engine)
+
+# Set while handling the requests of a client that wrote recently, see `RoutingSession`
+read_from_primary: ContextVar[bool] = ContextVar('read_from_primary', default=False)
+
+
+class ReplicaPool:
+    """Read replica engines, one of them is picked for the reads of each session with `strategy`:
+    * `round_robin`: Every replica in turn.
+    * `least_connections`: The replica with the fewest connections checked out of its pool.
+    """
+
+    STRATEGIES = ('round_robin', 'least_connections')
+
+    def __init__(self, engines: Sequence[Engine], strategy: str = 'round_robin'):
+        if not engines:
+            raise ValueError('A replica pool needs at least one engine')
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Unknown read strategy {strategy!r}')
+        self.engines = list(engines)
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(self.engines)
+
+    def pick(self) -> Engine:
+        if self.strategy == 'least_connections':
+            return min(self.engines, key=lambda engine: engine.pool.checkedout())
+        with self._lock:
+            return next(self._cycle)
+
+
+class RoutingSession(Session):
+    """Session sending its reads to one of `replicas` and everything else to the primary `bind`.
+
+    Once the session writes, every following statement goes to the primary too, so the service
+    methods returning what they just created never hit the replication lag. The same happens
+    for the whole session when `read_from_primary` is set.
+    """
+
+    def __init__(self, *args: ty.Any, replicas: ReplicaPool | None = None, **kwargs: ty.Any):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self._replica: Engine | None = None
+        self._wrote = False
+
+    def get_bind(self, mapper: ty.Any = None, clause: ty.Any = None, **kwargs: ty.Any) -> ty.Any:
+        if self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+            self._wrote = True
+        if self.replicas is None or self._wrote or read_from_primary.get():
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        if self._replica is None:
+            self._replica = self.replicas.pick()
+        return self._replica
+
+
+replica_pool = ReplicaPool(read_engines, DATABASE_READ_STRATEGY) if read_engines else None
+
+SessionLocal = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, replicas=replica_pool
+)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, sync_session_class=RoutingSession, replicas=replica_pool)
+    if ASYNC_MODE
+    else None
+)
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_status(engine: Engine = engine) -> dict[str, int]:
+    """Snapshot of the connection pool of an engine."""
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
@@ -1,14 +1,52 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, List, Optional
 
-from sqlalchemy import ForeignKey, String
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import DDL, ColumnElement, DateTime, ForeignKey, Index, String, Table, event, func, literal_column, text
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column, relationship
+
+# Prior of the Bayesian average ranking the media: their ratings are blended with
+# RATING_PRIOR_WEIGHT ratings of RATING_PRIOR_MEAN, so a couple of reviews can't top the rankings.
+# The scores are stored, changing these needs them recomputed with `rating_score`.
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 10
+
+
+def rating_score(rating_count: Any, rating_sum: Any) -> Any:
+    """Bayesian average of `rating_count` ratings adding up to `rating_sum`, computed in Python or
+    as a SQL expression when given columns."""
+    return (rating_sum + RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT) / (rating_count + RATING_PRIOR_WEIGHT)
+
+
+# Text search configuration of the Postgres full-text search, the one of its GIN indexes
+SEARCH_CONFIG = 'english'
+
+
+def search_vector(column: Any) -> ColumnElement[Any]:
+    """`tsvector` of a text column, the expression of its Postgres search index."""
+    return func.to_tsvector(literal_column(f"'{SEARCH_CONFIG}'"), column)
 
 
 class Base(DeclarativeBase):
     pass
 
 
-class User(Base):
+class Versioned:
+    """Version of the rows, for the conditional requests. `version` is the version counter of
+    SQLAlchemy, incremented by every update of the row through the ORM (which also fails when the
+    row changed since it was loaded), and `updated_at` the time of its last update."""
+
+    version: Mapped[int] = mapped_column(server_default='1')
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {'version_id_col': cls.version}
+
+
+class User(Versioned, Base):
     __tablename__ = 'user_account'
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(30))
@@ -20,16 +58,16 @@ class User(Base):
         return f'User(id={self.id!r}, name={self.name!r}, age={self.age!r})'
 
 
-class MediaType(Base):
+class MediaType(Versioned, Base):
     __tablename__ = 'media_type'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(30))
+    name: Mapped[str] = mapped_column(String(30), index=True)
 
     def __repr__(self) -> str:
         return f'MediaType(id={self.id!r}, name={self.name!r})'
 
 
-class Author(Base):
+class Author(Versioned, Base):
     __tablename__ = 'author'
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(150))
@@ -41,26 +79,62 @@ class Author(Base):
         return f'Author(id={self.id!r}, name={self.name!r}, alive={self.alive!r})'
 
 
-class Media(Base):
+class Media(Versioned, Base):
     __tablename__ = 'media'
+    __table_args__ = (
+        # Rankings of the media by score, overall and per media type, filtering on the count from the index
+        Index('ix_media_rating_score', text('rating_score DESC'), 'id', postgresql_include=['rating_count']),
+        Index(
+            'ix_media_media_type_id_rating_score',
+            'media_type_id',
+            text('rating_score DESC'),
+            'id',
+            postgresql_include=['rating_count'],
+        ),
+        # Full-text search of the titles, see `sqlite_search_index` for SQLite
+        Index('ix_media_title_search', text(f"to_tsvector('{SEARCH_CONFIG}', title)"), postgresql_using='gin').ddl_if(
+            dialect='postgresql'
+        ),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(150))
-    media_type_id: Mapped[int] = mapped_column(ForeignKey('media_type.id'))
-    author_id: Mapped[Optional[int]] = mapped_column(ForeignKey('author.id'))
+    media_type_id: Mapped[int] = mapped_column(ForeignKey('media_type.id'), index=True)
+    author_id: Mapped[Optional[int]] = mapped_column(ForeignKey('author.id'), index=True)
+    # Aggregates of the ratings of the reviews of the media, kept up to date when creating reviews
+    rating_count: Mapped[int] = mapped_column(default=0, server_default='0')
+    rating_sum: Mapped[int] = mapped_column(default=0, server_default='0')
+    # `rating_score` of the aggregates, the key of the rankings
+    rating_score: Mapped[float] = mapped_column(default=RATING_PRIOR_MEAN, server_default=str(RATING_PRIOR_MEAN))
 
     media_type: Mapped['MediaType'] = relationship()
     author: Mapped[Optional['Author']] = relationship(back_populates='works')
     reviews: Mapped[List['Review']] = relationship(back_populates='media')
 
+    @hybrid_property
+    def rating_average(self) -> Optional[float]:
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    @rating_average.inplace.expression
+    @classmethod
+    def _rating_average_expression(cls) -> ColumnElement[float]:
+        return cls.rating_sum / cls.rating_count
+
     def __repr__(self) -> str:
-        return (
-            f'Media(id={self.id!r}, title={self.title!r},'
-            f'media_type={self.media_type!r}, author={self.author!r})'
-        )
+        return f'Media(id={self.id!r}, title={self.title!r},' f'media_type={self.media_type!r}, author={self.author!r})'
 
 
-class Review(Base):
+class Review(Versioned, Base):
     __tablename__ = 'review'
+    __table_args__ = (
+        # Reviews of a user, also covers the keyset pagination on (user_id, id)
+        Index('ix_review_user_id_id', 'user_id', 'id'),
+        # Reviews of a media, with their ratings available from the index alone
+        Index('ix_review_media_id_rating', 'media_id', 'rating'),
+        # Full-text search of the reviews, see `sqlite_search_index` for SQLite
+        Index(
+            'ix_review_review_search', text(f"to_tsvector('{SEARCH_CONFIG}', review)"), postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     media_id: Mapped[int] = mapped_column(ForeignKey('media.id'))
     user_id: Mapped[int] = mapped_column(ForeignKey('user_account.id'))
@@ -75,3 +149,32 @@ class Review(Base):
             f'Review(id={self.id!r}, media={self.media!r}, '
             f'user={self.user!r}, rating={self.rating!r}, review={self.review!r})'
         )
+
+
+def sqlite_search_statements(table_name: str, column: str) -> list[str]:
+    """DDL of the full-text search of `column` on SQLite: an FTS5 table `<table_name>_search` indexing
+    it, with the rowids of the table, kept current by triggers on its writes. Also run by the migration
+    adding the search indexes, which then fills the FTS5 table with the rows already there."""
+    search = f'{table_name}_search'
+    return [
+        f"CREATE VIRTUAL TABLE {search} USING fts5({column}, content='{table_name}', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        f'CREATE TRIGGER {search}_insert AFTER INSERT ON {table_name} BEGIN '
+        f'INSERT INTO {search}(rowid, {column}) VALUES (new.id, new.{column}); END',
+        f'CREATE TRIGGER {search}_delete AFTER DELETE ON {table_name} BEGIN '
+        f"INSERT INTO {search}({search}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f'CREATE TRIGGER {search}_update AFTER UPDATE OF {column} ON {table_name} BEGIN '
+        f"INSERT INTO {search}({search}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f'INSERT INTO {search}(rowid, {column}) VALUES (new.id, new.{column}); END',
+    ]
+
+
+def sqlite_search_index(table: Table, column: str) -> None:
+    """Full-text search of `column` on SQLite, created along with `table`, see `sqlite_search_statements`."""
+    for statement in sqlite_search_statements(table.name, column):
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(table, 'after_drop', DDL(f'DROP TABLE IF EXISTS {table.name}_search').execute_if(dialect='sqlite'))
+
+
+sqlite_search_index(Media.__table__, 'title')
+sqlite_search_index(Review.__table__, 'review')
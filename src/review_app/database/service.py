@@ -1,24 +1,305 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
+import functools
+import os
+import re
+import typing as ty
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import datetime
+
+import pydantic
+from sqlalchemy import (
+    Float,
+    Integer,
+    Row,
+    Select,
+    Subquery,
+    bindparam,
+    cast,
+    column,
+    event,
+    func,
+    insert,
+    literal_column,
+    select,
+    table,
+    update,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.interfaces import ORMOption
 
 import review_app.database.models as sqlm  # sqlm = sql models
 import review_app.schemas as pm  # pm = pydantic models
+from review_app import analytics
+from review_app.cache import Cache, default_cache
 from review_app.database import database
+from review_app.singleflight import SingleFlight, default_async_flights, default_flights, make_key
+
+M = ty.TypeVar('M', bound=sqlm.Base)
+T = ty.TypeVar('T', bound=pydantic.BaseModel)
+R = ty.TypeVar('R', bound=pydantic.BaseModel)
+P = ty.ParamSpec('P')
+V = ty.TypeVar('V')
 
 
 class NotFoundError(Exception):
     pass
 
 
+# Loader strategies matching the nested shape of the pydantic response models, so that
+# model_validate never triggers a lazy load. All the relationships involved are
+# many-to-one, so a joined load adds no duplicated rows and keeps every read at a single
+# statement regardless of the number of rows returned.
+_MEDIA_LOAD_OPTIONS = (
+    joinedload(sqlm.Media.media_type),
+    joinedload(sqlm.Media.author),
+)
+_REVIEW_LOAD_OPTIONS = (
+    joinedload(sqlm.Review.media).joinedload(sqlm.Media.media_type),
+    joinedload(sqlm.Review.media).joinedload(sqlm.Media.author),
+    joinedload(sqlm.Review.user),
+)
+
+# Fast path of the review reads: only the columns of the nested `pm.Review` response model,
+# selected as plain rows in a single statement, so no ORM object is ever materialized.
+_REVIEW_ROWS_STATEMENT = (
+    select(
+        sqlm.Review.id,
+        sqlm.Review.media_id,
+        sqlm.Review.user_id,
+        sqlm.Review.rating,
+        sqlm.Review.review,
+        sqlm.Media.title.label('media_title'),
+        sqlm.Media.media_type_id,
+        sqlm.Media.author_id,
+        sqlm.MediaType.name.label('media_type_name'),
+        sqlm.Author.name.label('author_name'),
+        sqlm.Author.alive.label('author_alive'),
+        sqlm.User.name.label('user_name'),
+        sqlm.User.age.label('user_age'),
+    )
+    .join(sqlm.Review.media)
+    .join(sqlm.Media.media_type)
+    .outerjoin(sqlm.Media.author)
+    .join(sqlm.Review.user)
+)
+
+
+class Version(ty.NamedTuple):
+    """Validators of a response for the conditional requests. `etag`, a quoted strong entity tag,
+    changes whenever the response does, `last_modified` is None when it may go back in time."""
+
+    etag: str
+    last_modified: datetime | None
+
+
+# Versions of the rows of the nested `pm.Media` response model: a lookup of their keys, which
+# loads neither the relationships nor the other columns
+_MEDIA_VERSION_STATEMENT = (
+    select(
+        sqlm.Media.id,
+        sqlm.Media.version,
+        sqlm.MediaType.version,
+        sqlm.Author.version,
+        sqlm.Media.updated_at,
+        sqlm.MediaType.updated_at,
+        sqlm.Author.updated_at,
+    )
+    .join(sqlm.Media.media_type)
+    .outerjoin(sqlm.Media.author)
+)
+
+
+def _media_version(row: Row[ty.Any]) -> Version:
+    """Version of the media of a row of `_MEDIA_VERSION_STATEMENT`, the media has no author when its
+    version is None."""
+    media_id, media_version, media_type_version, author_version, *updated_at = row
+    etag = f'"{media_id}.{media_version}.{media_type_version}.{author_version or 0}"'
+    return Version(etag, max(time for time in updated_at if time is not None))
+
+
+def _review_from_row(row: Row[ty.Any]) -> pm.Review:
+    """Build a review from a row of `_REVIEW_ROWS_STATEMENT`, validating the nested dict at once."""
+    author = (
+        None if row.author_id is None else {'id': row.author_id, 'name': row.author_name, 'alive': row.author_alive}
+    )
+    return pm.Review.model_validate(
+        {
+            'id': row.id,
+            'media_id': row.media_id,
+            'user_id': row.user_id,
+            'rating': row.rating,
+            'review': row.review,
+            'media': {
+                'id': row.media_id,
+                'title': row.media_title,
+                'media_type_id': row.media_type_id,
+                'author_id': row.author_id,
+                'media_type': {'id': row.media_type_id, 'name': row.media_type_name},
+                'author': author,
+            },
+            'user': {'id': row.user_id, 'name': row.user_name, 'age': row.user_age},
+        }
+    )
+
+
+# Ratings counted by the histograms of the author stats
+RATINGS = range(1, 6)
+
+# Cache the author stats, invalidated by the writes of the reviews and media of the author. Off by
+# default: unlike the other cached lookups they change with every review, and a memory cache is only
+# invalidated by the writes of its own worker
+AUTHOR_STATS_CACHE = os.getenv('AUTHOR_STATS_CACHE', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _author_stats_statement(author_id: int) -> Select[ty.Any]:
+    """Stats of an author in a single statement, a row only when the author exists.
+
+    The reviews of each work are aggregated from the `(media_id, rating)` index, with the histogram
+    counted by FILTER clauses, then ranked by average rating by window functions. The author row
+    sums the works up and picks the first of each ranking.
+    """
+    works = (
+        select(
+            sqlm.Media.id,
+            sqlm.Media.title,
+            sqlm.Media.author_id,
+            func.count(sqlm.Review.id).label('review_count'),
+            func.sum(sqlm.Review.rating).label('rating_sum'),
+            cast(func.avg(sqlm.Review.rating), Float).label('rating_average'),
+            *(
+                func.count(sqlm.Review.id).filter(sqlm.Review.rating == rating).label(f'rating_{rating}')
+                for rating in RATINGS
+            ),
+        )
+        .outerjoin(sqlm.Media.reviews)
+        .where(sqlm.Media.author_id == author_id)
+        .group_by(sqlm.Media.id)
+        .subquery()
+    )
+    average = works.c.rating_average
+    ranked = select(
+        works,
+        func.row_number().over(order_by=(average.desc().nulls_last(), works.c.id)).label('best_rank'),
+        func.row_number().over(order_by=(average.asc().nulls_last(), works.c.id)).label('worst_rank'),
+    ).subquery()
+
+    def total(value: ty.Any) -> ty.Any:
+        return cast(func.coalesce(func.sum(value), 0), Integer)
+
+    def ranked_first(prefix: str) -> list[ty.Any]:
+        first = (ranked.c[f'{prefix}_rank'] == 1) & ranked.c.rating_average.is_not(None)
+        return [
+            func.max(ranked.c[name]).filter(first).label(f'{prefix}_{name}')
+            for name in ('id', 'title', 'review_count', 'rating_average')
+        ]
+
+    return (
+        select(
+            sqlm.Author.id,
+            func.count(ranked.c.id).label('works'),
+            total(ranked.c.review_count).label('reviews'),
+            total(ranked.c.rating_sum).label('rating_sum'),
+            *(total(ranked.c[f'rating_{rating}']).label(f'rating_{rating}') for rating in RATINGS),
+            *ranked_first('best'),
+            *ranked_first('worst'),
+        )
+        .select_from(sqlm.Author)
+        .outerjoin(ranked, ranked.c.author_id == sqlm.Author.id)
+        .where(sqlm.Author.id == author_id)
+        .group_by(sqlm.Author.id)
+    )
+
+
+def _ranked_media(row: Row[ty.Any], prefix: str) -> pm.MediaRating | None:
+    values = {name: getattr(row, f'{prefix}_{name}') for name in ('id', 'title', 'review_count', 'rating_average')}
+    if values['id'] is None:
+        return None
+    return pm.MediaRating(
+        id=values['id'],
+        title=values['title'],
+        rating_count=values['review_count'],
+        rating_average=values['rating_average'],
+    )
+
+
+def coalesce_key(name: str, *args: ty.Any, **kwargs: ty.Any) -> tuple[ty.Hashable, ...]:
+    """Single-flight key of a read, the reads from the primary only share their results between them."""
+    return make_key(name, *args, database.read_from_primary.get(), **kwargs)
+
+
+def _coalesced(
+    method: Callable[ty.Concatenate['DatabaseService', P], V],
+) -> Callable[ty.Concatenate['DatabaseService', P], V]:
+    """Share the result of a read with the identical calls made while it runs, see `review_app.singleflight`."""
+
+    @functools.wraps(method)
+    def coalesced(self: 'DatabaseService', *args: P.args, **kwargs: P.kwargs) -> V:
+        if self.flights is None:
+            return method(self, *args, **kwargs)
+        key = coalesce_key(method.__name__, *args, **kwargs)
+        return self.flights.do(key, lambda: method(self, *args, **kwargs))
+
+    return coalesced
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_flights(session: Session) -> None:
+    """Reads in flight may have started before the commit, the calls made after it must not get
+    their results."""
+    for flights in (default_flights, default_async_flights):
+        if flights is not None:
+            flights.forget()
+
+
+# Words of a search query, the other characters only separate them
+_SEARCH_WORD = re.compile(r'\w+')
+
+
 class DatabaseService:
     """Service class to interact with the database."""
 
-    def __init__(self, session: Session):
+    # Number of rows sent in each executemany batch of the bulk operations
+    BULK_CHUNK_SIZE = 1000
+
+    def __init__(
+        self,
+        session: Session,
+        cache: Cache | None = None,
+        flights: SingleFlight | None = None,
+        cache_author_stats: bool | None = None,
+        histograms_memo: analytics.HistogramsMemo | None = None,
+    ):
         self.session = session
+        # Read-through cache for the lookups of entities that (almost) never change
+        self.cache = cache
+        # Also cache the author stats, see `AUTHOR_STATS_CACHE`
+        self.cache_author_stats = AUTHOR_STATS_CACHE if cache_author_stats is None else cache_author_stats
+        # Coalescing of the concurrent identical reads, across the threads of the sync mode
+        self.flights = flights
+        # Histograms of the rating analytics kept between their pages
+        self.histograms_memo = histograms_memo
 
     @staticmethod
-    def create_database_service() -> 'DatabaseService':
-        return DatabaseService(database.SessionLocal())
+    def create_database_service() -> Iterator['DatabaseService']:
+        """Dependency that provides a service with its own session, which is always closed (returning
+        its connection to the pool) once the request is done."""
+        session = database.SessionLocal()
+        try:
+            yield DatabaseService(
+                session, cache=default_cache, flights=default_flights, histograms_memo=analytics.default_memo
+            )
+        finally:
+            session.close()
+
+    def _cached(self, key: str, model: type[T], loader: Callable[[], T]) -> T:
+        if self.cache is None:
+            return loader()
+        return self.cache.get_or_load(key, model, loader)
+
+    def _invalidate(self, *keys: str) -> None:
+        if self.cache is not None:
+            self.cache.delete(*keys)
 
     # User -----------------------------------------------------------------------
     def create_user(self, user: pm.UserCreate) -> pm.User:
@@ -28,17 +309,57 @@ class DatabaseService:
         self.session.refresh(sql_user)
         return pm.User.model_validate(sql_user)
 
+    def bulk_create_users(self, users: list[pm.UserCreate]) -> pm.BulkResult[pm.User]:
+        ids, errors = self._bulk_insert(sqlm.User, [user.model_dump() for user in users])
+        self.session.commit()
+        created = [pm.User(id=user_id, **users[index].model_dump()) for index, user_id in ids.items()]
+        return pm.BulkResult[pm.User](created=created, errors=errors)
+
+    @_coalesced
     def get_user(self, user_id: int) -> pm.User:
         sql_user = self.session.get(sqlm.User, user_id)
         if sql_user is None:
             raise NotFoundError(f'User with id {user_id} not found')
         return pm.User.model_validate(sql_user)
 
-    def get_user_reviews(self, user_id: int) -> list[pm.Review]:
-        sql_user = self.session.get(sqlm.User, user_id)
-        if sql_user is None:
+    @_coalesced
+    def get_user_many(self, user_ids: Sequence[int]) -> pm.GetManyResult[pm.User]:
+        return self._get_many(pm.GetManyResult[pm.User], user_ids, self._orm_loader(sqlm.User, pm.User))
+
+    @_coalesced
+    def get_user_reviews(self, user_id: int, limit: int | None = None, after: int | None = None) -> list[pm.Review]:
+        """Get the reviews of a user ordered by id, paginated with a keyset on `(user_id, id)`.
+
+        `after` is the id of the last review of the previous page, and `limit` the maximum
+        number of reviews to return (all of them if not set).
+        """
+        if self.session.get(sqlm.User, user_id) is None:
             raise NotFoundError(f'User with id {user_id} not found')
-        return [pm.Review.model_validate(review) for review in sql_user.reviews]
+        statement = self._user_reviews_statement(user_id=user_id, after=after).limit(limit)
+        return [_review_from_row(row) for row in self.session.execute(statement)]
+
+    def stream_user_reviews(self, user_id: int, after: int | None = None, chunk_size: int = 500) -> Iterator[pm.Review]:
+        """Lazily iterate over the reviews of a user, fetching them from a server side cursor in
+        chunks of `chunk_size` rows so memory stays flat regardless of the number of reviews.
+
+        The existence of the user is checked eagerly, so `NotFoundError` is raised by this call
+        and not while iterating.
+        """
+        if self.session.get(sqlm.User, user_id) is None:
+            raise NotFoundError(f'User with id {user_id} not found')
+        statement = self._user_reviews_statement(user_id=user_id, after=after)
+        return self._iterate_reviews(statement.execution_options(yield_per=chunk_size))
+
+    @staticmethod
+    def _user_reviews_statement(user_id: int, after: int | None) -> Select[ty.Any]:
+        statement = _REVIEW_ROWS_STATEMENT.where(sqlm.Review.user_id == user_id)
+        if after is not None:
+            statement = statement.where(sqlm.Review.id > after)
+        return statement.order_by(sqlm.Review.id)
+
+    def _iterate_reviews(self, statement: Select[ty.Any]) -> Iterator[pm.Review]:
+        for row in self.session.execute(statement):
+            yield _review_from_row(row)
 
     # Review ---------------------------------------------------------------------
     def create_review(self, review: pm.ReviewCreate) -> pm.Review:
@@ -49,14 +370,81 @@ class DatabaseService:
             review=review.review,
         )
         self.session.add(sql_review)
+        self._add_ratings([review])
         self.session.commit()
-        return pm.Review.model_validate(sql_review)
+        created = self.get_review(review_id=sql_review.id)
+        self._invalidate_author_stats(created.media.author_id)
+        return created
+
+    def bulk_create_reviews(self, reviews: list[pm.ReviewCreate]) -> pm.BulkResult[pm.Review]:
+        ids, errors = self._insert_reviews(reviews)
+        created = self._get_by_ids(sqlm.Review, list(ids.values()), options=_REVIEW_LOAD_OPTIONS)
+        return pm.BulkResult[pm.Review](created=[pm.Review.model_validate(review) for review in created], errors=errors)
+
+    def bulk_write_reviews(self, reviews: list[pm.ReviewCreate]) -> list[pm.BulkError]:
+        """`bulk_create_reviews` without reading the created reviews back, for the writers that only
+        need to know which ones failed, like the ingestion queue."""
+        return self._insert_reviews(reviews)[1]
 
+    def _insert_reviews(self, reviews: list[pm.ReviewCreate]) -> tuple[dict[int, int], list[pm.BulkError]]:
+        """Insert reviews with their ratings, committed at once, see `_bulk_insert`."""
+        ids, errors = self._bulk_insert(sqlm.Review, [review.model_dump() for review in reviews])
+        self._add_ratings(reviews[index] for index in ids)
+        author_ids = self._authors_with_cached_stats({reviews[index].media_id for index in ids})
+        self.session.commit()
+        self._invalidate_author_stats(*author_ids)
+        return ids, errors
+
+    def _add_ratings(self, reviews: Iterable[pm.ReviewCreate]) -> None:
+        """Add new reviews to the rating aggregates of their media, in the current transaction. They are
+        not part of the media responses, its version and `updated_at` are kept."""
+        counts, sums = Counter(), Counter()
+        for review in reviews:
+            counts[review.media_id] += 1
+            sums[review.media_id] += review.rating
+        if not counts:
+            return
+        media = sqlm.Media.__table__
+        self.session.execute(
+            update(media)
+            .where(media.c.id == bindparam('media_id'))
+            .values(
+                rating_count=media.c.rating_count + bindparam('count'),
+                rating_sum=media.c.rating_sum + bindparam('sum'),
+                rating_score=sqlm.rating_score(
+                    media.c.rating_count + bindparam('count'), media.c.rating_sum + bindparam('sum')
+                ),
+                updated_at=media.c.updated_at,
+            ),
+            # By id, so that concurrent writes lock their media in the same order and never deadlock
+            [{'media_id': media_id, 'count': counts[media_id], 'sum': sums[media_id]} for media_id in sorted(counts)],
+        )
+
+    @_coalesced
     def get_review(self, review_id: int) -> pm.Review:
-        sql_review = self.session.get(sqlm.Review, review_id)
-        if sql_review is None:
+        row = self.session.execute(_REVIEW_ROWS_STATEMENT.where(sqlm.Review.id == review_id)).one_or_none()
+        if row is None:
             raise NotFoundError(f'Review with id {review_id} not found')
-        return pm.Review.model_validate(sql_review)
+        return _review_from_row(row)
+
+    @_coalesced
+    def get_review_many(self, review_ids: Sequence[int]) -> pm.GetManyResult[pm.Review]:
+        def load_reviews(chunk: list[int]) -> Iterable[tuple[int, pm.Review]]:
+            statement = _REVIEW_ROWS_STATEMENT.where(sqlm.Review.id.in_(chunk))
+            return ((row.id, _review_from_row(row)) for row in self.session.execute(statement))
+
+        return self._get_many(pm.GetManyResult[pm.Review], review_ids, load_reviews)
+
+    @_coalesced
+    def search_reviews(self, query: str, limit: int = 20, offset: int = 0) -> list[pm.Review]:
+        """Reviews whose text contains every word of `query`, most relevant first, see `_search_ranking`."""
+        ranking = self._search_ranking(sqlm.Review.review, query, limit=limit, offset=offset)
+        if ranking is None:
+            return []
+        statement = _REVIEW_ROWS_STATEMENT.join(ranking, sqlm.Review.id == ranking.c.id).order_by(
+            ranking.c.score.desc(), sqlm.Review.id
+        )
+        return [_review_from_row(row) for row in self.session.execute(statement)]
 
     # Media ----------------------------------------------------------------------
     def create_media(self, media: pm.MediaCreate) -> pm.Media:
@@ -67,13 +455,73 @@ class DatabaseService:
         )
         self.session.add(sql_media)
         self.session.commit()
-        return pm.Media.model_validate(sql_media)
+        self._invalidate_author_stats(media.author_id)
+        return self.get_media(media_id=sql_media.id)
+
+    def bulk_create_media(self, media: list[pm.MediaCreate]) -> pm.BulkResult[pm.Media]:
+        ids, errors = self._bulk_insert(sqlm.Media, [item.model_dump() for item in media])
+        self.session.commit()
+        self._invalidate_author_stats(*{media[index].author_id for index in ids})
+        created = self._get_by_ids(sqlm.Media, list(ids.values()), options=_MEDIA_LOAD_OPTIONS)
+        return pm.BulkResult[pm.Media](created=[pm.Media.model_validate(item) for item in created], errors=errors)
 
+    @_coalesced
     def get_media(self, media_id: int) -> pm.Media:
-        sql_media = self.session.get(sqlm.Media, media_id)
-        if sql_media is None:
+        def load_media() -> pm.Media:
+            sql_media = self.session.get(sqlm.Media, media_id, options=_MEDIA_LOAD_OPTIONS)
+            if sql_media is None:
+                raise NotFoundError(f'Media with id {media_id} not found')
+            return pm.Media.model_validate(sql_media)
+
+        return self._cached(f'media:{media_id}', pm.Media, load_media)
+
+    @_coalesced
+    def get_media_version(self, media_id: int) -> Version:
+        """Version of `get_media`, from the versions of the media, its media type and its author."""
+        row = self.session.execute(_MEDIA_VERSION_STATEMENT.where(sqlm.Media.id == media_id)).one_or_none()
+        if row is None:
             raise NotFoundError(f'Media with id {media_id} not found')
-        return pm.Media.model_validate(sql_media)
+        return _media_version(row)
+
+    @_coalesced
+    def get_media_many(self, media_ids: Sequence[int]) -> pm.GetManyResult[pm.Media]:
+        loader = self._orm_loader(sqlm.Media, pm.Media, options=_MEDIA_LOAD_OPTIONS)
+        return self._get_many(pm.GetManyResult[pm.Media], media_ids, loader)
+
+    @_coalesced
+    def search_media(self, query: str, limit: int = 20, offset: int = 0) -> list[pm.Media]:
+        """Media whose title contains every word of `query`, most relevant first, see `_search_ranking`."""
+        ranking = self._search_ranking(sqlm.Media.title, query, limit=limit, offset=offset)
+        if ranking is None:
+            return []
+        statement = (
+            select(sqlm.Media)
+            .join(ranking, sqlm.Media.id == ranking.c.id)
+            .order_by(ranking.c.score.desc(), sqlm.Media.id)
+            .options(*_MEDIA_LOAD_OPTIONS)
+        )
+        return [pm.Media.model_validate(sql_media) for sql_media in self.session.scalars(statement)]
+
+    @_coalesced
+    def get_top_rated_media(
+        self, limit: int = 100, media_type_id: int | None = None, min_reviews: int = 1
+    ) -> list[pm.RatedMedia]:
+        """Media with the best `rating_score`, of all the media or of a media type, with at least
+        `min_reviews` reviews.
+
+        The scores are updated along with the rating aggregates when creating reviews, so the ids
+        are a scan of the first `limit` entries of a `rating_score` index, joined to the rest of the
+        media afterwards.
+        """
+        ranking = (sqlm.Media.rating_score.desc(), sqlm.Media.id)
+        top_ids = select(sqlm.Media.id).where(sqlm.Media.rating_count >= min_reviews)
+        if media_type_id is not None:
+            top_ids = top_ids.where(sqlm.Media.media_type_id == media_type_id)
+        top_ids = top_ids.order_by(*ranking).limit(limit)
+        statement = (select(sqlm.Media).where(sqlm.Media.id.in_(top_ids.scalar_subquery())).order_by(*ranking)).options(
+            *_MEDIA_LOAD_OPTIONS
+        )
+        return [pm.RatedMedia.model_validate(sql_media) for sql_media in self.session.scalars(statement)]
 
     # MediaType ------------------------------------------------------------------
     def create_media_type(self, media_type: pm.MediaTypeCreate) -> pm.MediaType:
@@ -82,12 +530,17 @@ class DatabaseService:
         self.session.commit()
         return pm.MediaType.model_validate(sql_media_type)
 
+    @_coalesced
     def get_media_type(self, media_type_id: int) -> pm.MediaType:
-        sql_media_type = self.session.get(sqlm.MediaType, media_type_id)
-        if sql_media_type is None:
-            raise NotFoundError(f'MediaType with id {media_type_id} not found')
-        return pm.MediaType.model_validate(sql_media_type)
+        def load_media_type() -> pm.MediaType:
+            sql_media_type = self.session.get(sqlm.MediaType, media_type_id)
+            if sql_media_type is None:
+                raise NotFoundError(f'MediaType with id {media_type_id} not found')
+            return pm.MediaType.model_validate(sql_media_type)
+
+        return self._cached(f'media_type:{media_type_id}', pm.MediaType, load_media_type)
 
+    @_coalesced
     def get_media_type_by_name(self, name: str) -> pm.MediaType:
         sql_media_type = self.session.query(sqlm.MediaType).filter(sqlm.MediaType.name == name).first()
         if sql_media_type is None:
@@ -101,21 +554,256 @@ class DatabaseService:
         self.session.commit()
         return pm.Author.model_validate(sql_author)
 
+    @_coalesced
     def get_author(self, author_id: int) -> pm.Author:
-        sql_author = self.session.query(sqlm.Author).filter(sqlm.Author.id == author_id).first()
-        if sql_author is None:
+        def load_author() -> pm.Author:
+            sql_author = self.session.query(sqlm.Author).filter(sqlm.Author.id == author_id).first()
+            if sql_author is None:
+                raise NotFoundError(f'Author with id {author_id} not found')
+            return pm.Author.model_validate(sql_author)
+
+        return self._cached(f'author:{author_id}', pm.Author, load_author)
+
+    @_coalesced
+    def get_author_version(self, author_id: int) -> Version:
+        row = self.session.execute(
+            select(sqlm.Author.version, sqlm.Author.updated_at).where(sqlm.Author.id == author_id)
+        ).one_or_none()
+        if row is None:
             raise NotFoundError(f'Author with id {author_id} not found')
-        return pm.Author.model_validate(sql_author)
+        return Version(f'"{row.version}"', row.updated_at)
+
+    @_coalesced
+    def get_author_many(self, author_ids: Sequence[int]) -> pm.GetManyResult[pm.Author]:
+        return self._get_many(pm.GetManyResult[pm.Author], author_ids, self._orm_loader(sqlm.Author, pm.Author))
 
+    @_coalesced
     def get_author_highest_rated_media(self, author_id: int) -> pm.Media:
-        sql_media = (
-            self.session.query(sqlm.Media)
-            .join(sqlm.Review)
-            .filter(sqlm.Media.author_id == author_id)
-            .group_by(sqlm.Media.id)
-            .order_by(func.avg(sqlm.Review.rating).desc())
-            .first()
-        )
+        # Ratings are aggregated per media when reviews are created, so there is no need to go
+        # through the reviews of the author
+        sql_media = self.session.scalars(
+            self._highest_rated(select(sqlm.Media), author_id).options(*_MEDIA_LOAD_OPTIONS)
+        ).first()
         if sql_media is None:
             raise NotFoundError(f'No media found for author with id {author_id}')
         return pm.Media.model_validate(sql_media)
+
+    @_coalesced
+    def get_author_highest_rated_media_version(self, author_id: int) -> Version:
+        """Version of `get_author_highest_rated_media`, the media ranked first is part of it. Without
+        `last_modified`: another media, updated before the previous one, can take the first place."""
+        row = self.session.execute(self._highest_rated(_MEDIA_VERSION_STATEMENT, author_id)).first()
+        if row is None:
+            raise NotFoundError(f'No media found for author with id {author_id}')
+        return _media_version(row)._replace(last_modified=None)
+
+    @_coalesced
+    def get_author_stats(self, author_id: int) -> pm.AuthorStats:
+        """Works, reviews, rating histogram and best and worst works of an author, from a single
+        statement whatever their number, see `_author_stats_statement`."""
+
+        def load_author_stats() -> pm.AuthorStats:
+            row = self.session.execute(_author_stats_statement(author_id)).one_or_none()
+            if row is None:
+                raise NotFoundError(f'Author with id {author_id} not found')
+            return pm.AuthorStats(
+                author_id=author_id,
+                works=row.works,
+                reviews=row.reviews,
+                rating_average=row.rating_sum / row.reviews if row.reviews else None,
+                rating_histogram=[getattr(row, f'rating_{rating}') for rating in RATINGS],
+                best_media=_ranked_media(row, 'best'),
+                worst_media=_ranked_media(row, 'worst'),
+            )
+
+        if not self.cache_author_stats:
+            return load_author_stats()
+        return self._cached(f'author_stats:{author_id}', pm.AuthorStats, load_author_stats)
+
+    def _authors_with_cached_stats(self, media_ids: Iterable[int]) -> list[int]:
+        """Authors of the media whose cached stats a write of their reviews invalidates, none when not cached."""
+        media_ids = list(media_ids)
+        if self.cache is None or not self.cache_author_stats or not media_ids:
+            return []
+        return list(
+            self.session.scalars(
+                select(sqlm.Media.author_id)
+                .where(sqlm.Media.id.in_(media_ids), sqlm.Media.author_id.is_not(None))
+                .distinct()
+            )
+        )
+
+    def _invalidate_author_stats(self, *author_ids: int | None) -> None:
+        if self.cache_author_stats:
+            self._invalidate(*(f'author_stats:{author_id}' for author_id in author_ids if author_id is not None))
+
+    @staticmethod
+    def _highest_rated(statement: Select[ty.Any], author_id: int) -> Select[ty.Any]:
+        return (
+            statement.where(sqlm.Media.author_id == author_id, sqlm.Media.rating_count > 0)
+            .order_by(sqlm.Media.rating_average.desc(), sqlm.Media.id)
+            .limit(1)
+        )
+
+    # Analytics ------------------------------------------------------------------
+    @_coalesced
+    def get_rating_analytics(
+        self,
+        group: analytics.Group,
+        percentiles: Sequence[float] = analytics.DEFAULT_PERCENTILES,
+        limit: int = 1000,
+        offset: int = 0,
+    ) -> pm.RatingAnalytics:
+        """Count, mean, variance, percentiles and histogram of the ratings of the media, authors,
+        media types or users with reviews, by increasing id.
+
+        The histograms of the group are computed from all the reviews (see `review_app.analytics`)
+        and kept in `histograms_memo`, the next pages are only sliced from them. They are not
+        invalidated by the writes, which every review would do, so they can be up to its TTL behind.
+        """
+
+        def load_histograms() -> analytics.RatingHistograms:
+            return analytics.load_rating_histograms(self.session.connection(), [group])[group]
+
+        if self.histograms_memo is None:
+            histograms = load_histograms()
+        else:
+            histograms = self.histograms_memo.get_or_load(group, load_histograms)
+        page = histograms.rows(slice(offset, offset + limit))
+        items = zip(
+            page.ids.tolist(),
+            page.count().tolist(),
+            page.mean().tolist(),
+            page.variance().tolist(),
+            page.percentiles(percentiles).tolist(),
+            page.counts.tolist(),
+            strict=True,
+        )
+        return pm.RatingAnalytics(
+            group=group,
+            ratings=histograms.ratings.tolist(),
+            percentiles=list(percentiles),
+            total=len(histograms.ids),
+            items=[
+                pm.RatingStats(
+                    id=item_id,
+                    count=count,
+                    mean=mean,
+                    variance=variance,
+                    percentiles=item_percentiles,
+                    histogram=histogram,
+                )
+                for item_id, count, mean, variance, item_percentiles, histogram in items
+            ],
+        )
+
+    # Search helpers -------------------------------------------------------------
+    def _search_ranking(self, text_column: ty.Any, query: str, limit: int, offset: int) -> Subquery | None:
+        """Page of the ids of the rows whose `text_column` matches every word of `query`, with
+        their relevance as `score`, or None when `query` has no words.
+
+        The matches are looked up in an inverted index: the GIN index of the `tsvector` of the column
+        on Postgres (stemmed, ranked by `ts_rank`) and its FTS5 table on SQLite, see
+        `sqlm.sqlite_search_index` (stemmed too, ranked by bm25).
+        """
+        words = _SEARCH_WORD.findall(query)
+        if not words:
+            return None
+        model = text_column.class_
+        if self.session.get_bind().dialect.name == 'sqlite':
+            search = table(f'{model.__tablename__}_search', column('rowid'), column('rank'), column(text_column.key))
+            # Quoted, the words are never read as FTS5 operators; bm25 ranks lower the better
+            match = ' '.join(f'"{word}"' for word in words)
+            ranking = select(search.c.rowid.label('id'), (-search.c.rank).label('score')).where(
+                search.c[text_column.key].match(match)
+            )
+        else:
+            ts_query = func.plainto_tsquery(literal_column(f"'{sqlm.SEARCH_CONFIG}'"), ' '.join(words))
+            vector = sqlm.search_vector(text_column)
+            ranking = select(model.id, func.ts_rank(vector, ts_query).label('score')).where(
+                vector.bool_op('@@')(ts_query)
+            )
+        return (
+            ranking.order_by(literal_column('score').desc(), literal_column('id'))
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+
+    # Bulk helpers ---------------------------------------------------------------
+    def _bulk_insert(self, model: type[M], rows: list[dict[str, ty.Any]]) -> tuple[dict[int, int], list[pm.BulkError]]:
+        """Insert rows in executemany batches of `BULK_CHUNK_SIZE`, inside the current transaction.
+
+        Each batch runs in a savepoint. When a batch fails it is retried row by row, so a bad
+        row is reported as an error without aborting the rest. Returns the ids of the created
+        rows by their index in `rows`, and the errors of the rows that could not be created.
+
+        The ids are returned along with the inserted values and matched back to the rows by them
+        (identical rows taking any of their ids). Asking for the ids in the order of the rows
+        instead (`sort_by_parameter_order`) makes SQLite fall back to one INSERT per row.
+        """
+        ids: dict[int, int] = {}
+        errors: list[pm.BulkError] = []
+        if not rows:
+            return ids, errors
+        columns = [model.__table__.c[key] for key in rows[0]]
+        statement = insert(model).returning(model.id, *columns)
+        for start in range(0, len(rows), self.BULK_CHUNK_SIZE):
+            chunk = rows[start : start + self.BULK_CHUNK_SIZE]
+            try:
+                with self.session.begin_nested():
+                    returned = self.session.execute(statement, chunk).all()
+            except DBAPIError:
+                for index, row in enumerate(chunk, start=start):
+                    try:
+                        with self.session.begin_nested():
+                            ids[index] = self.session.scalars(statement, [row]).one()
+                    except DBAPIError as e:
+                        errors.append(pm.BulkError(index=index, detail=str(e.orig).splitlines()[0]))
+            else:
+                indexes_by_values: dict[tuple[ty.Any, ...], list[int]] = {}
+                for index, row in reversed(list(enumerate(chunk, start=start))):
+                    indexes_by_values.setdefault(tuple(row.values()), []).append(index)
+                for row_id, *values in returned:
+                    ids[indexes_by_values[tuple(values)].pop()] = row_id
+        return dict(sorted(ids.items())), errors
+
+    def _get_by_ids(self, model: type[M], ids: Sequence[int], options: Sequence[ORMOption] = ()) -> list[M]:
+        """Load the rows with the given ids, in the same order, with a `WHERE id IN (...)` per chunk."""
+        rows = {}
+        for start in range(0, len(ids), self.BULK_CHUNK_SIZE):
+            chunk = ids[start : start + self.BULK_CHUNK_SIZE]
+            rows.update(
+                (row.id, row)
+                for row in self.session.scalars(select(model).where(model.id.in_(chunk)).options(*options))
+            )
+        return [rows[row_id] for row_id in ids]
+
+    def _get_many(
+        self, result_type: type[R], ids: Sequence[int], load_chunk: Callable[[list[int]], Iterable[tuple[int, ty.Any]]]
+    ) -> R:
+        """Look up `ids` with one `load_chunk` query per `BULK_CHUNK_SIZE` distinct ids. `load_chunk`
+        returns the `(id, item)` pairs found for a chunk of ids.
+
+        The items of the result keep the order of `ids`, with None for the ids not found, which
+        are also listed in `not_found`.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        found: dict[int, ty.Any] = {}
+        for start in range(0, len(unique_ids), self.BULK_CHUNK_SIZE):
+            found.update(load_chunk(unique_ids[start : start + self.BULK_CHUNK_SIZE]))
+        return result_type(
+            items=[found.get(item_id) for item_id in ids],
+            not_found=[item_id for item_id in unique_ids if item_id not in found],
+        )
+
+    def _orm_loader(
+        self, model: type[M], schema: type[T], options: Sequence[ORMOption] = ()
+    ) -> Callable[[list[int]], Iterable[tuple[int, T]]]:
+        """`_get_many` loader of the rows of `model`, as `schema` models."""
+
+        def load_chunk(chunk: list[int]) -> Iterable[tuple[int, T]]:
+            statement = select(model).where(model.id.in_(chunk)).options(*options)
+            return ((row.id, schema.model_validate(row)) for row in self.session.scalars(statement))
+
+        return load_chunk
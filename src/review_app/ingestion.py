@@ -0,0 +1,151 @@
+"""Write-behind ingestion of the reviews, opt-in with REVIEW_INGESTION.
+
+Instead of being written by the request, a review posted to `POST /reviews/` is validated,
+pushed to an in-process queue and acknowledged at once with `202 Accepted` and a pending id. A
+background task drains the queue: it writes every review waiting at once (up to
+REVIEW_INGESTION_BATCH_SIZE, default 1000) as multi-row inserts committed together, so a spike of
+submissions costs one commit per batch instead of one per review. While a batch is written the
+next one builds up, the batches grow with the load without delaying the reviews when it is low.
+
+The queue holds up to REVIEW_INGESTION_QUEUE_SIZE reviews (default 10000). When it is full, a
+submission waits up to REVIEW_INGESTION_PUT_TIMEOUT seconds (default 1) for room, slowing the
+clients down, then is rejected with `503 Service Unavailable`. On shutdown the queue stops
+accepting reviews and the ones already accepted are written before the app exits.
+
+The reviews are not durable until written: those still queued when the process dies are lost.
+`review_app_ingestion_reviews_total` in `GET /metrics` counts them by outcome.
+"""
+
+import asyncio
+import logging
+import os
+import typing as ty
+import uuid
+from collections.abc import Awaitable, Callable
+
+from review_app import metrics, schemas
+
+REVIEW_INGESTION = os.getenv('REVIEW_INGESTION', 'false').lower() in ('1', 'true', 'yes')
+REVIEW_INGESTION_QUEUE_SIZE = int(os.getenv('REVIEW_INGESTION_QUEUE_SIZE', '10000'))
+REVIEW_INGESTION_BATCH_SIZE = int(os.getenv('REVIEW_INGESTION_BATCH_SIZE', '1000'))
+REVIEW_INGESTION_PUT_TIMEOUT = float(os.getenv('REVIEW_INGESTION_PUT_TIMEOUT', '1'))
+
+logger = logging.getLogger(__name__)
+
+# `accepted` in the queue, `rejected` since it was full or closed, then `written` or `failed` by the worker
+REVIEWS = metrics.REGISTRY.counter(
+    'review_app_ingestion_reviews_total', 'Reviews submitted to the ingestion queue by outcome.', ('outcome',)
+)
+
+# Writes a batch of reviews in one transaction, returning the errors of the reviews not written
+BatchWriter = Callable[[list[schemas.ReviewCreate]], Awaitable[list[schemas.BulkError]]]
+
+
+class QueueFullError(Exception):
+    """The review could not be queued, the queue is full or closed."""
+
+
+class _Pending(ty.NamedTuple):
+    pending_id: str
+    review: schemas.ReviewCreate
+
+
+class ReviewQueue:
+    """Bounded queue of the reviews to write, drained by a worker task between `start` and `stop`."""
+
+    def __init__(
+        self,
+        maxsize: int = REVIEW_INGESTION_QUEUE_SIZE,
+        batch_size: int = REVIEW_INGESTION_BATCH_SIZE,
+        put_timeout: float = REVIEW_INGESTION_PUT_TIMEOUT,
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue: asyncio.Queue[_Pending | None] = asyncio.Queue(maxsize)
+        self._closed = True
+        self._worker: asyncio.Task[None] | None = None
+        # Submissions waiting for room, which `stop` lets finish before the last batch
+        self._submitting = 0
+        self._submitted = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def start(self, write_batch: BatchWriter) -> None:
+        """Start accepting reviews, written with `write_batch` by a task of the running event loop."""
+        self._queue = asyncio.Queue(self.maxsize)
+        self._submitted = asyncio.Condition()
+        self._closed = False
+        self._worker = asyncio.create_task(self._run(write_batch))
+
+    async def stop(self) -> None:
+        """Stop accepting reviews and wait for the ones accepted to be written."""
+        if self._worker is None:
+            return
+        self._closed = True
+        async with self._submitted:
+            await self._submitted.wait_for(lambda: self._submitting == 0)
+        await self._queue.put(None)  # After every accepted review
+        await self._worker
+        self._worker = None
+
+    async def submit(self, review: schemas.ReviewCreate) -> str:
+        """Queue `review` and return its pending id, or raise `QueueFullError` if there is no room for
+        it within `put_timeout` seconds."""
+        if self._closed:
+            REVIEWS.inc('rejected')
+            raise QueueFullError('The review queue is closed')
+        pending = _Pending(uuid.uuid4().hex, review)
+        self._submitting += 1
+        try:
+            await asyncio.wait_for(self._queue.put(pending), self.put_timeout)
+        except TimeoutError:
+            REVIEWS.inc('rejected')
+            raise QueueFullError('The review queue is full') from None
+        finally:
+            self._submitting -= 1
+            async with self._submitted:
+                self._submitted.notify_all()
+        REVIEWS.inc('accepted')
+        return pending.pending_id
+
+    async def _run(self, write_batch: BatchWriter) -> None:
+        stopping = False
+        while not stopping:
+            # Every review waiting, the first one awaited
+            batch: list[_Pending] = []
+            item = await self._queue.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) == self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+            if batch:
+                await self._write(write_batch, batch)
+
+    @staticmethod
+    async def _write(write_batch: BatchWriter, batch: list[_Pending]) -> None:
+        try:
+            errors = await write_batch([pending.review for pending in batch])
+        except Exception:
+            logger.exception('Failed to write %d queued reviews', len(batch))
+            REVIEWS.inc('failed', amount=len(batch))
+            return
+        for error in errors:
+            logger.warning('Failed to write the queued review %s: %s', batch[error.index].pending_id, error.detail)
+        REVIEWS.inc('written', amount=len(batch) - len(errors))
+        if errors:
+            REVIEWS.inc('failed', amount=len(errors))
+
+
+default_queue = ReviewQueue() if REVIEW_INGESTION else None
+
+if default_queue is not None:
+    metrics.REGISTRY.gauge(
+        'review_app_ingestion_queue_size',
+        'Reviews waiting in the ingestion queue.',
+        (),
+        lambda: {(): default_queue.qsize()},
+    )
@@ -0,0 +1,180 @@
+"""Per-request SQL instrumentation.
+
+`InstrumentationMiddleware` collects, for every request, the number of statements run, the time
+spent in the database and the time spent serializing the response. They are sent back in the
+`Server-Timing` header and logged once the request is done. Statements slower than
+SLOW_QUERY_THRESHOLD_MS (default 100, negative to disable) are logged with the route that ran them,
+truncated, and with the number of rows of an executemany. Their parameters, which hold the data of
+the users, are only logged with SLOW_QUERY_LOG_PARAMETERS, and shortened too.
+
+The statements are observed through cursor events of the engines passed to `instrument_engine`.
+"""
+
+import contextlib
+import logging
+import os
+import reprlib
+import time
+import typing as ty
+from collections.abc import Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from review_app import metrics
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_LOG_PARAMETERS = os.getenv('SLOW_QUERY_LOG_PARAMETERS', 'false').lower() in ('1', 'true', 'yes')
+
+# Bound of the statements and parameters of the slow query log, e.g. of the bulk inserts
+MAX_STATEMENT_LENGTH = 1000
+_parameters_repr = reprlib.Repr()
+_parameters_repr.maxstring = _parameters_repr.maxother = 40
+_parameters_repr.maxtuple = _parameters_repr.maxlist = _parameters_repr.maxdict = 10
+
+
+def _truncate(text: str) -> str:
+    return text if len(text) <= MAX_STATEMENT_LENGTH else text[:MAX_STATEMENT_LENGTH] + '...'
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestStats:
+    """What a request spent, times in seconds."""
+
+    scope: Scope = field(default_factory=dict)
+    queries: int = 0
+    db_time: float = 0
+    serialization_time: float = 0
+
+    @property
+    def route(self) -> str | None:
+        """Path template of the matched route, known once the router handled the request."""
+        route = self.scope.get('route')
+        return getattr(route, 'path', None)
+
+    def server_timing(self, total_time: float) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.3f};desc="{self.queries} queries", '
+            f'serialization;dur={self.serialization_time * 1000:.3f}, '
+            f'total;dur={total_time * 1000:.3f}'
+        )
+
+
+# Stats of the request being handled, copied along the context to the threadpool
+_request_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+@contextlib.contextmanager
+def collect(stats: RequestStats | None = None) -> Iterator[RequestStats]:
+    """Collect the stats of everything run inside the block, outside of a request too."""
+    stats = RequestStats() if stats is None else stats
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+@contextlib.contextmanager
+def measure_serialization() -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.serialization_time += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += duration
+    if 0 <= SLOW_QUERY_THRESHOLD_MS <= duration * 1000:
+        route = stats.route if stats is not None else None
+        statement = _truncate(statement)
+        rows = len(parameters) if executemany else None
+        shown_parameters = _truncate(_parameters_repr.repr(parameters)) if SLOW_QUERY_LOG_PARAMETERS else None
+        logger.warning(
+            'slow query route=%s duration_ms=%.3f rows=%s statement=%s parameters=%s',
+            route,
+            duration * 1000,
+            rows,
+            statement,
+            shown_parameters,
+            extra={
+                'route': route,
+                'duration_ms': duration * 1000,
+                'rows': rows,
+                'statement': statement,
+                'parameters': shown_parameters,
+            },
+        )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Observe the statements run through `engine`, the sync one of an `AsyncEngine` included."""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class InstrumentationMiddleware:
+    """Collect the `RequestStats` of each HTTP request, add them to its `Server-Timing` header and
+    log them. The header is sent with the start of the response, so the statements of a streamed
+    body only appear in the log."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        stats = RequestStats(scope=scope)
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', stats.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        with collect(stats):
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                total_time = time.perf_counter() - start
+                self._log(stats, status_code, total_time)
+                metrics.REQUEST_DURATION.observe(
+                    total_time, scope['method'], stats.route or 'unmatched', str(status_code)
+                )
+
+    @staticmethod
+    def _log(stats: RequestStats, status_code: int, total_time: float) -> None:
+        fields: dict[str, ty.Any] = {
+            'method': stats.scope['method'],
+            'path': stats.scope['path'],
+            'route': stats.route,
+            'status_code': status_code,
+            'queries': stats.queries,
+            'db_time_ms': round(stats.db_time * 1000, 3),
+            'serialization_time_ms': round(stats.serialization_time * 1000, 3),
+            'duration_ms': round(total_time * 1000, 3),
+        }
+        logger.info('request %s', ' '.join(f'{key}={value}' for key, value in fields.items()), extra=fields)
@@ -1,117 +1,509 @@
 # ruff: noqa: B008
-from fastapi import Depends, FastAPI, HTTPException
+import contextlib
+import email.utils
+import functools
+import time
+import typing as ty
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from datetime import UTC, datetime
 
-from . import schemas
-from .database import service
+import pydantic
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-app = FastAPI()
+from . import analytics, cache, ingestion, instrumentation, metrics, schemas
+from .database import async_service, database, service
+
+T = ty.TypeVar('T')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Run the worker of the review ingestion queue when enabled, it writes the queued reviews before
+    the app stops."""
+    if ingestion.default_queue is None:
+        yield
+        return
+    ingestion.default_queue.start(_write_queued_reviews)
+    try:
+        yield
+    finally:
+        await ingestion.default_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# The service implementation is picked by the DATABASE_URL driver, see `database.ASYNC_MODE`
+get_database_service = (
+    async_service.AsyncDatabaseService.create_database_service
+    if database.ASYNC_MODE
+    else service.DatabaseService.create_database_service
+)
+
+
+# Cookie marking the clients that wrote recently, while it lasts their reads go to the primary
+PRIMARY_COOKIE = 'review_app_read_primary'
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    """Send the requests of a client to the primary database during `DATABASE_STICKY_SECONDS`
+    after any of its writes, so it never reads stale data from a lagging replica.
+
+    Plain ASGI middleware: `@app.middleware('http')` runs every request in an extra task, which
+    costs a noticeable share of the fast read endpoints.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or database.replica_pool is None:
+            await self.app(scope, receive, send)
+            return
+        writing = scope['method'] not in _SAFE_METHODS
+
+        async def send_with_cookie(message: Message) -> None:
+            if writing and message['type'] == 'http.response.start' and message['status'] < 400:
+                MutableHeaders(scope=message).append(
+                    'set-cookie',
+                    f'{PRIMARY_COOKIE}=1; HttpOnly; Max-Age={database.DATABASE_STICKY_SECONDS}; Path=/; SameSite=lax',
+                )
+            await send(message)
+
+        token = database.read_from_primary.set(writing or PRIMARY_COOKIE in Request(scope).cookies)
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            database.read_from_primary.reset(token)
+
+
+app.add_middleware(ReadYourWritesMiddleware)
+# Outermost, so its timings cover the whole request
+app.add_middleware(instrumentation.InstrumentationMiddleware)
+_ENGINES = {'primary': database.engine, **{f'replica{i}': engine for i, engine in enumerate(database.read_engines)}}
+for instrumented_engine in _ENGINES.values():
+    instrumentation.instrument_engine(instrumented_engine)
+
+
+def _pool_gauge(key: str) -> Callable[[], dict[tuple[str, ...], float]]:
+    # The pool reports a negative overflow while it has not opened `pool_size` connections yet
+    return lambda: {(name,): max(database.pool_status(engine)[key], 0) for name, engine in _ENGINES.items()}
+
+
+metrics.REGISTRY.gauge(
+    'review_app_db_pool_checked_out', 'Connections checked out of the pool.', ('engine',), _pool_gauge('checked_out')
+)
+metrics.REGISTRY.gauge(
+    'review_app_db_pool_overflow', 'Connections open beyond the pool size.', ('engine',), _pool_gauge('overflow')
+)
+
+
+async def run_service(method: Callable[..., T | Awaitable[T]], /, **kwargs: ty.Any) -> T:
+    """Call a database service method without blocking the event loop. Coroutines of the async
+    service are awaited, blocking methods of the sync service run in the threadpool."""
+    start = time.perf_counter()
+    try:
+        if database.ASYNC_MODE:
+            return await method(**kwargs)
+        return await run_in_threadpool(method, **kwargs)
+    finally:
+        metrics.SERVICE_DURATION.observe(time.perf_counter() - start, getattr(method, '__name__', 'unknown'))
+
+
+# Serializers of the list responses built once, the models serialize themselves with `model_dump_json`.
+# See benchmarks/serialization.py for what they save over the validation and encoding of FastAPI.
+_REVIEW_LIST = pydantic.TypeAdapter(list[schemas.Review])
+_RATED_MEDIA_LIST = pydantic.TypeAdapter(list[schemas.RatedMedia])
+_MEDIA_LIST = pydantic.TypeAdapter(list[schemas.Media])
+
+
+def _json_response(dump_json: Callable[[], bytes | str], status_code: int = 200) -> Response:
+    """Response with JSON serialized by pydantic through `dump_json`. FastAPI sends it as is,
+    skipping the validation against `response_model` (kept for the docs) and its slower encoder."""
+    with instrumentation.measure_serialization():
+        return Response(dump_json(), status_code=status_code, media_type='application/json')
+
+
+def _http_date(time: datetime) -> str:
+    # Naive times are UTC, SQLite stores CURRENT_TIMESTAMP without its time zone
+    time = time.astimezone(UTC) if time.tzinfo is not None else time.replace(tzinfo=UTC)
+    return email.utils.format_datetime(time, usegmt=True)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether `If-None-Match` lists `etag`, by the weak comparison of the entity tags."""
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+
+async def _conditional_read(
+    request: Request,
+    read_version: Callable[..., service.Version | Awaitable[service.Version]],
+    read: Callable[..., pydantic.BaseModel | Awaitable[pydantic.BaseModel]],
+    /,
+    **kwargs: ty.Any,
+) -> Response:
+    """Response of `read` with its `ETag` and `Last-Modified`, or `304 Not Modified` when the
+    `If-None-Match` of the request lists its tag: then only its version is looked up, it is
+    neither loaded nor serialized. The version is read first so a response loaded from the
+    database is at least as recent. One served by the cache can be older, by up to `CACHE_TTL`,
+    when the row was updated after it was cached."""
+    version = await run_service(read_version, **kwargs)
+    headers = {'ETag': version.etag}
+    if version.last_modified is not None:
+        headers['Last-Modified'] = _http_date(version.last_modified)
+    if _etag_matches(request.headers.get('if-none-match'), version.etag):
+        return Response(status_code=304, headers=headers)
+    item = await run_service(read, **kwargs)
+    response = _json_response(item.model_dump_json)
+    response.headers.update(headers)
+    return response
+
+
+def _to_ndjson(
+    reviews: Iterator[schemas.Review] | AsyncIterator[schemas.Review], close: Callable[[], ty.Any]
+) -> Iterator[str] | AsyncIterator[str]:
+    """Lines of the streamed reviews, calling `close` (awaited if needed) once they are sent. The
+    stream owns the session it reads from: FastAPI before 0.118 runs the teardown of the dependencies
+    before the stream starts, and the closed session would check out a connection never returned."""
+    if isinstance(reviews, AsyncIterator):
+
+        async def async_lines() -> AsyncIterator[str]:
+            try:
+                async for review in reviews:
+                    yield review.model_dump_json() + '\n'
+            finally:
+                await close()
+
+        return async_lines()
+
+    def lines() -> Iterator[str]:
+        try:
+            for review in reviews:
+                yield review.model_dump_json() + '\n'
+        finally:
+            close()
+
+    return lines()
+
+
+MAX_IDS = 1000  # Ids accepted by the get many routes
+
+
+def parse_ids(ids: str = Query(description='Comma separated ids, at most 1000', examples=['1,2,3'])) -> list[int]:
+    """Ids of the get many routes, in the request order with duplicates kept."""
+    try:
+        parsed = [int(item_id) for item_id in ids.split(',')]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail='ids must be comma separated integers') from e
+    if len(parsed) > MAX_IDS:
+        raise HTTPException(status_code=422, detail=f'At most {MAX_IDS} ids can be requested at once')
+    return parsed
 
 
 # User -----------------------------------------------------------------------
 @app.post('/users/', response_model=schemas.User)
-def create_user(
-    user: schemas.UserCreate, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.User:
-    return db.create_user(user=user)
+async def create_user(user: schemas.UserCreate, db: service.DatabaseService = Depends(get_database_service)):
+    result = await run_service(db.create_user, user=user)
+    return _json_response(result.model_dump_json)
+
+
+@app.post('/users/bulk', response_model=schemas.BulkResult[schemas.User])
+async def bulk_create_users(
+    users: list[schemas.UserCreate], db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.bulk_create_users, users=users)
+    return _json_response(result.model_dump_json)
+
+
+@app.get('/users', response_model=schemas.GetManyResult[schemas.User])
+async def read_user_many(
+    ids: list[int] = Depends(parse_ids), db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.get_user_many, user_ids=ids)
+    return _json_response(result.model_dump_json)
 
 
 @app.get('/users/{user_id}', response_model=schemas.User)
-def read_user(user_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)):
+async def read_user(user_id: int, db: service.DatabaseService = Depends(get_database_service)):
     try:
-        user = db.get_user(user_id=user_id)
+        user = await run_service(db.get_user, user_id=user_id)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='User not found') from e
-    return user
+    return _json_response(user.model_dump_json)
 
 
 @app.get('/users/{user_id}/reviews', response_model=list[schemas.Review])
-def read_user_reviews(
-    user_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> list[schemas.Review]:
+async def read_user_reviews(
+    user_id: int,
+    limit: int = Query(default=100, ge=1, le=1000),
+    after: int | None = None,
+    stream: bool = False,
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    """Reviews of a user ordered by id. Pages are requested with `after`, the id of the last review
+    of the previous page. With `stream` every review after `after` is sent as NDJSON instead, and
+    `limit` is ignored."""
     try:
-        reviews = db.get_user_reviews(user_id=user_id)
+        if stream:
+            reviews = await run_service(db.stream_user_reviews, user_id=user_id, after=after)
+            return StreamingResponse(_to_ndjson(reviews, db.session.close), media_type='application/x-ndjson')
+        reviews = await run_service(db.get_user_reviews, user_id=user_id, limit=limit, after=after)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='User not found') from e
-    return reviews
+    return _json_response(functools.partial(_REVIEW_LIST.dump_json, reviews))
 
 
 # MediaType --------------------------------------------------------------------
 @app.post('/media_types/', response_model=schemas.MediaType)
-def create_media_type(
+async def create_media_type(
     media_type: schemas.MediaTypeCreate,
-    db: service.DatabaseService = Depends(service.DatabaseService.create_database_service),
-) -> schemas.MediaType:
-    return db.create_media_type(media_type=media_type)
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    result = await run_service(db.create_media_type, media_type=media_type)
+    return _json_response(result.model_dump_json)
 
 
 @app.get('/media_types/{media_type_id}', response_model=schemas.MediaType)
-def read_media_type(
-    media_type_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.MediaType:
+async def read_media_type(media_type_id: int, db: service.DatabaseService = Depends(get_database_service)):
     try:
-        media_type = db.get_media_type(media_type_id=media_type_id)
+        media_type = await run_service(db.get_media_type, media_type_id=media_type_id)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='Media type not found') from e
-    return media_type
+    return _json_response(media_type.model_dump_json)
 
 
 # Review -----------------------------------------------------------------------
-@app.post('/reviews/', response_model=schemas.Review)
-def create_review(
-    review: schemas.ReviewCreate, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.Review:
-    return db.create_review(review=review)
+async def _write_queued_reviews(reviews: list[schemas.ReviewCreate]) -> list[schemas.BulkError]:
+    """Write a batch of the review ingestion queue, with a session of its own and the cache, whose
+    author stats the reviews invalidate."""
+    if database.ASYNC_MODE:
+        async with database.AsyncSessionLocal() as session:
+            db = async_service.AsyncDatabaseService(session, cache=cache.default_cache)
+            return await db.bulk_write_reviews(reviews=reviews)
+
+    def write() -> list[schemas.BulkError]:
+        with database.SessionLocal() as session:
+            return service.DatabaseService(session, cache=cache.default_cache).bulk_write_reviews(reviews)
+
+    return await run_in_threadpool(write)
+
+
+@app.post(
+    '/reviews/',
+    response_model=schemas.Review,
+    responses={
+        202: {'model': schemas.PendingReview, 'description': 'Queued to be written, with REVIEW_INGESTION'},
+        503: {'description': 'The ingestion queue is full'},
+    },
+)
+async def create_review(review: schemas.ReviewCreate, db: service.DatabaseService = Depends(get_database_service)):
+    """Create a review, or with REVIEW_INGESTION queue it and answer `202 Accepted` at once, see
+    `review_app.ingestion`."""
+    if ingestion.default_queue is None:
+        result = await run_service(db.create_review, review=review)
+        return _json_response(result.model_dump_json)
+    try:
+        pending_id = await ingestion.default_queue.submit(review)
+    except ingestion.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'}) from e
+    return _json_response(schemas.PendingReview(pending_id=pending_id).model_dump_json, status_code=202)
+
+
+@app.post('/reviews/bulk', response_model=schemas.BulkResult[schemas.Review])
+async def bulk_create_reviews(
+    reviews: list[schemas.ReviewCreate], db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.bulk_create_reviews, reviews=reviews)
+    return _json_response(result.model_dump_json)
+
+
+@app.get('/reviews', response_model=schemas.GetManyResult[schemas.Review])
+async def read_review_many(
+    ids: list[int] = Depends(parse_ids), db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.get_review_many, review_ids=ids)
+    return _json_response(result.model_dump_json)
+
+
+# Declared before `/reviews/{review_id}`, which would match `search` otherwise
+@app.get('/reviews/search', response_model=list[schemas.Review])
+async def search_reviews(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    """Reviews containing every word of `q`, most relevant first."""
+    reviews = await run_service(db.search_reviews, query=q, limit=limit, offset=offset)
+    return _json_response(functools.partial(_REVIEW_LIST.dump_json, reviews))
 
 
 @app.get('/reviews/{review_id}', response_model=schemas.Review)
-def read_review(review_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)):
+async def read_review(review_id: int, db: service.DatabaseService = Depends(get_database_service)):
     try:
-        review = db.get_review(review_id=review_id)
+        review = await run_service(db.get_review, review_id=review_id)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='Review not found') from e
-    return review
+    return _json_response(review.model_dump_json)
 
 
 # Media ----------------------------------------------------------------------
 @app.post('/media/', response_model=schemas.Media)
-def create_media(
-    media: schemas.MediaCreate, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.Media:
-    return db.create_media(media=media)
+async def create_media(media: schemas.MediaCreate, db: service.DatabaseService = Depends(get_database_service)):
+    result = await run_service(db.create_media, media=media)
+    return _json_response(result.model_dump_json)
+
+
+@app.post('/media/bulk', response_model=schemas.BulkResult[schemas.Media])
+async def bulk_create_media(
+    media: list[schemas.MediaCreate], db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.bulk_create_media, media=media)
+    return _json_response(result.model_dump_json)
+
+
+@app.get('/media', response_model=schemas.GetManyResult[schemas.Media])
+async def read_media_many(
+    ids: list[int] = Depends(parse_ids), db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.get_media_many, media_ids=ids)
+    return _json_response(result.model_dump_json)
+
+
+# Declared before `/media/{media_id}`, which would match `search` otherwise
+@app.get('/media/search', response_model=list[schemas.Media])
+async def search_media(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    """Media whose title contains every word of `q`, most relevant first."""
+    media = await run_service(db.search_media, query=q, limit=limit, offset=offset)
+    return _json_response(functools.partial(_MEDIA_LIST.dump_json, media))
 
 
 @app.get('/media/{media_id}', response_model=schemas.Media)
-def read_media(media_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)):
+async def read_media(media_id: int, request: Request, db: service.DatabaseService = Depends(get_database_service)):
     try:
-        media = db.get_media(media_id=media_id)
+        return await _conditional_read(request, db.get_media_version, db.get_media, media_id=media_id)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='Media not found') from e
-    return media
 
 
 # Author ---------------------------------------------------------------------
 @app.post('/authors/', response_model=schemas.Author)
-def create_author(
-    author: schemas.AuthorCreate, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.Author:
-    return db.create_author(author=author)
+async def create_author(author: schemas.AuthorCreate, db: service.DatabaseService = Depends(get_database_service)):
+    result = await run_service(db.create_author, author=author)
+    return _json_response(result.model_dump_json)
+
+
+@app.get('/authors', response_model=schemas.GetManyResult[schemas.Author])
+async def read_author_many(
+    ids: list[int] = Depends(parse_ids), db: service.DatabaseService = Depends(get_database_service)
+):
+    result = await run_service(db.get_author_many, author_ids=ids)
+    return _json_response(result.model_dump_json)
 
 
 @app.get('/authors/{author_id}', response_model=schemas.Author)
-def read_author(author_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)):
+async def read_author(author_id: int, request: Request, db: service.DatabaseService = Depends(get_database_service)):
     try:
-        author = db.get_author(author_id=author_id)
+        return await _conditional_read(request, db.get_author_version, db.get_author, author_id=author_id)
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='Author not found') from e
-    return author
 
 
 @app.get('/authors/{author_id}/highest_rated_media', response_model=schemas.Media)
-def read_author_highest_rated_media(
-    author_id: int, db: service.DatabaseService = Depends(service.DatabaseService.create_database_service)
-) -> schemas.Media:
+async def read_author_highest_rated_media(
+    author_id: int, request: Request, db: service.DatabaseService = Depends(get_database_service)
+):
     try:
-        media = db.get_author_highest_rated_media(author_id=author_id)
+        return await _conditional_read(
+            request,
+            db.get_author_highest_rated_media_version,
+            db.get_author_highest_rated_media,
+            author_id=author_id,
+        )
     except service.NotFoundError as e:
         raise HTTPException(status_code=404, detail='Author not found') from e
-    return media
+
+
+@app.get('/authors/{author_id}/stats', response_model=schemas.AuthorStats)
+async def read_author_stats(author_id: int, db: service.DatabaseService = Depends(get_database_service)):
+    try:
+        stats = await run_service(db.get_author_stats, author_id=author_id)
+    except service.NotFoundError as e:
+        raise HTTPException(status_code=404, detail='Author not found') from e
+    return _json_response(stats.model_dump_json)
+
+
+# Rankings ---------------------------------------------------------------------
+@app.get('/rankings/media', response_model=list[schemas.RatedMedia])
+async def read_top_rated_media(
+    limit: int = Query(default=100, ge=1, le=1000),
+    media_type_id: int | None = None,
+    min_reviews: int = Query(default=1, ge=0),
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    """Media with the best Bayesian average rating, of every media type unless `media_type_id` is set."""
+    media = await run_service(db.get_top_rated_media, limit=limit, media_type_id=media_type_id, min_reviews=min_reviews)
+    return _json_response(functools.partial(_RATED_MEDIA_LIST.dump_json, media))
+
+
+# Analytics --------------------------------------------------------------------
+def parse_percentiles(
+    percentiles: str = Query(default='50,90,99', description='Comma separated percentiles, between 0 and 100'),
+) -> list[float]:
+    try:
+        return analytics.parse_percentiles(percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail='percentiles must be numbers between 0 and 100') from e
+
+
+@app.get('/analytics/ratings/{group}', response_model=schemas.RatingAnalytics)
+async def read_rating_analytics(
+    group: analytics.Group,
+    percentiles: list[float] = Depends(parse_percentiles),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    offset: int = Query(default=0, ge=0),
+    db: service.DatabaseService = Depends(get_database_service),
+):
+    """Rating stats of every media, author, media type or user with reviews, a page of them by
+    increasing id. It reads all the reviews, `python -m review_app.analytics` exports them at once."""
+    result = await run_service(
+        db.get_rating_analytics, group=group, percentiles=percentiles, limit=limit, offset=offset
+    )
+    return _json_response(result.model_dump_json)
+
+
+# Status -----------------------------------------------------------------------
+@app.get('/status/pool', response_model=schemas.PoolStatus)
+async def read_pool_status():
+    """Checked out vs idle connections of the database connection pool."""
+    return _json_response(schemas.PoolStatus(**database.pool_status()).model_dump_json)
+
+
+@app.get('/status/cache', response_model=schemas.CacheStatus)
+async def read_cache_status():
+    """Hits and misses of the read-through cache of the lookups."""
+    if cache.default_cache is None:
+        status = schemas.CacheStatus(enabled=False, hits=0, misses=0)
+    else:
+        status = schemas.CacheStatus(enabled=True, hits=cache.default_cache.hits, misses=cache.default_cache.misses)
+    return _json_response(status.model_dump_json)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def read_metrics() -> Response:
+    """Metrics in the Prometheus text format, of every worker when METRICS_MULTIPROC_DIR is set."""
+    return Response(
+        metrics.REGISTRY.render(metrics.METRICS_MULTIPROC_DIR), media_type='text/plain; version=0.0.4; charset=utf-8'
+    )
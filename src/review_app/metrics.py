@@ -0,0 +1,262 @@
+"""Prometheus metrics of the app, exposed in the text format by `GET /metrics`.
+
+Histograms and counters aggregate per thread: every thread updates its own shard, without locks,
+and the shards are only summed when the metrics are rendered. Gauges are read from callbacks at
+render time.
+
+With several worker processes, set METRICS_MULTIPROC_DIR to a directory shared by all of them.
+Each worker writes a snapshot of its metrics there every METRICS_FLUSH_INTERVAL seconds
+(default 5), and the worker answering `GET /metrics` renders the sum of all the snapshots.
+Gauges of workers that stopped writing are dropped after three intervals, their histograms and
+counters are kept since they only ever grow.
+"""
+
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import typing as ty
+from collections.abc import Callable, Iterable, Sequence
+
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+
+Labels = tuple[str, ...]
+
+
+class _ThreadSharded:
+    """Values by labels, kept in one shard per thread and summed when collected."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()  # Only taken the first time a thread updates the values
+        self._shards: list[dict[Labels, list[float]]] = []
+
+    def _shard(self) -> dict[Labels, list[float]]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: dict[Labels, list[float]] = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def collect(self) -> dict[Labels, list[float]]:
+        total: dict[Labels, list[float]] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, counts in list(shard.items()):
+                _add_counts(total, labels, counts)
+        return total
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shards = []
+            self._local = threading.local()
+
+
+class Histogram(_ThreadSharded):
+    """Histogram of observations by labels, aggregated per thread. Its values are, per labels, the
+    count of each bucket (not cumulative), of +Inf and the sum."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+
+class Counter(_ThreadSharded):
+    """Counter by labels, aggregated per thread."""
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0]
+        counts[0] += amount
+
+
+class Gauge:
+    """Gauge whose values, by labels, are read from `callback` when collected."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], dict[Labels, float]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self) -> dict[Labels, float]:
+        return self.callback()
+
+
+def _add_counts(total: dict[Labels, list[float]], labels: Labels, counts: Sequence[float]) -> None:
+    current = total.setdefault(labels, [0] * len(counts))
+    for index, count in enumerate(counts):
+        current[index] += count
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, Counter] = {}
+        self.gauges: dict[str, Gauge] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str], **kwargs: ty.Any) -> Histogram:
+        self.histograms[name] = Histogram(name, documentation, labelnames, **kwargs)
+        return self.histograms[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str]) -> Counter:
+        self.counters[name] = Counter(name, documentation, labelnames)
+        return self.counters[name]
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], dict[Labels, float]]
+    ) -> Gauge:
+        self.gauges[name] = Gauge(name, documentation, labelnames, callback)
+        return self.gauges[name]
+
+    def snapshot(self) -> dict[str, ty.Any]:
+        return {
+            'time': time.time(),
+            'histograms': {
+                name: [[list(labels), counts] for labels, counts in histogram.collect().items()]
+                for name, histogram in self.histograms.items()
+            },
+            'counters': {
+                name: [[list(labels), counts] for labels, counts in counter.collect().items()]
+                for name, counter in self.counters.items()
+            },
+            'gauges': {
+                name: [[list(labels), value] for labels, value in gauge.collect().items()]
+                for name, gauge in self.gauges.items()
+            },
+        }
+
+    def write_snapshot(self, directory: str) -> None:
+        """Write the snapshot of this process to `directory`, atomically so readers never see half of it."""
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as file:
+            json.dump(self.snapshot(), file)
+        os.replace(file.name, os.path.join(directory, f'{os.getpid()}.json'))
+
+    def render(self, multiproc_dir: str | None = None) -> str:
+        """Metrics in the Prometheus text format, of every process writing to `multiproc_dir` if set."""
+        if multiproc_dir is None:
+            snapshots = [self.snapshot()]
+        else:
+            self.write_snapshot(multiproc_dir)
+            snapshots = _read_snapshots(multiproc_dir)
+        lines = []
+        for name, histogram in self.histograms.items():
+            total: dict[Labels, list[float]] = {}
+            for snapshot in snapshots:
+                for labels, counts in snapshot['histograms'].get(name, []):
+                    _add_counts(total, tuple(labels), counts)
+            lines += _render_histogram(histogram, total)
+        for name, counter in self.counters.items():
+            total = {}
+            for snapshot in snapshots:
+                for labels, counts in snapshot['counters'].get(name, []):
+                    _add_counts(total, tuple(labels), counts)
+            lines += [f'# HELP {name} {counter.documentation}', f'# TYPE {name} counter']
+            lines += [
+                f'{name}{_labels(counter.labelnames, labels)} {_number(counts[0])}' for labels, counts in total.items()
+            ]
+        for name, gauge in self.gauges.items():
+            values: dict[Labels, float] = {}
+            for snapshot in snapshots:
+                if snapshot['time'] < time.time() - 3 * METRICS_FLUSH_INTERVAL:
+                    continue
+                for labels, value in snapshot['gauges'].get(name, []):
+                    values[tuple(labels)] = values.get(tuple(labels), 0) + value
+            lines += [f'# HELP {name} {gauge.documentation}', f'# TYPE {name} gauge']
+            lines += [f'{name}{_labels(gauge.labelnames, labels)} {_number(value)}' for labels, value in values.items()]
+        return '\n'.join(lines) + '\n'
+
+
+def _read_snapshots(directory: str) -> list[dict[str, ty.Any]]:
+    snapshots = []
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, file_name)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue  # Removed or replaced while listing
+    return snapshots
+
+
+def _render_histogram(histogram: Histogram, total: dict[Labels, list[float]]) -> list[str]:
+    name = histogram.name
+    lines = [f'# HELP {name} {histogram.documentation}', f'# TYPE {name} histogram']
+    for labels, counts in total.items():
+        cumulative = 0.0
+        for bound, count in zip([*histogram.buckets, math.inf], counts[:-1], strict=True):
+            cumulative += count
+            bucket_labels = _labels((*histogram.labelnames, 'le'), (*labels, _number(bound)))
+            lines.append(f'{name}_bucket{bucket_labels} {_number(cumulative)}')
+        lines.append(f'{name}_sum{_labels(histogram.labelnames, labels)} {_number(counts[-1])}')
+        lines.append(f'{name}_count{_labels(histogram.labelnames, labels)} {_number(cumulative)}')
+    return lines
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True))
+    return '{' + pairs + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+REQUEST_DURATION = REGISTRY.histogram(
+    'review_app_request_duration_seconds', 'Latency of the HTTP requests by route.', ('method', 'route', 'status')
+)
+SERVICE_DURATION = REGISTRY.histogram(
+    'review_app_service_duration_seconds', 'Latency of the database service methods called by the routes.', ('method',)
+)
+
+
+def _flush_periodically(directory: str) -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        REGISTRY.write_snapshot(directory)
+
+
+def _start_flushing() -> None:
+    for metric in [*REGISTRY.histograms.values(), *REGISTRY.counters.values()]:
+        metric.reset()  # Observations of the parent process, after a fork
+    threading.Thread(target=_flush_periodically, args=(METRICS_MULTIPROC_DIR,), daemon=True).start()
+
+
+if METRICS_MULTIPROC_DIR is not None:
+    _start_flushing()
+    # Workers forked from a preloaded app start their own flusher
+    os.register_at_fork(after_in_child=_start_flushing)
@@ -1,5 +1,9 @@
+import typing as ty
+
 import pydantic
 
+T = ty.TypeVar('T')
+
 
 # User --------------------------------------------------------------------------------------------
 class UserBase(pydantic.BaseModel):
@@ -67,6 +71,29 @@ class Media(MediaBase):
     author: Author | None
 
 
+class RatedMedia(Media):
+    rating_count: int
+    rating_average: float | None
+    rating_score: float  # Bayesian average of the ratings, the rankings order
+
+
+class MediaRating(pydantic.BaseModel):
+    id: int
+    title: str
+    rating_count: int
+    rating_average: float
+
+
+class AuthorStats(pydantic.BaseModel):
+    author_id: int
+    works: int
+    reviews: int
+    rating_average: float | None
+    rating_histogram: list[int]  # Number of reviews rating 1 to 5
+    best_media: MediaRating | None  # Of the best and worst average rating, among the reviewed works
+    worst_media: MediaRating | None
+
+
 # Review -----------------------------------------------------------------------
 class ReviewBase(pydantic.BaseModel):
     media_id: int
@@ -85,3 +112,55 @@ class Review(ReviewBase):
     id: int
     media: Media
     user: User
+
+
+class PendingReview(pydantic.BaseModel):
+    pending_id: str  # Id of the review in the ingestion queue, it gets its own once written
+
+
+# Bulk -------------------------------------------------------------------------
+class BulkError(pydantic.BaseModel):
+    index: int  # Position of the item in the request
+    detail: str
+
+
+class BulkResult(pydantic.BaseModel, ty.Generic[T]):
+    created: list[T]
+    errors: list[BulkError]
+
+
+class GetManyResult(pydantic.BaseModel, ty.Generic[T]):
+    items: list[T | None]  # In the order of the requested ids, None for the ones not found
+    not_found: list[int]
+
+
+# Analytics --------------------------------------------------------------------
+class RatingStats(pydantic.BaseModel):
+    id: int
+    count: int
+    mean: float
+    variance: float
+    percentiles: list[int]  # Values of the requested percentiles, in their order
+    histogram: list[int]  # Number of reviews of each rating of the analytics
+
+
+class RatingAnalytics(pydantic.BaseModel):
+    group: str
+    ratings: list[int]  # Ratings counted by the histograms
+    percentiles: list[float]
+    total: int  # Number of groups with reviews, `items` is a page of them by increasing id
+    items: list[RatingStats]
+
+
+# Status -----------------------------------------------------------------------
+class PoolStatus(pydantic.BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+
+
+class CacheStatus(pydantic.BaseModel):
+    enabled: bool
+    hits: int
+    misses: int
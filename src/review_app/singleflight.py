@@ -0,0 +1,125 @@
+"""Coalescing of concurrent identical reads of the database service (single-flight).
+
+While a read is in flight, the calls with the same key wait for it and share its result (or its
+error) instead of running the same query again. Nothing is kept once the read is done, this is not
+a cache: it only collapses the bursts of identical requests, e.g. thousands of clients asking for
+the same popular author at once.
+
+`SingleFlight` coalesces calls across the threads of the sync mode, `AsyncSingleFlight` across the
+tasks of the event loop in async mode. Set SINGLE_FLIGHT to `false` to disable both.
+"""
+
+import asyncio
+import os
+import threading
+import typing as ty
+from collections.abc import Awaitable, Callable, Hashable
+
+from review_app import metrics
+
+SINGLE_FLIGHT = os.getenv('SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes')
+
+R = ty.TypeVar('R')
+
+# Calls of the coalesced methods, `executed` ran the query and `coalesced` shared the result of another call
+CALLS = metrics.REGISTRY.counter(
+    'review_app_singleflight_calls_total',
+    'Calls of the coalesced database service reads by outcome.',
+    ('method', 'outcome'),
+)
+
+
+def make_key(name: str, *args: ty.Any, **kwargs: ty.Any) -> tuple[Hashable, ...]:
+    """Key of a call of the method `name`, its list arguments (e.g. ids) are compared by value."""
+
+    def hashable(value: ty.Any) -> Hashable:
+        return tuple(value) if isinstance(value, list) else value
+
+    return (name, *map(hashable, args), *sorted((key, hashable(value)) for key, value in kwargs.items()))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: ty.Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Coalesce the concurrent calls with the same key, across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def do(self, key: tuple[Hashable, ...], fn: Callable[[], R]) -> R:
+        """Return `fn()`, or the result of the call with the same `key` in flight. `key[0]` is
+        the name of the method in the metrics."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            CALLS.inc(key[0], 'coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        CALLS.inc(key[0], 'executed')
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def forget(self) -> None:
+        """Let the next calls run their own query instead of joining the ones in flight."""
+        with self._lock:
+            self._flights.clear()
+
+
+class AsyncSingleFlight:
+    """Coalesce the concurrent calls with the same key, across the tasks of an event loop.
+
+    The call runs in its own task that every caller awaits through `asyncio.shield`, so a caller
+    cancelled (e.g. its client went away) does not cancel the read the others are waiting for.
+    The call must then not depend on the caller starting it, e.g. on the session of its request.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future[ty.Any]] = {}
+
+    async def do(self, key: tuple[Hashable, ...], fn: Callable[[], Awaitable[R]]) -> R:
+        """Return `await fn()`, or the result of the call with the same `key` in flight. `key[0]`
+        is the name of the method in the metrics."""
+        loop = asyncio.get_running_loop()
+        loop_key = (loop, key)
+        task = self._flights.get(loop_key)
+        if task is None:
+            CALLS.inc(key[0], 'executed')
+            task = self._flights[loop_key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._done(loop_key, done))
+        else:
+            CALLS.inc(key[0], 'coalesced')
+        return await asyncio.shield(task)
+
+    def _done(self, loop_key: Hashable, task: asyncio.Future[ty.Any]) -> None:
+        if self._flights.get(loop_key) is task:
+            del self._flights[loop_key]
+        if not task.cancelled():
+            task.exception()  # Retrieved, even if every caller was cancelled
+
+    def forget(self) -> None:
+        """Let the next calls run their own query instead of joining the ones in flight."""
+        self._flights.clear()
+
+
+default_flights = SingleFlight() if SINGLE_FLIGHT else None
+default_async_flights = AsyncSingleFlight() if SINGLE_FLIGHT else None
@@ -1,57 +1,162 @@
-import os
+import functools
 import typing as ty
+from collections.abc import AsyncIterator
 
 import pytest
-from sqlalchemy import create_engine
+from anyio.from_thread import start_blocking_portal
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
 from testcontainers.postgres import PostgresContainer
 
+from review_app.database.async_service import AsyncDatabaseService
 from review_app.database.models import Base
-from test.database.initializer_helper import DatabaseItems, InitializationType
+from review_app.database.service import DatabaseService
+from test.database.initializer_helper import DatabaseItems, InitializationType, ScaleInitialization, Skew
 
 if ty.TYPE_CHECKING:
-    from sqlalchemy.engine import Engine
+    from anyio.from_thread import BlockingPortal
+    from sqlalchemy.engine import Connection, Engine
+    from sqlalchemy.ext.asyncio import AsyncEngine
 
-POSTGRES = PostgresContainer('postgres:16-alpine')
 
+def is_savepoint(statement: str) -> bool:
+    """Whether `statement` handles the savepoints of the test transactions, see `_isolate_database`."""
+    return statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+
+
+class QueryCounter:
+    """Context manager that counts the statements emitted through an engine."""
+
+    def __init__(self, engine: 'Engine'):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not is_savepoint(statement):
+            self.count += 1
+
+    def __enter__(self) -> 'QueryCounter':
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info: ty.Any) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+async def _collect(iterator: AsyncIterator[ty.Any]) -> list[ty.Any]:
+    return [item async for item in iterator]
 
-@pytest.fixture(scope='package', autouse=True)
-def _database_setup(request) -> 'Engine':
-    # setup code
-    POSTGRES.start()
 
-    def cleanup():
-        os.environ.pop('DATABASE_URL')
-        # teardown code
-        POSTGRES.stop()
+class BlockingServiceProxy:
+    """Exposes the coroutine methods of an `AsyncDatabaseService` as blocking calls run through an
+    anyio portal, so the same tests exercise both the sync and the async service. Async iterators
+    returned by the service are drained and returned as regular iterators."""
 
-    request.addfinalizer(cleanup)
+    def __init__(self, async_db_service: AsyncDatabaseService, portal: 'BlockingPortal'):
+        self._async_db_service = async_db_service
+        self._portal = portal
 
-    database_url = POSTGRES.get_connection_url()
-    os.environ['DATABASE_URL'] = database_url
+    def __getattr__(self, name: str) -> ty.Callable[..., ty.Any]:
+        method = getattr(self._async_db_service, name)
 
-    engine = create_engine(database_url)  # , connect_args={'check_same_thread': False}
-    # Base.metadata.create_all(engine)
+        def blocking_method(*args: ty.Any, **kwargs: ty.Any) -> ty.Any:
+            result = self._portal.call(functools.partial(method, *args, **kwargs))
+            if isinstance(result, AsyncIterator):
+                return iter(self._portal.call(_collect, result))
+            return result
 
-    return engine
+        return blocking_method
+
+
+@pytest.fixture(scope='package', autouse=True)
+def _database_setup() -> ty.Generator['Engine', None, None]:
+    """Engine of a Postgres container of its own. Each pytest-xdist worker is a process with its own
+    container, so workers never share a database and the tests run in parallel with `-n auto`."""
+    with PostgresContainer('postgres:16-alpine') as postgres:
+        engine = create_engine(postgres.get_connection_url())
+        # Created once, every test undoes its own writes, see `_isolate_database`
+        Base.metadata.create_all(engine)
+
+        yield engine
+
+        engine.dispose()
+
+
+def _needs_commits(request: pytest.FixtureRequest) -> bool:
+    """Whether the writes of a test must be committed, because they are read from connections
+    that don't see the transaction of the test: the async service, other threads or sessions
+    opened by the test itself (marked with `commits`)."""
+    callspec = getattr(request.node, 'callspec', None)
+    async_service = callspec is not None and callspec.params.get('db_service') == 'async'
+    return async_service or request.node.get_closest_marker('commits') is not None
 
 
 @pytest.fixture(autouse=True)
-def _wipe_database(_database_setup: 'Engine'):
-    # This is inneficient, but it's the simplest way to clear the database
-    Base.metadata.drop_all(_database_setup)
-    Base.metadata.create_all(_database_setup)
+def _isolate_database(
+    request: pytest.FixtureRequest, _database_setup: 'Engine'
+) -> ty.Generator['Connection | Engine', None, None]:
+    """Bind of the sessions of a test, which leaves the database empty afterwards.
+
+    Tests run inside a transaction rolled back at the end, their sessions commit to savepoints
+    of it. Tests that need actual commits get the engine instead, and every table is truncated
+    after them. Sequences are not transactional, so ids only restart at 1 after a truncate.
+    """
+    if _needs_commits(request):
+        yield _database_setup
+        with _database_setup.begin() as connection:
+            tables = ', '.join(table.name for table in Base.metadata.sorted_tables)
+            connection.exec_driver_sql(f'TRUNCATE {tables} RESTART IDENTITY CASCADE')
+        return
+
+    with _database_setup.connect() as connection:
+        transaction = connection.begin()
+        yield connection
+        transaction.rollback()
 
 
 @pytest.fixture
-def database_session(_database_setup: 'Engine') -> ty.Generator[Session, None, None]:
-    session = Session(_database_setup)
+def database_session(_isolate_database: 'Connection | Engine') -> ty.Generator[Session, None, None]:
+    session = Session(_isolate_database, join_transaction_mode='create_savepoint')
 
     yield session
 
     session.close()
 
 
+@pytest.fixture(scope='package')
+def _async_database_setup(
+    _database_setup: 'Engine',
+) -> ty.Generator[tuple['AsyncEngine', 'BlockingPortal'], None, None]:
+    with start_blocking_portal() as portal:
+        async_engine = create_async_engine(_database_setup.url.set(drivername='postgresql+asyncpg'))
+
+        yield async_engine, portal
+
+        portal.call(async_engine.dispose)
+
+
+@pytest.fixture(params=['sync', 'async'])
+def db_service(request: pytest.FixtureRequest, database_session: Session) -> ty.Generator[ty.Any, None, None]:
+    """Database service under test, every test using it runs against both the sync and the async service."""
+    if request.param == 'sync':
+        yield DatabaseService(database_session)
+        return
+
+    async_engine, portal = request.getfixturevalue('_async_database_setup')
+    async_session = AsyncSession(async_engine)
+
+    yield BlockingServiceProxy(AsyncDatabaseService(async_session), portal)
+
+    portal.call(async_session.close)
+
+
+@pytest.fixture
+def query_counter(_database_setup: 'Engine') -> QueryCounter:
+    return QueryCounter(_database_setup)
+
+
 @pytest.fixture
 def basic_database(database_session: Session) -> DatabaseItems:
     database_objects = InitializationType.BASIC.initialize()
@@ -95,3 +200,12 @@ def rich_database(database_session: Session) -> DatabaseItems:
     database_session.add_all(database_objects.to_list())
     database_session.commit()
     return database_objects
+
+
+@pytest.fixture
+def scale_database(database_session: Session) -> ScaleInitialization:
+    scale = InitializationType.SCALE(users=200, media=50, reviews=2000, skew=Skew.ZIPF, chunk_size=300)
+
+    scale.populate(database_session.connection())
+    database_session.commit()
+    return scale
@@ -1,8 +1,21 @@
+import csv
+import io
+import itertools
+import random
+import typing as ty
+from collections.abc import Iterator
 from dataclasses import dataclass, field
 from enum import UNIQUE, Enum, verify
 
+from sqlalchemy import Table, func, insert, select, update
+
 import review_app.database.models as models
 
+if ty.TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+
+Row = dict[str, ty.Any]
+
 
 @dataclass
 class DatabaseItems:
@@ -15,6 +28,18 @@ class DatabaseItems:
     def to_list(self):
         return self.users + self.media_types + self.authors + self.media + self.reviews
 
+    def compute_rating_aggregates(self) -> 'DatabaseItems':
+        """Fill the rating aggregates of the media, which the service keeps when creating reviews."""
+        for media in self.media:
+            media.rating_count = 0
+            media.rating_sum = 0
+        for review in self.reviews:
+            review.media.rating_count += 1
+            review.media.rating_sum += review.rating
+        for media in self.media:
+            media.rating_score = models.rating_score(media.rating_count, media.rating_sum)
+        return self
+
 
 def _empty_initialization() -> DatabaseItems:
     return DatabaseItems(users=[], media_types=[], authors=[], media=[], reviews=[])
@@ -92,6 +117,146 @@ def _rich_initialization() -> DatabaseItems:
     )
 
 
+class Skew(Enum):
+    """How the references of the generated rows (e.g. the media of the reviews) are spread."""
+
+    UNIFORM = 'uniform'
+    # The k-th row is referenced in proportion to 1 / k ** zipf_exponent, like the few popular media
+    # that gather most of the reviews in production
+    ZIPF = 'zipf'
+
+
+@dataclass
+class ScaleInitialization:
+    """Synthetic dataset of any size, streamed to the database in chunks of `chunk_size` rows instead
+    of being built as ORM objects, so memory stays flat however many reviews are generated.
+
+    The rows are added after the existing ones, with explicit ids, and the rating aggregates of the
+    media are computed in the database once the reviews are in. Counts may be given as floats,
+    e.g. `InitializationType.SCALE(users=1e6, media=1e5, reviews=1e7, skew=Skew.ZIPF)`.
+    """
+
+    users: int = 1000
+    media: int = 100
+    reviews: int = 10_000
+    authors: int = 10
+    media_types: int = 3
+    skew: Skew = Skew.ZIPF
+    zipf_exponent: float = 1.1
+    seed: int = 0
+    chunk_size: int = 10_000
+
+    def __post_init__(self):
+        for name in ('users', 'media', 'reviews', 'authors', 'media_types', 'chunk_size'):
+            setattr(self, name, int(getattr(self, name)))
+        self.skew = Skew(self.skew)
+
+    def populate(self, connection: 'Connection') -> None:
+        """Insert the dataset through `connection`, in its transaction."""
+        rng = random.Random(self.seed)
+        user_ids = self._new_ids(connection, models.User.__table__, self.users)
+        media_type_ids = self._new_ids(connection, models.MediaType.__table__, self.media_types)
+        author_ids = self._new_ids(connection, models.Author.__table__, self.authors)
+        media_ids = self._new_ids(connection, models.Media.__table__, self.media)
+        review_ids = self._new_ids(connection, models.Review.__table__, self.reviews)
+        pick_media_type = self._picker(rng, media_type_ids, Skew.UNIFORM)
+        pick_author = self._picker(rng, author_ids, self.skew)
+        pick_media = self._picker(rng, media_ids, self.skew)
+        pick_user = self._picker(rng, user_ids, self.skew)
+
+        self._load(
+            connection,
+            models.User.__table__,
+            ({'id': i, 'name': f'User {i}', 'age': rng.randint(12, 90)} for i in user_ids),
+        )
+        self._load(connection, models.MediaType.__table__, ({'id': i, 'name': f'Type {i}'} for i in media_type_ids))
+        self._load(
+            connection,
+            models.Author.__table__,
+            ({'id': i, 'name': f'Author {i}', 'alive': i % 3 != 0} for i in author_ids),
+        )
+        self._load(
+            connection,
+            models.Media.__table__,
+            (
+                {'id': i, 'title': f'Media {i}', 'media_type_id': next(pick_media_type), 'author_id': next(pick_author)}
+                for i in media_ids
+            ),
+        )
+        self._load(
+            connection,
+            models.Review.__table__,
+            (
+                {
+                    'id': i,
+                    'media_id': next(pick_media),
+                    'user_id': next(pick_user),
+                    'rating': rng.randint(1, 5),
+                    'review': f'Review {i}',
+                }
+                for i in review_ids
+            ),
+        )
+
+        # Rating aggregates of the generated media, as maintained by the service
+        generated_media = models.Media.id.between(media_ids.start, media_ids.stop - 1)
+        media_reviews = select().select_from(models.Review).where(models.Review.media_id == models.Media.id)
+        connection.execute(
+            update(models.Media)
+            .where(generated_media)
+            .values(
+                rating_count=media_reviews.add_columns(func.count()).scalar_subquery(),
+                rating_sum=media_reviews.add_columns(
+                    func.coalesce(func.sum(models.Review.rating), 0)
+                ).scalar_subquery(),
+            )
+        )
+        connection.execute(
+            update(models.Media)
+            .where(generated_media)
+            .values(rating_score=models.rating_score(models.Media.rating_count, models.Media.rating_sum))
+        )
+
+        if connection.dialect.name == 'postgresql':
+            # The ids were given explicitly, the sequences must continue after them
+            for model in (models.User, models.MediaType, models.Author, models.Media, models.Review):
+                table = model.__table__
+                last_id = select(func.max(table.c.id)).scalar_subquery()
+                connection.execute(select(func.setval(func.pg_get_serial_sequence(table.name, 'id'), last_id)))
+
+    @staticmethod
+    def _new_ids(connection: 'Connection', table: Table, count: int) -> range:
+        """`count` ids following the ones of the rows already in `table`."""
+        first_id = connection.scalar(select(func.coalesce(func.max(table.c.id), 0))) + 1
+        return range(first_id, first_id + count)
+
+    def _picker(self, rng: random.Random, ids: range, skew: Skew) -> Iterator[int | None]:
+        """Endless ids drawn from `ids` with `skew`, None if there are none. Only the cumulative
+        weights are kept, their size is the number of ids, not of the rows referencing them."""
+        if not ids:
+            return itertools.repeat(None)
+        if skew is Skew.UNIFORM:
+            return (rng.choice(ids) for _ in itertools.count())
+        cum_weights = list(itertools.accumulate(1 / rank**self.zipf_exponent for rank in range(1, len(ids) + 1)))
+        return itertools.chain.from_iterable(
+            rng.choices(ids, cum_weights=cum_weights, k=self.chunk_size) for _ in itertools.count()
+        )
+
+    def _load(self, connection: 'Connection', table: Table, rows: Iterator[Row]) -> None:
+        """Insert `rows` chunk by chunk, through `COPY` on psycopg2 and Core inserts elsewhere."""
+        copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+        while chunk := list(itertools.islice(rows, self.chunk_size)):
+            if not copy:
+                connection.execute(insert(table), chunk)
+                continue
+            columns = list(chunk[0])
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([row[column] for column in columns] for row in chunk)
+            buffer.seek(0)
+            with connection.connection.driver_connection.cursor() as cursor:
+                cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
 # This is a pattern that just came up to me, It works great for this case,
 # but I am not sure if it's idiomatic or if it's a good idea to use it.
 @verify(UNIQUE)
@@ -101,6 +266,14 @@ class InitializationType(Enum):
     NOREVIEW = 'noreview'
     NOMEDIA = 'nomedia'
     RICH = 'rich'
+    SCALE = 'scale'
+
+    def __call__(self, **parameters: ty.Any) -> ScaleInitialization:
+        """Generator of a synthetic dataset sized by `parameters`, only for `SCALE`, whose rows are
+        streamed to the database by `ScaleInitialization.populate` rather than built by `initialize`."""
+        if self is not InitializationType.SCALE:
+            raise TypeError(f'{self} takes no parameters')
+        return ScaleInitialization(**parameters)
 
     def initialize(self) -> DatabaseItems:
         try:
@@ -113,4 +286,4 @@ class InitializationType(Enum):
             }[self]
         except KeyError:
             raise NotImplementedError(f'Initialization method for {self} not implemented') from None
-        return initialization_method()
+        return initialization_method().compute_rating_aggregates()
@@ -0,0 +1,97 @@
+"""Tests for the read replica routing of the database module.
+
+A second Postgres container plays the replica. It holds the schema but never receives the
+writes of the primary, simulating a replica lagging behind for ever: whatever a session
+reads from it tells whether the read was routed to the replica or to the primary.
+"""
+
+import typing as ty
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from testcontainers.postgres import PostgresContainer
+
+import review_app.schemas as pmodels
+from review_app.database import database
+from review_app.database.models import Base
+from review_app.database.service import DatabaseService, NotFoundError
+
+if ty.TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+    from test.database.initializer_helper import DatabaseItems
+
+# The sessions under test open their own connections, which only see committed data
+pytestmark = pytest.mark.commits
+
+
+@pytest.fixture(scope='module')
+def _replica_setup() -> ty.Generator['Engine', None, None]:
+    replica = PostgresContainer('postgres:16-alpine')
+    replica.start()
+    engine = create_engine(replica.get_connection_url())
+    Base.metadata.create_all(engine)
+
+    yield engine
+
+    engine.dispose()
+    replica.stop()
+
+
+@pytest.fixture
+def routing_session(
+    _database_setup: 'Engine', _replica_setup: 'Engine'
+) -> ty.Generator[database.RoutingSession, None, None]:
+    session = database.RoutingSession(bind=_database_setup, replicas=database.ReplicaPool([_replica_setup]))
+
+    yield session
+
+    session.close()
+
+
+def test_reads_go_to_replica(basic_database: 'DatabaseItems', routing_session: database.RoutingSession):
+    with pytest.raises(NotFoundError):
+        DatabaseService(routing_session).get_user(user_id=basic_database.users[0].id)
+
+
+def test_reads_after_write_go_to_primary(routing_session: database.RoutingSession):
+    db_service = DatabaseService(routing_session)
+    user = db_service.create_user(pmodels.UserCreate(name='John Doe', age=25))
+    assert db_service.get_user(user_id=user.id) == user
+
+
+def test_read_from_primary(basic_database: 'DatabaseItems', routing_session: database.RoutingSession):
+    token = database.read_from_primary.set(True)
+    try:
+        user = DatabaseService(routing_session).get_user(user_id=basic_database.users[0].id)
+    finally:
+        database.read_from_primary.reset(token)
+    assert user.id == basic_database.users[0].id
+
+
+def test_session_without_replicas_uses_primary(basic_database: 'DatabaseItems', _database_setup: 'Engine'):
+    with database.RoutingSession(bind=_database_setup) as session:
+        user = DatabaseService(session).get_user(user_id=basic_database.users[0].id)
+    assert user.id == basic_database.users[0].id
+
+
+def test_replica_pool_round_robin():
+    engines = [create_engine('sqlite://') for _ in range(3)]
+    replica_pool = database.ReplicaPool(engines)
+    assert [replica_pool.pick() for _ in range(6)] == engines * 2
+
+
+def test_replica_pool_least_connections():
+    engines = [create_engine('sqlite://', poolclass=QueuePool) for _ in range(2)]
+    replica_pool = database.ReplicaPool(engines, strategy='least_connections')
+    with engines[0].connect():
+        assert replica_pool.pick() is engines[1]
+    with engines[1].connect():
+        assert replica_pool.pick() is engines[0]
+
+
+@pytest.mark.parametrize(('engines', 'strategy'), [([], 'round_robin'), ([create_engine('sqlite://')], 'random')])
+def test_replica_pool_invalid(engines: list['Engine'], strategy: str):
+    with pytest.raises(ValueError):
+        database.ReplicaPool(engines, strategy=strategy)
@@ -0,0 +1,101 @@
+"""Check that the queries of the database service are served by indexes.
+
+The statements emitted by each service method are captured and explained against the
+Postgres container. Sequential scans are disabled for the session, so Postgres picks an
+index for every lookup that has one, and any remaining `Seq Scan` means a missing index.
+"""
+
+import typing as ty
+
+import pytest
+from sqlalchemy import event
+
+from review_app.database.service import DatabaseService
+from test.database.conftest import is_savepoint
+
+if ty.TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+
+    from test.database.initializer_helper import DatabaseItems
+
+
+class StatementRecorder:
+    """Context manager that records the statements, with their parameters, emitted through an engine."""
+
+    def __init__(self, engine: 'Engine'):
+        self.engine = engine
+        self.statements: list[tuple[str, ty.Any]] = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not is_savepoint(statement):
+            self.statements.append((statement, parameters))
+
+    def __enter__(self) -> 'StatementRecorder':
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info: ty.Any) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def _query_plans(session: 'Session', statements: list[tuple[str, ty.Any]]) -> list[str]:
+    connection = session.connection()
+    connection.exec_driver_sql('SET enable_seqscan = off')
+    return [
+        '\n'.join(connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).scalars())
+        for statement, parameters in statements
+    ]
+
+
+@pytest.mark.parametrize(
+    ('method', 'arguments', 'expected_index'),
+    [
+        ('get_user_reviews', lambda items: {'user_id': items.users[0].id}, 'ix_review_user_id_id'),
+        (
+            'get_user_reviews',
+            lambda items: {'user_id': items.users[0].id, 'limit': 1, 'after': items.reviews[0].id},
+            'ix_review_user_id_id',
+        ),
+        ('get_review', lambda items: {'review_id': items.reviews[0].id}, 'review_pkey'),
+        ('get_media', lambda items: {'media_id': items.media[0].id}, 'media_pkey'),
+        ('get_media_version', lambda items: {'media_id': items.media[0].id}, 'media_pkey'),
+        ('get_author_stats', lambda items: {'author_id': items.authors[1].id}, 'ix_media_author_id'),
+        ('get_author_version', lambda items: {'author_id': items.authors[1].id}, 'author_pkey'),
+        (
+            'get_author_highest_rated_media_version',
+            lambda items: {'author_id': items.authors[1].id},
+            'ix_media_author_id',
+        ),
+        ('get_media_type_by_name', lambda items: {'name': items.media_types[0].name}, 'ix_media_type_name'),
+        ('get_author_highest_rated_media', lambda items: {'author_id': items.authors[1].id}, 'ix_media_author_id'),
+        # Limits below the row estimates of the tables without statistics, which are sorted otherwise
+        ('get_top_rated_media', lambda items: {'limit': 10}, 'ix_media_rating_score'),
+        (
+            'get_top_rated_media',
+            lambda items: {'limit': 10, 'media_type_id': items.media_types[0].id},
+            'ix_media_media_type_id_rating_score',
+        ),
+        ('search_media', lambda items: {'query': 'rings'}, 'ix_media_title_search'),
+        ('search_reviews', lambda items: {'query': 'good book'}, 'ix_review_review_search'),
+    ],
+)
+def test_service_queries_use_indexes(
+    rich_database: 'DatabaseItems',
+    database_session: 'Session',
+    _database_setup: 'Engine',
+    method: str,
+    arguments: ty.Callable[['DatabaseItems'], dict[str, ty.Any]],
+    expected_index: str,
+):
+    kwargs = arguments(rich_database)
+    # Start from an empty identity map, like the session of a request
+    database_session.expunge_all()
+    db_service = DatabaseService(database_session)
+    with StatementRecorder(_database_setup) as recorder:
+        getattr(db_service, method)(**kwargs)
+    assert recorder.statements
+
+    plans = _query_plans(database_session, recorder.statements)
+    assert all('Seq Scan' not in plan for plan in plans), plans
+    assert any(expected_index in plan for plan in plans), plans
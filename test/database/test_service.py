@@ -1,162 +1,451 @@
+import asyncio
+import threading
+import time
 import typing as ty
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
 
+import review_app.database.models as models
 import review_app.schemas as pmodels
+from review_app import analytics, cache, main, singleflight
+from review_app.cache import LRUCache
+from review_app.database import database, service
+from review_app.database.async_service import AsyncDatabaseService
 from review_app.database.service import DatabaseService, NotFoundError
+from review_app.singleflight import AsyncSingleFlight, SingleFlight
+from test.database.conftest import QueryCounter
+from test.database.initializer_helper import DatabaseItems, ScaleInitialization
 
 if ty.TYPE_CHECKING:
-    from sqlalchemy.orm import Session
+    from sqlalchemy.engine import Connection, Engine
 
-    from test.database.initializer_helper import DatabaseItems
 
+@pytest.mark.commits
+def test_create_database_service_closes_session(
+    basic_database: 'DatabaseItems', _database_setup: 'Engine', monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(database, 'SessionLocal', sessionmaker(bind=_database_setup))
+    user_id = basic_database.users[0].id
+    checked_out = database.pool_status(_database_setup)['checked_out']
+    dependency = DatabaseService.create_database_service()
+    db_service = next(dependency)
+    db_service.get_user(user_id=user_id)
+    assert database.pool_status(_database_setup)['checked_out'] == checked_out + 1
+    dependency.close()
+    assert database.pool_status(_database_setup)['checked_out'] == checked_out
 
-def test_save_user(database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+
+def test_save_user(db_service: 'DatabaseService'):
     user = pmodels.UserCreate(name='John Doe', age=25)
     res_user = db_service.create_user(user)
     assert res_user.id is not None
     assert isinstance(res_user, pmodels.User)
 
 
-def test_get_user(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_bulk_create_users(db_service: 'DatabaseService'):
+    users = [pmodels.UserCreate(name=f'User {i}', age=20 + i) for i in range(5)]
+    users.append(users[0])
+    res = db_service.bulk_create_users(users)
+    assert res.errors == []
+    assert [user.name for user in res.created] == [user.name for user in users]
+    assert len({user.id for user in res.created}) == len(users)
+
+
+def test_bulk_create_users_sqlite():
+    """The ids are matched back to the rows, so SQLite inserts a batch in a single statement too."""
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    counter = QueryCounter(engine)
+    users = [pmodels.UserCreate(name=f'User {i % 10}', age=i) for i in range(100)]
+    with Session(engine) as session, counter:
+        res = DatabaseService(session).bulk_create_users(users)
+    assert counter.count == 1  # The INSERT, savepoints aside
+    assert [(user.name, user.age) for user in res.created] == [(user.name, user.age) for user in users]
+    with Session(engine) as session:
+        assert {user.id: (user.name, user.age) for user in res.created} == {
+            row.id: (row.name, row.age) for row in session.scalars(select(models.User))
+        }
+    engine.dispose()
+
+
+def test_get_user(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     user = basic_database.users[0]
-    db_service = DatabaseService(database_session)
     res_user = db_service.get_user(user_id=user.id)
     assert user.name == res_user.name
 
 
-def test_get_missing_user(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_missing_user(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_user(user_id=1)
 
 
-def test_get_user_reviews(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_user_many(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    user = basic_database.users[0]
+    res = db_service.get_user_many(user_ids=[user.id, 999, user.id])
+    assert res.items == [db_service.get_user(user_id=user.id), None, db_service.get_user(user_id=user.id)]
+    assert res.not_found == [999]
+
+
+def test_get_user_reviews(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     user = basic_database.users[0]
-    db_service = DatabaseService(database_session)
     res_reviews = db_service.get_user_reviews(user_id=user.id)
     assert len(res_reviews) == 1
     assert all(isinstance(review, pmodels.Review) for review in res_reviews)
 
 
-def test_get_user_reviews_missing_review(noreview_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_user_reviews_missing_review(noreview_database: 'DatabaseItems', db_service: 'DatabaseService'):
     user = noreview_database.users[0]
-    db_service = DatabaseService(database_session)
     res_reviews = db_service.get_user_reviews(user_id=user.id)
     assert len(res_reviews) == 0
 
 
-def test_get_user_reviews_missing_user(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_user_reviews_missing_user(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_user_reviews(user_id=1)
 
 
-def test_create_review(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_user_reviews_pagination(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    user = rich_database.users[0]
+    first_page = db_service.get_user_reviews(user_id=user.id, limit=1)
+    assert len(first_page) == 1
+    second_page = db_service.get_user_reviews(user_id=user.id, limit=1, after=first_page[0].id)
+    assert len(second_page) == 1
+    assert second_page[0].id > first_page[0].id
+    assert db_service.get_user_reviews(user_id=user.id, limit=1, after=second_page[0].id) == []
+
+
+def test_stream_user_reviews(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    user = rich_database.users[0]
+    res_reviews = list(db_service.stream_user_reviews(user_id=user.id, chunk_size=1))
+    assert res_reviews == db_service.get_user_reviews(user_id=user.id)
+    assert [review.id for review in res_reviews] == sorted(review.id for review in res_reviews)
+
+
+def test_stream_user_reviews_missing_user(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    with pytest.raises(NotFoundError):
+        db_service.stream_user_reviews(user_id=1)
+
+
+def test_create_review(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     user = basic_database.users[0]
     media = basic_database.media[0]
     review = pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=3, review='Too much water')
-    db_service = DatabaseService(database_session)
     res_review = db_service.create_review(review)
     assert res_review.id is not None
     assert isinstance(res_review, pmodels.Review)
 
 
-def test_get_review(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_create_review_updates_rating_aggregates(
+    basic_database: 'DatabaseItems', database_session: 'Session', db_service: 'DatabaseService'
+):
+    user = basic_database.users[0]
+    media = basic_database.media[0]
+    review = pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=3, review='Too much water')
+    db_service.create_review(review)
+    rating_count, rating_sum, rating_score = database_session.execute(
+        select(models.Media.rating_count, models.Media.rating_sum, models.Media.rating_score).where(
+            models.Media.id == media.id
+        )
+    ).one()
+    assert rating_count == 2
+    assert rating_sum == 5 + 3
+    assert rating_score == pytest.approx(models.rating_score(2, 5 + 3))
+
+
+def test_bulk_create_reviews(
+    basic_database: 'DatabaseItems',
+    database_session: 'Session',
+    db_service: 'DatabaseService',
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(DatabaseService, 'BULK_CHUNK_SIZE', 2)
+    user = basic_database.users[0]
+    media = basic_database.media[0]
+    reviews = [
+        pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=4, review='Good'),
+        pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=3, review='Fine'),
+        pmodels.ReviewCreate(media_id=media.id + 100, user_id=user.id, rating=1, review='Unknown media'),
+        pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=2, review='Meh'),
+    ]
+    res = db_service.bulk_create_reviews(reviews)
+    assert [error.index for error in res.errors] == [2]
+    assert [review.review for review in res.created] == ['Good', 'Fine', 'Meh']
+    assert all(isinstance(review, pmodels.Review) for review in res.created)
+    rating_count, rating_sum = database_session.execute(
+        select(models.Media.rating_count, models.Media.rating_sum).where(models.Media.id == media.id)
+    ).one()
+    assert rating_count == 1 + 3
+    assert rating_sum == 5 + 4 + 3 + 2
+
+
+def test_bulk_write_reviews(
+    basic_database: 'DatabaseItems', database_session: 'Session', db_service: 'DatabaseService'
+):
+    user = basic_database.users[0]
+    media = basic_database.media[0]
+    reviews = [
+        pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=4, review='Good'),
+        pmodels.ReviewCreate(media_id=media.id + 100, user_id=user.id, rating=1, review='Unknown media'),
+    ]
+    errors = db_service.bulk_write_reviews(reviews)
+    assert [error.index for error in errors] == [1]
+    rating_count = database_session.scalar(select(models.Media.rating_count).where(models.Media.id == media.id))
+    assert rating_count == 1 + 1
+    assert db_service.search_reviews(query='good')[0].media_id == media.id
+
+
+def test_get_review(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     review = basic_database.reviews[0]
-    db_service = DatabaseService(database_session)
     res_review = db_service.get_review(review_id=review.id)
     assert review.rating == res_review.rating
 
 
-def test_get_missing_review(empty_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_review_matches_orm_model(rich_database: 'DatabaseItems', database_session: 'Session'):
+    # Media without author, to cover the outer join of the fast path
+    media = models.Media(title='Anonymous', media_type=rich_database.media_types[0])
+    review = models.Review(media=media, user=rich_database.users[0], rating=3, review='Who wrote this?')
+    database_session.add(review)
+    database_session.commit()
     db_service = DatabaseService(database_session)
+    for sql_review in [*rich_database.reviews, review]:
+        database_session.refresh(sql_review)
+        assert db_service.get_review(review_id=sql_review.id) == pmodels.Review.model_validate(sql_review)
+
+
+def test_get_missing_review(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_review(review_id=1)
 
 
-def test_create_media(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_review_many(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    review_ids = [review.id for review in reversed(rich_database.reviews)] + [999]
+    res = db_service.get_review_many(review_ids=review_ids)
+    assert res.items[:-1] == [db_service.get_review(review_id=review_id) for review_id in review_ids[:-1]]
+    assert res.items[-1] is None
+    assert res.not_found == [999]
+
+
+def test_search_reviews(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    good, _, _, dense = rich_database.reviews
+    res = db_service.search_reviews(query='good')
+    assert {review.id for review in res} == {good.id, dense.id}
+    assert res[0] == db_service.get_review(review_id=res[0].id)
+    assert db_service.search_reviews(query='good dense') == [db_service.get_review(review_id=dense.id)]
+    assert db_service.search_reviews(query='?!') == []
+
+
+def test_search_reviews_ranks_and_paginates(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    user, media = rich_database.users[0], rich_database.media[2]
+    # Indexed on creation, ranked first with the most occurrences of the word
+    new_review = db_service.create_review(
+        pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=5, review='Books, books and more books')
+    )
+    res = db_service.search_reviews(query='book')
+    assert [review.id for review in res][0] == new_review.id
+    assert len(res) == 3
+    assert db_service.search_reviews(query='book', limit=2, offset=1) == res[1:]
+
+
+def test_create_media(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     media_type = basic_database.media_types[0]
     author = basic_database.authors[0]
     media = pmodels.MediaCreate(title='The Hobbit', media_type_id=media_type.id, author_id=author.id)
-    db_service = DatabaseService(database_session)
     res_media = db_service.create_media(media)
     assert res_media.id is not None
     assert isinstance(res_media, pmodels.Media)
 
 
-def test_get_media(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_bulk_create_media(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    media_type = basic_database.media_types[0]
+    author = basic_database.authors[0]
+    media = [
+        pmodels.MediaCreate(title='The Hobbit', media_type_id=media_type.id, author_id=author.id),
+        pmodels.MediaCreate(title='Unknown type', media_type_id=media_type.id + 100, author_id=author.id),
+        pmodels.MediaCreate(title='Anonymous', media_type_id=media_type.id, author_id=None),
+    ]
+    res = db_service.bulk_create_media(media)
+    assert [error.index for error in res.errors] == [1]
+    assert [item.title for item in res.created] == ['The Hobbit', 'Anonymous']
+    assert res.created[0].media_type.name == media_type.name
+    assert res.created[1].author is None
+
+
+def test_get_media(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     media = basic_database.media[0]
-    db_service = DatabaseService(database_session)
     res_media = db_service.get_media(media_id=media.id)
     assert media.title == res_media.title
 
 
-def test_get_missing_media(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_missing_media(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_media(media_id=1)
 
 
-def test_create_media_type(database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_media_many(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    media_ids = [media.id for media in reversed(rich_database.media)]
+    res = db_service.get_media_many(media_ids=media_ids)
+    assert res.items == [db_service.get_media(media_id=media_id) for media_id in media_ids]
+    assert res.not_found == []
+
+
+def test_search_media(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    lord_of_the_rings, _, hobbit = rich_database.media
+    assert db_service.search_media(query='HOBBIT') == [db_service.get_media(media_id=hobbit.id)]
+    # Stemmed, and every word must match
+    assert [media.id for media in db_service.search_media(query='lord ring')] == [lord_of_the_rings.id]
+    assert db_service.search_media(query='lord hobbit') == []
+    # Indexed on creation
+    media_type = rich_database.media_types[0]
+    new_media = db_service.create_media(
+        pmodels.MediaCreate(title='Rings of Power', media_type_id=media_type.id, author_id=None)
+    )
+    assert [media.id for media in db_service.search_media(query='rings')] == [lord_of_the_rings.id, new_media.id]
+    assert [media.id for media in db_service.search_media(query='rings', limit=1, offset=1)] == [new_media.id]
+
+
+def test_search_sqlite():
+    """The SQLite default of the app searches its FTS5 tables, the other tests run on Postgres."""
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        db_service = DatabaseService(session)
+        user = db_service.create_user(pmodels.UserCreate(name='John Doe', age=25))
+        media_type = db_service.create_media_type(pmodels.MediaTypeCreate(name='Book'))
+        titles = ['The Lord of the Rings', 'The Hobbit', 'Rings of Power']
+        media = [
+            db_service.create_media(pmodels.MediaCreate(title=title, media_type_id=media_type.id, author_id=None))
+            for title in titles
+        ]
+        bulk_media = db_service.bulk_create_media(
+            [pmodels.MediaCreate(title='Ring', media_type_id=media_type.id, author_id=None)]
+        )
+        review = db_service.create_review(
+            pmodels.ReviewCreate(media_id=media[1].id, user_id=user.id, rating=5, review='Dragons and rings')
+        )
+        # bm25 ranks the shorter titles first
+        assert [item.id for item in db_service.search_media(query='ring')] == [
+            bulk_media.created[0].id,
+            media[2].id,
+            media[0].id,
+        ]
+        assert db_service.search_media(query='lord "OR') == []
+        assert db_service.search_media(query='rings', limit=1, offset=1) == [media[2]]
+        assert db_service.search_reviews(query='dragon') == [review]
+    engine.dispose()
+
+
+def test_get_top_rated_media(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    lord_of_the_rings, silmarillion, hobbit = rich_database.media
+    res = db_service.get_top_rated_media()
+    assert [media.id for media in res] == [lord_of_the_rings.id, silmarillion.id]
+    assert res[0].rating_average == 4.5
+    assert res[0].rating_score == pytest.approx(models.rating_score(2, 9))
+    # Media without reviews rank at the prior mean
+    res = db_service.get_top_rated_media(min_reviews=0)
+    assert [media.id for media in res] == [lord_of_the_rings.id, silmarillion.id, hobbit.id]
+    assert res[2].rating_average is None
+    assert [media.id for media in db_service.get_top_rated_media(limit=1)] == [lord_of_the_rings.id]
+    assert db_service.get_top_rated_media(min_reviews=3) == []
+
+
+def test_get_top_rated_media_by_media_type(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    book, movie = rich_database.media_types[:2]
+    assert len(db_service.get_top_rated_media(media_type_id=book.id)) == 2
+    assert db_service.get_top_rated_media(media_type_id=movie.id) == []
+
+
+def test_top_rated_media_weights_the_number_of_reviews(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    user = basic_database.users[0]
+    media_type = basic_database.media_types[0]
+    single_review, many_reviews = db_service.bulk_create_media(
+        [pmodels.MediaCreate(title=title, media_type_id=media_type.id, author_id=None) for title in ('New', 'Classic')]
+    ).created
+    # A single perfect rating ranks below many almost perfect ones
+    reviews = [pmodels.ReviewCreate(media_id=single_review.id, user_id=user.id, rating=5, review='Perfect')]
+    reviews += [pmodels.ReviewCreate(media_id=many_reviews.id, user_id=user.id, rating=4, review='Great')] * 30
+    db_service.bulk_create_reviews(reviews)
+    top_ids = [media.id for media in db_service.get_top_rated_media()]
+    assert top_ids.index(many_reviews.id) < top_ids.index(single_review.id)
+
+
+def test_scale_database(scale_database: ScaleInitialization, database_session: Session, db_service: 'DatabaseService'):
+    reviews_per_media = dict(
+        database_session.execute(select(models.Review.media_id, func.count()).group_by(models.Review.media_id)).all()
+    )
+    assert sum(reviews_per_media.values()) == scale_database.reviews
+    assert database_session.scalar(select(func.count()).select_from(models.User)) == scale_database.users
+    # Zipf skew: the first media gathers far more reviews than an average one
+    first_media_id = database_session.scalar(select(func.min(models.Media.id)))
+    assert reviews_per_media[first_media_id] > 5 * scale_database.reviews / scale_database.media
+    # Aggregates of the generated media as kept by the service, rankings included
+    top_media = db_service.get_top_rated_media(limit=5)
+    assert [media.rating_count for media in top_media] == [reviews_per_media[media.id] for media in top_media]
+    # Sequences continue after the generated ids
+    user = db_service.create_user(pmodels.UserCreate(name='New', age=30))
+    assert user.id > database_session.scalar(select(func.max(models.User.id).filter(models.User.name != 'New')))
+
+
+def test_create_media_type(db_service: 'DatabaseService'):
     media_type = pmodels.MediaTypeCreate(name='book')
     res_media_type = db_service.create_media_type(media_type)
     assert res_media_type.id is not None
     assert isinstance(res_media_type, pmodels.MediaType)
 
 
-def test_get_media_type(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_media_type(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     media_type = basic_database.media_types[0]
-    db_service = DatabaseService(database_session)
     res_media_type = db_service.get_media_type(media_type_id=media_type.id)
     assert media_type.name == res_media_type.name
 
 
-def test_get_missing_media_type(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_missing_media_type(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_media_type(media_type_id=1)
 
 
-def test_get_media_type_by_name(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_media_type_by_name(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     media_type = basic_database.media_types[0]
-    db_service = DatabaseService(database_session)
     res_media_type = db_service.get_media_type_by_name(media_type.name)
     assert media_type.id == res_media_type.id
 
 
-def test_get_missing_media_type_by_name(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_missing_media_type_by_name(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_media_type_by_name('book')
 
 
-def test_create_author(database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_create_author(db_service: 'DatabaseService'):
     author = pmodels.AuthorCreate(name='J.R.R. Tolkien', alive=False)
     res_author = db_service.create_author(author)
     assert res_author.id is not None
     assert isinstance(res_author, pmodels.Author)
 
 
-def test_get_author(basic_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_author(basic_database: 'DatabaseItems', db_service: 'DatabaseService'):
     author = basic_database.authors[0]
-    db_service = DatabaseService(database_session)
     res_author = db_service.get_author(author_id=author.id)
     assert author.name == res_author.name
 
 
-def test_get_missing_author(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_missing_author(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_author(author_id=1)
 
 
-def test_get_author_highest_rated_media(rich_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_author_many(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    res = db_service.get_author_many(author_ids=[2, 1])
+    assert res.items == [None, None]
+    assert res.not_found == [2, 1]
+
+
+def test_get_author_highest_rated_media(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
     author = rich_database.authors[1]  # J.R.R. Tolkien
-    db_service = DatabaseService(database_session)
     res_media = db_service.get_author_highest_rated_media(author_id=author.id)
     # This should return the lord of the rings
     expected_media = rich_database.media[0]
@@ -165,21 +454,531 @@ def test_get_author_highest_rated_media(rich_database: 'DatabaseItems', database
     assert res_media.media_type_id == expected_media.media_type_id
 
 
-def test_get_author_highest_rated_media_no_review(noreview_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_author_highest_rated_media_after_review(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    author = rich_database.authors[1]  # J.R.R. Tolkien
+    user = rich_database.users[0]
+    hobbit = rich_database.media[2]
+    db_service.create_review(pmodels.ReviewCreate(media_id=hobbit.id, user_id=user.id, rating=5, review='Great!'))
+    res_media = db_service.get_author_highest_rated_media(author_id=author.id)
+    assert res_media.id == hobbit.id
+
+
+def test_get_author_highest_rated_media_no_review(noreview_database: 'DatabaseItems', db_service: 'DatabaseService'):
     author = noreview_database.authors[0]
-    db_service = DatabaseService(database_session)
     with pytest.raises(NotFoundError):
         db_service.get_author_highest_rated_media(author_id=author.id)
 
 
-def test_get_author_highest_rated_media_missing_author(empty_database: 'DatabaseItems', database_session: 'Session'):
-    db_service = DatabaseService(database_session)
+def test_get_author_highest_rated_media_missing_author(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
     with pytest.raises(NotFoundError):
         db_service.get_author_highest_rated_media(author_id=1)
 
 
-def test_get_author_highest_rated_media_no_media(nomedia_database: 'DatabaseItems', database_session: 'Session'):
+def test_get_author_highest_rated_media_no_media(nomedia_database: 'DatabaseItems', db_service: 'DatabaseService'):
     author = nomedia_database.authors[0]
-    db_service = DatabaseService(database_session)
     with pytest.raises(NotFoundError):
         db_service.get_author_highest_rated_media(author_id=author.id)
+
+
+def test_get_author_stats(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    lord_of_the_rings, silmarillion, hobbit = rich_database.media
+    author = rich_database.authors[1]  # J.R.R. Tolkien
+    stats = db_service.get_author_stats(author_id=author.id)
+    assert stats == pmodels.AuthorStats(
+        author_id=author.id,
+        works=3,
+        reviews=4,
+        rating_average=4.0,
+        rating_histogram=[0, 0, 1, 2, 1],
+        best_media=pmodels.MediaRating(
+            id=lord_of_the_rings.id, title='The Lord of the Rings', rating_count=2, rating_average=4.5
+        ),
+        worst_media=pmodels.MediaRating(
+            id=silmarillion.id, title='The Silmarillion', rating_count=2, rating_average=3.5
+        ),
+    )
+    # The works without reviews are never the worst
+    user = rich_database.users[0]
+    db_service.create_review(pmodels.ReviewCreate(media_id=hobbit.id, user_id=user.id, rating=1, review='Meh'))
+    stats = db_service.get_author_stats(author_id=author.id)
+    assert (stats.reviews, stats.rating_histogram) == (5, [1, 0, 1, 2, 1])
+    assert stats.worst_media is not None and stats.worst_media.id == hobbit.id
+
+
+def test_get_author_stats_no_review(noreview_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    author = noreview_database.authors[0]
+    stats = db_service.get_author_stats(author_id=author.id)
+    assert (stats.works, stats.reviews, stats.rating_average) == (1, 0, None)
+    assert stats.rating_histogram == [0] * 5
+    assert stats.best_media is None and stats.worst_media is None
+
+
+def test_get_author_stats_missing_author(empty_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    with pytest.raises(NotFoundError):
+        db_service.get_author_stats(author_id=1)
+
+
+def test_get_media_version(rich_database: 'DatabaseItems', database_session: 'Session', db_service: 'DatabaseService'):
+    media = rich_database.media[0]
+    version = db_service.get_media_version(media_id=media.id)
+    assert version.etag == f'"{media.id}.1.1.1"'
+    assert version.last_modified is not None
+    # The rating aggregates are not part of the media
+    user = rich_database.users[0]
+    review = pmodels.ReviewCreate(media_id=media.id, user_id=user.id, rating=1, review='Meh')
+    db_service.create_review(review)
+    db_service.bulk_write_reviews([review])
+    assert db_service.get_media_version(media_id=media.id) == version
+    # Its author is, updating it through the ORM increments its version
+    media.author.name = 'John Ronald Reuel Tolkien'
+    database_session.commit()
+    assert db_service.get_media_version(media_id=media.id).etag == f'"{media.id}.1.1.2"'
+    with pytest.raises(NotFoundError):
+        db_service.get_media_version(media_id=-1)
+
+
+def test_get_author_version(
+    basic_database: 'DatabaseItems', database_session: 'Session', db_service: 'DatabaseService'
+):
+    author = basic_database.authors[0]
+    assert db_service.get_author_version(author_id=author.id).etag == '"1"'
+    author.alive = not author.alive
+    database_session.commit()
+    assert db_service.get_author_version(author_id=author.id).etag == '"2"'
+    with pytest.raises(NotFoundError):
+        db_service.get_author_version(author_id=-1)
+
+
+def test_get_author_highest_rated_media_version(rich_database: 'DatabaseItems', db_service: 'DatabaseService'):
+    author = rich_database.authors[1]  # J.R.R. Tolkien
+    version = db_service.get_author_highest_rated_media_version(author_id=author.id)
+    assert version.last_modified is None
+    # Reviews change the version only when another media takes the first place
+    lord_of_the_rings, hobbit = rich_database.media[0], rich_database.media[2]
+    user = rich_database.users[0]
+    db_service.create_review(
+        pmodels.ReviewCreate(media_id=lord_of_the_rings.id, user_id=user.id, rating=5, review='Great!')
+    )
+    assert db_service.get_author_highest_rated_media_version(author_id=author.id) == version
+    db_service.create_review(pmodels.ReviewCreate(media_id=hobbit.id, user_id=user.id, rating=5, review='Great!'))
+    new_version = db_service.get_author_highest_rated_media_version(author_id=author.id)
+    assert new_version.etag.startswith(f'"{hobbit.id}.')
+    assert db_service.get_author_highest_rated_media(author_id=author.id).id == hobbit.id
+    with pytest.raises(NotFoundError):
+        db_service.get_author_highest_rated_media_version(author_id=-1)
+
+
+@pytest.mark.parametrize(
+    ('group', 'expected'),
+    [
+        ('media', [(0, [0, 1, 1]), (1, [1, 1, 0])]),
+        ('author', [(1, [1, 2, 1])]),
+        ('media_type', [(0, [1, 2, 1])]),
+        ('user', [(0, [0, 1, 1]), (1, [1, 1, 0])]),
+    ],
+)
+def test_get_rating_analytics(
+    rich_database: 'DatabaseItems', db_service: 'DatabaseService', group: str, expected: list[tuple[int, list[int]]]
+):
+    items = {
+        'media': rich_database.media,
+        'author': rich_database.authors,
+        'media_type': rich_database.media_types,
+        'user': rich_database.users,
+    }[group]
+    result = db_service.get_rating_analytics(group=group, percentiles=[50, 100])
+    # From the lowest to the highest rating given
+    assert (result.group, result.ratings, result.total) == (group, [3, 4, 5], len(expected))
+    assert [(item.id, item.histogram) for item in result.items] == [
+        (items[index].id, histogram) for index, histogram in expected
+    ]
+    for item in result.items:
+        ratings = [rating for rating, count in zip(result.ratings, item.histogram, strict=True) for _ in range(count)]
+        assert item.count == len(ratings)
+        assert item.mean == pytest.approx(sum(ratings) / len(ratings))
+        assert item.percentiles[1] == max(ratings)
+    page = db_service.get_rating_analytics(group=group, percentiles=[50, 100], limit=1, offset=1)
+    assert (page.total, page.items) == (result.total, result.items[1:2])
+
+
+def _check_rating_histograms(connection: 'Connection', chunk_size: int) -> None:
+    """The histograms of the reviews by media and by user, read in chunks, are the ones of all the reviews."""
+    reviews = connection.execute(select(models.Review.media_id, models.Review.user_id, models.Review.rating)).all()
+    histograms = analytics.load_rating_histograms(connection, ['media', 'user'], chunk_size=chunk_size)
+    for group, column in (('media', 0), ('user', 1)):
+        expected = Counter((review[column], review[2]) for review in reviews)
+        got = histograms[group]
+        assert {
+            (group_id, rating): count
+            for group_id, row in zip(got.ids.tolist(), got.counts.tolist(), strict=True)
+            for rating, count in zip(got.ratings.tolist(), row, strict=True)
+            if count
+        } == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100_000])
+def test_load_rating_histograms(database_session: 'Session', chunk_size: int):
+    """Read with a binary COPY on Postgres with psycopg2."""
+    ScaleInitialization(users=20, media=5, reviews=50, authors=2, media_types=2).populate(database_session.connection())
+    _check_rating_histograms(database_session.connection(), chunk_size)
+
+
+def test_load_rating_histograms_sqlite():
+    """Read from a streamed query by the other drivers."""
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        ScaleInitialization(users=20, media=5, reviews=50, authors=2, media_types=2).populate(connection)
+        _check_rating_histograms(connection, chunk_size=7)
+    engine.dispose()
+
+
+# Query counts -----------------------------------------------------------------
+# Every read must load the nested response shape eagerly, so the number of statements
+# emitted has to stay constant no matter how many rows are involved.
+def _seed_reviews(session: 'Session', n_reviews: int) -> models.Review:
+    """Create `n_reviews` reviews of the same user, each one on a different media of the same author."""
+    user = models.User(name='John Doe', age=25)
+    media_type = models.MediaType(name='Book')
+    author = models.Author(name='Jane Smith', alive=True)
+    reviews = [
+        models.Review(
+            media=models.Media(title=f'Book {i}', media_type=media_type, author=author),
+            user=user,
+            rating=i % 5 + 1,
+            review=f'Review {i}',
+        )
+        for i in range(n_reviews)
+    ]
+    items = DatabaseItems(users=[user], media_types=[media_type], authors=[author], reviews=reviews)
+    items.media = [review.media for review in reviews]
+    session.add_all(items.compute_rating_aggregates().to_list())
+    session.commit()
+    review = reviews[-1]
+    session.refresh(review)
+    session.refresh(review.media)
+    # Start from an empty identity map so nothing is served without hitting the database
+    session.expunge_all()
+    return review
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_get_user_reviews_query_count(database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int):
+    review = _seed_reviews(database_session, n_reviews)
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        res_reviews = db_service.get_user_reviews(user_id=review.user_id)
+    assert len(res_reviews) == n_reviews
+    # One statement to check that the user exists, one for the reviews
+    assert query_counter.count == 2
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_get_review_query_count(database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int):
+    review = _seed_reviews(database_session, n_reviews)
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        db_service.get_review(review_id=review.id)
+    assert query_counter.count == 1
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_get_media_query_count(database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int):
+    review = _seed_reviews(database_session, n_reviews)
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        db_service.get_media(media_id=review.media_id)
+    assert query_counter.count == 1
+
+
+@pytest.mark.parametrize(('chunk_size', 'expected_count'), [(1000, 1), (10, 3)])
+def test_get_many_query_count(
+    database_session: 'Session',
+    query_counter: 'QueryCounter',
+    monkeypatch: pytest.MonkeyPatch,
+    chunk_size: int,
+    expected_count: int,
+):
+    _seed_reviews(database_session, 30)
+    monkeypatch.setattr(DatabaseService, 'BULK_CHUNK_SIZE', chunk_size)
+    db_service = DatabaseService(database_session)
+    for model, get_many in ((models.Review, db_service.get_review_many), (models.Media, db_service.get_media_many)):
+        ids = database_session.scalars(select(model.id)).all()
+        with query_counter:
+            res = get_many(ids)
+        assert len(res.items) == 30
+        assert not res.not_found
+        # One statement per chunk of ids, related rows included
+        assert query_counter.count == expected_count
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_search_query_count(database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int):
+    _seed_reviews(database_session, n_reviews)
+    db_service = DatabaseService(database_session)
+    for search, query in ((db_service.search_media, 'book'), (db_service.search_reviews, 'review')):
+        with query_counter:
+            res = search(query=query, limit=100)
+        assert len(res) == n_reviews
+        assert query_counter.count == 1
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_get_author_highest_rated_media_query_count(
+    database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int
+):
+    review = _seed_reviews(database_session, n_reviews)
+    author_id = review.media.author_id
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        db_service.get_author_highest_rated_media(author_id=author_id)
+    assert query_counter.count == 1
+
+
+def test_version_lookups_query_count(database_session: 'Session', query_counter: 'QueryCounter'):
+    review = _seed_reviews(database_session, 1)
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        db_service.get_media_version(media_id=review.media_id)
+        db_service.get_author_version(author_id=review.media.author_id)
+        db_service.get_author_highest_rated_media_version(author_id=review.media.author_id)
+    assert query_counter.count == 3
+
+
+@pytest.mark.parametrize('n_reviews', [1, 30])
+def test_get_author_stats_query_count(database_session: 'Session', query_counter: 'QueryCounter', n_reviews: int):
+    review = _seed_reviews(database_session, n_reviews)
+    db_service = DatabaseService(database_session)
+    with query_counter:
+        stats = db_service.get_author_stats(author_id=review.media.author_id)
+    assert (stats.works, stats.reviews) == (n_reviews, n_reviews)
+    assert query_counter.count == 1
+
+
+def test_bulk_write_reviews_locks_media_by_id(database_session: 'Session', _database_setup: 'Engine'):
+    review = _seed_reviews(database_session, 3)
+    media_ids = database_session.scalars(select(models.Media.id).order_by(models.Media.id.desc())).all()
+    updates = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.startswith('UPDATE media'):
+            updates.append(parameters)
+
+    event.listen(_database_setup, 'before_cursor_execute', on_execute)
+    try:
+        DatabaseService(database_session).bulk_write_reviews(
+            [
+                pmodels.ReviewCreate(media_id=media_id, user_id=review.user_id, rating=4, review='Good')
+                for media_id in media_ids
+            ]
+        )
+    finally:
+        event.remove(_database_setup, 'before_cursor_execute', on_execute)
+    # Whatever the order of the reviews
+    assert [parameters['media_id'] for parameters in updates[0]] == sorted(media_ids)
+
+
+def test_cached_author_stats_are_invalidated(database_session: 'Session', query_counter: 'QueryCounter'):
+    review = _seed_reviews(database_session, 2)
+    media = review.media
+    db_service = DatabaseService(database_session, cache=LRUCache(), cache_author_stats=True)
+    stats = db_service.get_author_stats(author_id=media.author_id)
+    with query_counter:
+        assert db_service.get_author_stats(author_id=media.author_id) == stats
+    assert query_counter.count == 0
+
+    new_review = pmodels.ReviewCreate(media_id=media.id, user_id=review.user_id, rating=1, review='Meh')
+    db_service.create_review(new_review)
+    assert db_service.get_author_stats(author_id=media.author_id).reviews == 3
+    db_service.bulk_create_reviews([new_review, new_review])
+    assert db_service.get_author_stats(author_id=media.author_id).reviews == 5
+    db_service.bulk_write_reviews([new_review])
+    assert db_service.get_author_stats(author_id=media.author_id).reviews == 6
+    db_service.create_media(
+        pmodels.MediaCreate(title='Book', media_type_id=media.media_type_id, author_id=media.author_id)
+    )
+    db_service.bulk_create_media(
+        [pmodels.MediaCreate(title='Book', media_type_id=media.media_type_id, author_id=media.author_id)]
+    )
+    assert db_service.get_author_stats(author_id=media.author_id).works == 4
+
+
+@pytest.mark.commits
+def test_queued_reviews_invalidate_cached_author_stats(
+    database_session: 'Session', _database_setup: 'Engine', monkeypatch: pytest.MonkeyPatch
+):
+    review = _seed_reviews(database_session, 1)
+    author_id = review.media.author_id
+    lru_cache = LRUCache()
+    monkeypatch.setattr(database, 'SessionLocal', sessionmaker(bind=_database_setup))
+    monkeypatch.setattr(cache, 'default_cache', lru_cache)
+    monkeypatch.setattr(service, 'AUTHOR_STATS_CACHE', True)
+    db_service = DatabaseService(database_session, cache=lru_cache)
+    assert db_service.get_author_stats(author_id=author_id).reviews == 1
+    new_review = pmodels.ReviewCreate(media_id=review.media_id, user_id=review.user_id, rating=1, review='Meh')
+    assert asyncio.run(main._write_queued_reviews([new_review])) == []
+    assert db_service.get_author_stats(author_id=author_id).reviews == 2
+
+
+def test_cached_lookups_query_count(database_session: 'Session', query_counter: 'QueryCounter'):
+    review = _seed_reviews(database_session, 1)
+    db_service = DatabaseService(database_session, cache=LRUCache())
+    with query_counter:
+        for _ in range(2):
+            media = db_service.get_media(media_id=review.media_id)
+            db_service.get_media_type(media_type_id=media.media_type_id)
+            db_service.get_author(author_id=media.author_id)
+    # Only the first lookup of each entity reaches the database
+    assert query_counter.count == 3
+    assert (db_service.cache.hits, db_service.cache.misses) == (3, 3)
+
+
+def test_memoized_rating_analytics_query_count(
+    rich_database: 'DatabaseItems', database_session: 'Session', query_counter: 'QueryCounter'
+):
+    db_service = DatabaseService(database_session, histograms_memo=analytics.HistogramsMemo())
+    result = db_service.get_rating_analytics(group='media')
+    with query_counter:
+        pages = [db_service.get_rating_analytics(group='media', limit=1, offset=offset) for offset in range(3)]
+    # The next pages are sliced from the histograms of the first call, without any cache
+    assert query_counter.count == 0
+    assert [page.items for page in pages] == [result.items[:1], result.items[1:2], []]
+    assert {page.total for page in pages} == {result.total}
+
+
+def test_cached_missing_media_is_not_stored(empty_database: 'DatabaseItems', database_session: 'Session'):
+    lru_cache = LRUCache()
+    db_service = DatabaseService(database_session, cache=lru_cache)
+    with pytest.raises(NotFoundError):
+        db_service.get_media(media_id=1)
+    assert len(lru_cache) == 0
+    assert lru_cache.misses == 1
+
+
+@pytest.mark.commits
+@pytest.mark.parametrize('dependency_closes', [True, False])
+def test_streamed_reviews_return_their_connection(
+    database_session: 'Session', _database_setup: 'Engine', monkeypatch: pytest.MonkeyPatch, dependency_closes: bool
+):
+    """The stream closes its session itself, whenever the teardown of the dependency runs: after the
+    response, or before the stream starts with FastAPI before 0.118 (then as if it never closed)."""
+    user_id = _seed_reviews(database_session, 3).user_id
+    database_session.close()
+    monkeypatch.setattr(database, 'SessionLocal', sessionmaker(bind=_database_setup))
+    monkeypatch.setattr(database, 'ASYNC_MODE', False)
+    if not dependency_closes:
+        monkeypatch.setitem(
+            main.app.dependency_overrides,
+            main.get_database_service,
+            lambda: DatabaseService(database.SessionLocal()),
+        )
+    response = TestClient(main.app).get(f'/users/{user_id}/reviews', params={'stream': True})
+    assert len(response.text.splitlines()) == 3
+    assert database.pool_status(_database_setup)['checked_out'] == 0
+
+
+# Single-flight ----------------------------------------------------------------
+@pytest.mark.commits
+def test_concurrent_reads_are_coalesced(
+    database_session: 'Session', _database_setup: 'Engine', query_counter: 'QueryCounter'
+):
+    review = _seed_reviews(database_session, 5)
+    author_id = review.media.author_id
+    flights = SingleFlight()
+    n_callers = 8
+    coalesced_before = singleflight.CALLS.collect().get(('get_author_highest_rated_media', 'coalesced'), [0])[0]
+    release = threading.Event()
+
+    def hold_query(*args: ty.Any) -> None:
+        # Keep the first query in flight until every other caller waits for it
+        release.wait(timeout=10)
+
+    def read() -> pmodels.Media:
+        with Session(_database_setup) as session:
+            return DatabaseService(session, flights=flights).get_author_highest_rated_media(author_id=author_id)
+
+    event.listen(_database_setup, 'before_cursor_execute', hold_query)
+    try:
+        with query_counter, ThreadPoolExecutor(n_callers) as executor:
+            futures = [executor.submit(read) for _ in range(n_callers)]
+            while (
+                singleflight.CALLS.collect()[('get_author_highest_rated_media', 'coalesced')][0]
+                < coalesced_before + n_callers - 1
+            ):
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+    finally:
+        event.remove(_database_setup, 'before_cursor_execute', hold_query)
+    assert query_counter.count == 1
+    assert results == [results[0]] * n_callers
+    assert results[0].id == review.media_id
+
+
+@pytest.mark.commits
+def test_concurrent_async_reads_are_coalesced(database_session: 'Session', request: pytest.FixtureRequest):
+    review = _seed_reviews(database_session, 5)
+    author_id = review.media.author_id
+    async_engine, portal = request.getfixturevalue('_async_database_setup')
+    flights = AsyncSingleFlight()
+
+    async def read_concurrently() -> list[pmodels.Media]:
+        sessions = [AsyncSession(async_engine) for _ in range(8)]
+        try:
+            return await asyncio.gather(
+                *(
+                    AsyncDatabaseService(session, flights=flights).get_author_highest_rated_media(author_id=author_id)
+                    for session in sessions
+                )
+            )
+        finally:
+            for session in sessions:
+                await session.close()
+
+    query_counter = QueryCounter(async_engine.sync_engine)
+    with query_counter:
+        results = portal.call(read_concurrently)
+    assert query_counter.count == 1
+    assert [media.id for media in results] == [review.media_id] * 8
+
+
+@pytest.mark.commits
+def test_cancelled_async_leader_read(database_session: 'Session', request: pytest.FixtureRequest):
+    """A cancelled request closes its session, the read it started must not be shared from it."""
+    review = _seed_reviews(database_session, 5)
+    author_id = review.media.author_id
+    async_engine, portal = request.getfixturevalue('_async_database_setup')
+    flights = AsyncSingleFlight()
+
+    async def cancel_leader() -> pmodels.Media:
+        leader_session, follower_session = AsyncSession(async_engine), AsyncSession(async_engine)
+        try:
+            leader, follower = (
+                asyncio.ensure_future(
+                    AsyncDatabaseService(session, flights=flights).get_author_highest_rated_media(author_id=author_id)
+                )
+                for session in (leader_session, follower_session)
+            )
+            await asyncio.sleep(0)  # The follower waits for the read of the leader
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            await leader_session.close()  # As the request dependency does
+            return await follower
+        finally:
+            await follower_session.close()
+
+    assert portal.call(cancel_leader).id == review.media_id
+
+
+def test_commit_forgets_reads_in_flight(database_session: 'Session', monkeypatch: pytest.MonkeyPatch):
+    flights = SingleFlight()
+    monkeypatch.setattr(service, 'default_flights', flights)
+
+    def read() -> None:
+        database_session.add(models.User(name='John Doe', age=25))
+        database_session.commit()
+        # This read may have missed the commit, the calls made from now on must not join it
+        assert not flights._flights
+
+    flights.do(('read',), read)
@@ -0,0 +1,131 @@
+"""Tests for the NumPy rating analytics, without a database."""
+
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from review_app import analytics
+
+
+def _histograms(ratings_by_id: dict[int, list[int]]) -> analytics.RatingHistograms:
+    counter = analytics._HistogramCounter()
+    for group_id, ratings in ratings_by_id.items():
+        counter.add(np.full(len(ratings), group_id), np.array(ratings))
+    return counter.histograms()
+
+
+def test_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    ratings_by_id = {group_id: rng.integers(1, 6, size=rng.integers(1, 50)).tolist() for group_id in (3, 1, 7)}
+    histograms = _histograms(ratings_by_id)
+    assert histograms.ids.tolist() == [1, 3, 7]
+    percentiles = [0, 25, 50, 90, 100]
+    for row, group_id in enumerate(histograms.ids.tolist()):
+        ratings = np.array(ratings_by_id[group_id])
+        assert histograms.count()[row] == len(ratings)
+        assert histograms.mean()[row] == pytest.approx(ratings.mean())
+        assert histograms.variance()[row] == pytest.approx(ratings.var())
+        expected = np.percentile(ratings, percentiles, method='inverted_cdf')
+        assert histograms.percentiles(percentiles)[row].tolist() == expected.tolist()
+
+
+def test_counter_grows():
+    counter = analytics._HistogramCounter()
+    counter.add(np.array([2, 2]), np.array([3, 4]))
+    # Larger ids and ratings on both sides of the ones seen
+    counter.add(np.array([5, 0, 2]), np.array([1, 6, 3]))
+    counter.add(np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+    histograms = counter.histograms()
+    assert histograms.ids.tolist() == [0, 2, 5]
+    assert histograms.ratings.tolist() == [1, 2, 3, 4, 5, 6]
+    assert histograms.counts.tolist() == [[0, 0, 0, 0, 0, 1], [0, 0, 2, 1, 0, 0], [1, 0, 0, 0, 0, 0]]
+
+
+def test_counter_sparse_ids():
+    counter = analytics._HistogramCounter()
+    counter.add(np.array([10**12, 7]), np.array([1, 2]))
+    counter.add(np.array([10**9, 10**12]), np.array([2, 2]))
+    histograms = counter.histograms()
+    # A row by id seen, not by id up to the largest one
+    assert histograms.counts.shape == (3, 2)
+    assert histograms.ids.tolist() == [7, 10**9, 10**12]
+    assert histograms.counts.tolist() == [[0, 1], [0, 1], [1, 1]]
+
+
+def test_sum_by():
+    histograms = _histograms({1: [5, 4], 2: [1], 3: [2, 2]})
+    # Media 1 and 3 of author 10, media 2 without author
+    authors = histograms.sum_by(np.array([10, -1, 10]))
+    assert authors.ids.tolist() == [10]
+    assert authors.counts.tolist() == [[0, 2, 0, 1, 1]]
+
+
+def test_histograms_memo_expires():
+    now = 0.0
+    memo = analytics.HistogramsMemo(ttl=10, timer=lambda: now)
+    loads = []
+
+    def load() -> analytics.RatingHistograms:
+        loads.append(now)
+        return _histograms({1: [len(loads)]})
+
+    first = memo.get_or_load('media', load)
+    now = 9.0
+    assert memo.get_or_load('media', load) is first
+    memo.get_or_load('user', load)
+    now = 10.0
+    assert memo.get_or_load('media', load).counts.sum() == 1
+    assert loads == [0.0, 9.0, 10.0]
+
+
+def test_parse_percentiles():
+    assert analytics.parse_percentiles('50,99.9') == [50.0, 99.9]
+    for text in ('', '50,', '101', '-1', 'nan'):
+        with pytest.raises(ValueError):
+            analytics.parse_percentiles(text)
+
+
+def test_copy_reader():
+    reviews = [(1, 10, 5), (2, 20, 3), (1, 30, 4)]
+    data = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 4) + b'ext!'
+    for review in reviews:
+        data += struct.pack('>h', 3) + b''.join(struct.pack('>ii', 4, value) for value in review)
+    data += struct.pack('>h', -1)
+    chunks: list[analytics.ReviewChunk] = []
+    reader = analytics._CopyReader(chunks.append, chunk_size=2)
+    # Written in pieces unrelated to the rows
+    for start in range(0, len(data), 7):
+        reader.write(data[start : start + 7])
+    reader.close()
+    assert [len(chunk.rating) for chunk in chunks] == [2, 1]
+    columns = [np.concatenate(column).tolist() for column in zip(*chunks, strict=True)]
+    assert list(zip(*columns, strict=True)) == reviews
+
+
+def test_write_csv():
+    histograms = {'media': _histograms({1: [5, 4], 2: [4]})}
+    output = io.StringIO()
+    analytics.write_csv(histograms, [50, 90], output)
+    assert output.getvalue().splitlines() == [
+        'group,id,count,mean,variance,p50,p90,rating_4,rating_5',
+        'media,1,2,4.5,0.25,4,5,1,1',
+        'media,2,1,4.0,0.0,4,4,1,0',
+    ]
+
+
+def test_cli(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    loads = []
+
+    def load(groups, chunk_size):
+        loads.append((list(groups), chunk_size))
+        return {group: _histograms({1: [3]}) for group in groups}
+
+    monkeypatch.setattr(analytics, '_load', load)
+    output = tmp_path / 'ratings.csv'
+    analytics.main(['--group', 'author', '--group', 'user', '--percentiles', '50', '--output', str(output)])
+    assert loads == [(['author', 'user'], analytics.DEFAULT_CHUNK_SIZE)]
+    assert output.read_text().splitlines()[1:] == ['author,1,1,3.0,0.0,3,1', 'user,1,1,3.0,0.0,3,1']
+    with pytest.raises(SystemExit):
+        analytics.main(['--percentiles', '200'])
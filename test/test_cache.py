@@ -0,0 +1,128 @@
+"""Tests for the read-through cache backends."""
+
+import typing as ty
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from review_app import cache, schemas
+
+AUTHOR = schemas.Author(id=1, name='Ursula K. Le Guin', alive=False)
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the `redis.Redis` methods used by `RedisCache`."""
+
+    def __init__(self):
+        self.values: dict[str, bytes] = {}
+        self.expirations: dict[str, int] = {}
+
+    def get(self, key: str) -> bytes | None:
+        return self.values.get(key)
+
+    def set(self, key: str, value: str, px: int) -> None:
+        self.values[key] = value.encode()
+        self.expirations[key] = px
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def any_cache(request: ty.Any) -> cache.Cache:
+    if request.param == 'memory':
+        return cache.LRUCache()
+    return cache.RedisCache(FakeRedis())
+
+
+def test_get_or_load(any_cache: cache.Cache):
+    loads = []
+
+    def loader() -> schemas.Author:
+        loads.append(1)
+        return AUTHOR
+
+    assert any_cache.get_or_load('author:1', schemas.Author, loader) == AUTHOR
+    assert any_cache.get_or_load('author:1', schemas.Author, loader) == AUTHOR
+    assert len(loads) == 1
+    assert (any_cache.hits, any_cache.misses) == (1, 1)
+
+
+def test_get_or_load_counts_concurrent_calls(any_cache: cache.Cache):
+    any_cache.set('author:1', AUTHOR)
+
+    def load(index: int) -> schemas.Author:
+        return any_cache.get_or_load(f'author:{index % 2}', schemas.Author, lambda: AUTHOR)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(load, range(8000)))
+    assert any_cache.hits + any_cache.misses == 8000
+
+
+def test_get_or_load_error_is_not_cached(any_cache: cache.Cache):
+    def loader() -> schemas.Author:
+        raise LookupError
+
+    with pytest.raises(LookupError):
+        any_cache.get_or_load('author:1', schemas.Author, loader)
+    assert any_cache.get('author:1', schemas.Author) is None
+
+
+def test_delete(any_cache: cache.Cache):
+    any_cache.set('author:1', AUTHOR)
+    any_cache.delete('author:1', 'author:2')
+    assert any_cache.get('author:1', schemas.Author) is None
+
+
+def test_lru_cache_expiration():
+    timer = FakeTimer()
+    lru_cache = cache.LRUCache(ttl=10, timer=timer)
+    lru_cache.set('author:1', AUTHOR)
+    timer.now = 9.9
+    assert lru_cache.get('author:1', schemas.Author) == AUTHOR
+    timer.now = 10
+    assert lru_cache.get('author:1', schemas.Author) is None
+    assert len(lru_cache) == 0
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru_cache = cache.LRUCache(maxsize=2)
+    for author_id in range(1, 3):
+        lru_cache.set(f'author:{author_id}', AUTHOR)
+    lru_cache.get('author:1', schemas.Author)  # author:2 is now the least recently used
+    lru_cache.set('author:3', AUTHOR)
+    assert lru_cache.get('author:2', schemas.Author) is None
+    assert lru_cache.get('author:1', schemas.Author) == AUTHOR
+    assert len(lru_cache) == 2
+
+
+def test_redis_cache_stores_json_with_ttl():
+    client = FakeRedis()
+    redis_cache = cache.RedisCache(client, ttl=1.5, prefix='test:')
+    redis_cache.set('author:1', AUTHOR)
+    assert client.expirations == {'test:author:1': 1500}
+    assert schemas.Author.model_validate_json(client.values['test:author:1']) == AUTHOR
+
+
+@pytest.mark.parametrize(
+    ('backend', 'expected_type'),
+    [('memory', cache.LRUCache), ('none', type(None))],
+)
+def test_create_cache(monkeypatch: ty.Any, backend: str, expected_type: type):
+    monkeypatch.setenv('CACHE_BACKEND', backend)
+    assert isinstance(cache.create_cache(), expected_type)
+
+
+def test_create_cache_unknown_backend(monkeypatch: ty.Any):
+    monkeypatch.setenv('CACHE_BACKEND', 'memcached')
+    with pytest.raises(ValueError, match='memcached'):
+        cache.create_cache()
@@ -0,0 +1,129 @@
+"""Tests for the write-behind review ingestion queue."""
+
+import asyncio
+
+import pytest
+
+from review_app import ingestion, schemas
+
+
+def _review(index: int) -> schemas.ReviewCreate:
+    return schemas.ReviewCreate(media_id=1, user_id=1, rating=5, review=f'Review {index}')
+
+
+def _count(outcome: str) -> float:
+    return ingestion.REVIEWS.collect().get((outcome,), [0])[0]
+
+
+class RecordingWriter:
+    """Batch writer recording the batches, which waits for `release` before writing each of them.
+    The reviews with a text in `failing` are reported as errors."""
+
+    def __init__(self, failing: tuple[str, ...] = ()):
+        self.batches: list[list[schemas.ReviewCreate]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.failing = failing
+
+    async def __call__(self, reviews: list[schemas.ReviewCreate]) -> list[schemas.BulkError]:
+        await self.release.wait()
+        self.batches.append(reviews)
+        return [
+            schemas.BulkError(index=index, detail='violates foreign key constraint')
+            for index, review in enumerate(reviews)
+            if review.review in self.failing
+        ]
+
+
+def test_reviews_are_written_in_batches():
+    queue = ingestion.ReviewQueue(maxsize=100, batch_size=4)
+    writer = RecordingWriter()
+    written_before = _count('written')
+
+    async def main() -> list[str]:
+        queue.start(writer)
+        writer.release.clear()
+        # The first review is taken alone, the others build up while it is written
+        pending_ids = [await queue.submit(_review(0))]
+        await asyncio.sleep(0)
+        pending_ids += [await queue.submit(_review(index)) for index in range(1, 10)]
+        writer.release.set()
+        await queue.stop()
+        return pending_ids
+
+    pending_ids = asyncio.run(main())
+    assert len(set(pending_ids)) == 10
+    assert [len(batch) for batch in writer.batches] == [1, 4, 4, 1]
+    assert [review.review for batch in writer.batches for review in batch] == [f'Review {i}' for i in range(10)]
+    assert _count('written') == written_before + 10
+
+
+def test_full_queue_applies_backpressure():
+    queue = ingestion.ReviewQueue(maxsize=2, batch_size=10, put_timeout=0.01)
+    writer = RecordingWriter()
+    rejected_before = _count('rejected')
+
+    async def main() -> None:
+        queue.start(writer)
+        writer.release.clear()
+        await queue.submit(_review(0))
+        await asyncio.sleep(0)  # Taken by the worker, blocked writing it
+        await queue.submit(_review(1))
+        await queue.submit(_review(2))
+        with pytest.raises(ingestion.QueueFullError):
+            await queue.submit(_review(3))
+        # A submission waiting for room gets it once the worker takes the next batch
+        waiting = asyncio.ensure_future(asyncio.wait_for(queue.submit(_review(3)), 1))
+        await asyncio.sleep(0)
+        writer.release.set()
+        await waiting
+        await queue.stop()
+
+    asyncio.run(main())
+    assert _count('rejected') == rejected_before + 1
+    assert sum(len(batch) for batch in writer.batches) == 4
+
+
+def test_stop_writes_the_waiting_submissions():
+    queue = ingestion.ReviewQueue(maxsize=1, batch_size=10)
+    writer = RecordingWriter()
+
+    async def main() -> None:
+        queue.start(writer)
+        writer.release.clear()
+        await queue.submit(_review(0))
+        await asyncio.sleep(0)
+        await queue.submit(_review(1))
+        waiting = asyncio.ensure_future(queue.submit(_review(2)))
+        await asyncio.sleep(0)
+        stopping = asyncio.ensure_future(queue.stop())
+        await asyncio.sleep(0)
+        writer.release.set()
+        await asyncio.gather(waiting, stopping)
+        with pytest.raises(ingestion.QueueFullError):
+            await queue.submit(_review(3))
+
+    asyncio.run(main())
+    assert [review.review for batch in writer.batches for review in batch] == ['Review 0', 'Review 1', 'Review 2']
+
+
+def test_failed_writes_are_counted():
+    failed_before, written_before = _count('failed'), _count('written')
+
+    async def main(writer: ingestion.BatchWriter) -> None:
+        queue = ingestion.ReviewQueue(maxsize=10, batch_size=10)
+        queue.start(writer)
+        for index in range(3):
+            await queue.submit(_review(index))
+        await queue.stop()
+
+    asyncio.run(main(RecordingWriter(failing=('Review 1',))))
+    assert _count('failed') == failed_before + 1
+    assert _count('written') == written_before + 2
+
+    async def broken_writer(reviews: list[schemas.ReviewCreate]) -> list[schemas.BulkError]:
+        raise ConnectionError('database is down')
+
+    # The worker carries on after a batch fails as a whole
+    asyncio.run(main(broken_writer))
+    assert _count('failed') == failed_before + 4
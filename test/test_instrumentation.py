@@ -0,0 +1,103 @@
+"""Tests for the per-request SQL instrumentation, on an in-memory SQLite engine."""
+
+import logging
+import typing as ty
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine, text
+
+from review_app import instrumentation
+
+
+@pytest.fixture
+def engine() -> Engine:
+    engine = create_engine('sqlite://')
+    instrumentation.instrument_engine(engine)
+    return engine
+
+
+@pytest.fixture
+def app(engine: Engine) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(instrumentation.InstrumentationMiddleware)
+
+    @app.get('/items/{item_id}')
+    def read_item(item_id: int) -> dict[str, int]:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            connection.execute(text('SELECT :item_id'), {'item_id': item_id})
+        with instrumentation.measure_serialization():
+            return {'id': item_id}
+
+    return app
+
+
+def test_collect(engine: Engine):
+    with instrumentation.collect() as stats, engine.connect() as connection:
+        for _ in range(3):
+            connection.execute(text('SELECT 1'))
+    assert stats.queries == 3
+    assert stats.db_time > 0
+
+
+def test_statements_outside_collect_are_not_counted(engine: Engine):
+    with instrumentation.collect() as stats:
+        pass
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert stats.queries == 0
+
+
+def test_instrument_engine_twice(engine: Engine):
+    instrumentation.instrument_engine(engine)
+    with instrumentation.collect() as stats, engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert stats.queries == 1
+
+
+def test_server_timing_header(app: FastAPI):
+    response = TestClient(app).get('/items/1')
+    assert response.status_code == 200
+    metrics = {metric.split(';')[0]: metric for metric in response.headers['Server-Timing'].split(', ')}
+    assert set(metrics) == {'db', 'serialization', 'total'}
+    assert 'desc="2 queries"' in metrics['db']
+
+
+def test_request_log(app: FastAPI, caplog: pytest.LogCaptureFixture):
+    with caplog.at_level(logging.INFO, logger=instrumentation.__name__):
+        TestClient(app).get('/items/1')
+    requests: list[ty.Any] = [record for record in caplog.records if record.getMessage().startswith('request ')]
+    assert [(record.route, record.status_code, record.queries) for record in requests] == [('/items/{item_id}', 200, 2)]
+
+
+def test_slow_query_log(app: FastAPI, caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_THRESHOLD_MS', 0)
+    with caplog.at_level(logging.WARNING, logger=instrumentation.__name__):
+        TestClient(app).get('/items/7')
+    slow_queries: list[ty.Any] = [record for record in caplog.records if record.getMessage().startswith('slow query')]
+    assert [record.statement for record in slow_queries] == ['SELECT 1', 'SELECT ?']
+    # Not logged unless asked to
+    assert slow_queries[1].parameters is None
+    assert all(record.route == '/items/{item_id}' for record in slow_queries)
+
+
+def test_slow_query_log_is_bounded(engine: Engine, caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_THRESHOLD_MS', 0)
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_LOG_PARAMETERS', True)
+    with caplog.at_level(logging.WARNING, logger=instrumentation.__name__), engine.connect() as connection:
+        connection.execute(text('CREATE TABLE item (name TEXT)'))
+        connection.execute(text('INSERT INTO item VALUES (:name)'), [{'name': 'x' * 1000} for _ in range(100)])
+        connection.execute(text('SELECT ' + ', '.join(['1'] * 1000)))
+    insert, select = caplog.records[1:]
+    assert (insert.rows, select.rows) == (100, None)
+    assert len(insert.parameters) <= instrumentation.MAX_STATEMENT_LENGTH + len('...')
+    assert len(select.statement) == instrumentation.MAX_STATEMENT_LENGTH + len('...')
+
+
+def test_slow_query_log_disabled(engine: Engine, caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_THRESHOLD_MS', -1)
+    with caplog.at_level(logging.WARNING, logger=instrumentation.__name__), engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert not caplog.records
@@ -12,15 +12,19 @@ simulate requests to the API."""
 
 import typing as ty
 from dataclasses import dataclass
+from datetime import datetime
 from enum import Enum
 from unittest.mock import MagicMock, create_autospec
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 import review_app.main as main
 from review_app import schemas
-from review_app.database import service
+from review_app.cache import LRUCache
+from review_app.database import async_service, service
 
 client = TestClient(main.app)
 
@@ -45,9 +49,13 @@ class MockedResult:
     description: str = ''
 
 
-@pytest.fixture
-def mock_db_service():
-    database_service = create_autospec(service.DatabaseService, instance=True)
+@pytest.fixture(params=['sync', 'async'])
+def mock_db_service(request: ty.Any, monkeypatch: ty.Any):
+    """Mock of the database service, every test runs against both the sync and the async mode."""
+    async_mode = request.param == 'async'
+    monkeypatch.setattr(main.database, 'ASYNC_MODE', async_mode)
+    service_class = async_service.AsyncDatabaseService if async_mode else service.DatabaseService
+    database_service = create_autospec(service_class, instance=True)
     return database_service
 
 
@@ -60,9 +68,7 @@ def patch_db_service(monkeypatch: ty.Any, mock_db_service: MagicMock):
     def database_service_creator():
         return mock_db_service
 
-    monkeypatch.setitem(
-        main.app.dependency_overrides, main.service.DatabaseService.create_database_service, database_service_creator
-    )
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_database_service, database_service_creator)
 
 
 @pytest.fixture
@@ -70,7 +76,7 @@ def patch_db_create_user(mock_db_service: MagicMock):
     def create_user(user: schemas.UserCreate) -> schemas.User:
         return schemas.User(id=1, **user.model_dump())
 
-    mock_db_service.create_user = create_user
+    mock_db_service.create_user.side_effect = create_user
     return MockedResult(status=MockStatus.DYNAMIC, mock_function=create_user)
 
 
@@ -108,6 +114,35 @@ def patch_db_get_user_reviews(request: ty.Any, mock_db_service: MagicMock):
         return MockedResult(status=MockStatus.ERROR, error=error, description='User not found')
 
 
+async def _async_iter(items: list[ty.Any]) -> ty.AsyncIterator[ty.Any]:
+    for item in items:
+        yield item
+
+
+@pytest.fixture(params=['success', 'not_found'])
+def patch_db_stream_user_reviews(request: ty.Any, mock_db_service: MagicMock):
+    if request.param == 'success':
+        user = schemas.User(id=1, name='John Doe', age=25)
+        media_type = schemas.MediaType(id=1, name='Game')
+        media = schemas.Media(
+            id=1, title='Pokemon', media_type_id=1, author_id=None, media_type=media_type, author=None
+        )
+        stream_user_reviews = [
+            schemas.Review(id=i, media_id=1, user_id=1, rating=3, review='Too much water', media=media, user=user)
+            for i in range(1, 4)
+        ]
+        mock_db_service.stream_user_reviews.return_value = (
+            _async_iter(stream_user_reviews) if main.database.ASYNC_MODE else iter(stream_user_reviews)
+        )
+        # Closed by the stream once it is sent
+        mock_db_service.session = create_autospec(AsyncSession if main.database.ASYNC_MODE else Session, instance=True)
+        return MockedResult(status=MockStatus.SUCCESS, result=stream_user_reviews, description='User has reviews')
+    else:
+        error = service.NotFoundError('User not found')
+        mock_db_service.stream_user_reviews.side_effect = error
+        return MockedResult(status=MockStatus.ERROR, error=error, description='User not found')
+
+
 # Tests -----------------------------------------------------------------------
 # User ------------------------------------------------------------------------
 def test_create_user(patch_db_create_user: MockedResult):
@@ -120,6 +155,20 @@ def test_create_user(patch_db_create_user: MockedResult):
     assert created_user.age == 25
 
 
+def test_bulk_create_users(mock_db_service: MagicMock):
+    def bulk_create_users(users: list[schemas.UserCreate]) -> schemas.BulkResult[schemas.User]:
+        created = [schemas.User(id=i, **user.model_dump()) for i, user in enumerate(users[1:], start=1)]
+        return schemas.BulkResult[schemas.User](created=created, errors=[schemas.BulkError(index=0, detail='error')])
+
+    mock_db_service.bulk_create_users.side_effect = bulk_create_users
+    users = [schemas.UserCreate(name=f'User {i}', age=20) for i in range(3)]
+    response = client.post('/users/bulk', json=[user.model_dump() for user in users])
+    assert response.status_code == 200
+    result = schemas.BulkResult[schemas.User](**response.json())
+    assert len(result.created) == 2
+    assert result.errors[0].index == 0
+
+
 def test_read_user(patch_db_get_user: MockedResult):
     response = client.get('/users/1')
     if patch_db_get_user.status == MockStatus.SUCCESS:
@@ -145,13 +194,54 @@ def test_read_user_reviews(patch_db_get_user_reviews: MockedResult):
         assert response.status_code == 404
 
 
+def test_read_user_reviews_pagination(mock_db_service: MagicMock):
+    mock_db_service.get_user_reviews.return_value = []
+    response = client.get('/users/1/reviews', params={'limit': 10, 'after': 5})
+    assert response.status_code == 200
+    mock_db_service.get_user_reviews.assert_called_once_with(user_id=1, limit=10, after=5)
+
+
+@pytest.mark.parametrize('limit', [0, 1001])
+def test_read_user_reviews_invalid_limit(limit: int):
+    response = client.get('/users/1/reviews', params={'limit': limit})
+    assert response.status_code == 422
+
+
+def test_read_user_many(mock_db_service: MagicMock):
+    user = schemas.User(id=1, name='John Doe', age=25)
+    mock_db_service.get_user_many.return_value = schemas.GetManyResult[schemas.User](items=[user, None], not_found=[2])
+    response = client.get('/users', params={'ids': '1,2'})
+    assert response.status_code == 200
+    assert response.json() == {'items': [user.model_dump(), None], 'not_found': [2]}
+    mock_db_service.get_user_many.assert_called_once_with(user_ids=[1, 2])
+
+
+@pytest.mark.parametrize('path', ['/users', '/media', '/reviews', '/authors'])
+@pytest.mark.parametrize('ids', ['', '1,a', '1,,2', ','.join(['1'] * (main.MAX_IDS + 1))])
+def test_read_many_invalid_ids(path: str, ids: str):
+    response = client.get(path, params={'ids': ids})
+    assert response.status_code == 422
+
+
+def test_read_user_reviews_stream(patch_db_stream_user_reviews: MockedResult, mock_db_service: MagicMock):
+    response = client.get('/users/1/reviews', params={'stream': True})
+    if patch_db_stream_user_reviews.status == MockStatus.SUCCESS:
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        reviews = [schemas.Review.model_validate_json(line) for line in response.text.splitlines()]
+        assert reviews == patch_db_stream_user_reviews.result
+        mock_db_service.session.close.assert_called_once_with()
+    else:
+        assert response.status_code == 404
+
+
 # MediaType --------------------------------------------------------------------
 @pytest.fixture
 def patch_db_create_media_type(mock_db_service: MagicMock):
     def create_media_type(media_type: schemas.MediaTypeCreate) -> schemas.MediaType:
         return schemas.MediaType(id=1, **media_type.model_dump())
 
-    mock_db_service.create_media_type = create_media_type
+    mock_db_service.create_media_type.side_effect = create_media_type
     return MockedResult(status=MockStatus.DYNAMIC, mock_function=create_media_type)
 
 
@@ -194,10 +284,13 @@ def patch_db_create_media(mock_db_service: MagicMock):
         author = schemas.Author(id=media.author_id, name='Nintendo', alive=True)
         return schemas.Media(id=1, media_type=media_type, author=author, **media.model_dump())
 
-    mock_db_service.create_media = create_media
+    mock_db_service.create_media.side_effect = create_media
     return MockedResult(status=MockStatus.DYNAMIC, mock_function=create_media)
 
 
+MEDIA_VERSION = service.Version('"1.1.1.1"', datetime(2026, 10, 17, 8, 30, 5))
+
+
 @pytest.fixture(params=['success', 'not_found'])
 def patch_db_get_media(request, mock_db_service: service.DatabaseService):
     if request.param == 'success':
@@ -210,10 +303,12 @@ def patch_db_get_media(request, mock_db_service: service.DatabaseService):
             author=schemas.Author(id=1, name='Test Author', alive=True),
         )
         mock_db_service.get_media.return_value = get_media
+        mock_db_service.get_media_version.return_value = MEDIA_VERSION
         return MockedResult(status=MockStatus.SUCCESS, result=get_media)
     else:
         error = service.NotFoundError('Media not found')
         mock_db_service.get_media.side_effect = error
+        mock_db_service.get_media_version.side_effect = error
         return MockedResult(status=MockStatus.ERROR, error=error)
 
 
@@ -228,6 +323,19 @@ def test_create_media(patch_db_create_media: MockedResult):
     assert created_media.author_id == 1
 
 
+def test_bulk_create_media(mock_db_service: MagicMock, patch_db_create_media: MockedResult):
+    def bulk_create_media(media: list[schemas.MediaCreate]) -> schemas.BulkResult[schemas.Media]:
+        created = [patch_db_create_media.mock_function(item) for item in media]
+        return schemas.BulkResult[schemas.Media](created=created, errors=[])
+
+    mock_db_service.bulk_create_media.side_effect = bulk_create_media
+    media = [schemas.MediaCreate(title=f'Media {i}', media_type_id=1, author_id=1) for i in range(2)]
+    response = client.post('/media/bulk', json=[item.model_dump() for item in media])
+    assert response.status_code == 200
+    result = schemas.BulkResult[schemas.Media](**response.json())
+    assert [item.title for item in result.created] == ['Media 0', 'Media 1']
+
+
 def test_read_media(mock_db_service: MagicMock, patch_db_get_media: MockedResult):
     response = client.get('/media/1')
     if patch_db_get_media.status == MockStatus.SUCCESS:
@@ -253,7 +361,7 @@ def patch_db_create_review(mock_db_service: MagicMock):
         user = schemas.User(id=review.user_id, name='John Doe', age=25)
         return schemas.Review(id=1, media=media, user=user, **review.model_dump())
 
-    mock_db_service.create_review = create_review
+    mock_db_service.create_review.side_effect = create_review
     return MockedResult(status=MockStatus.DYNAMIC, mock_function=create_review)
 
 
@@ -293,6 +401,59 @@ def test_create_review(patch_db_create_review: MockedResult):
     assert created_review.review == 'Great movie'
 
 
+@pytest.fixture
+def review_queue(monkeypatch: ty.Any) -> list[list[schemas.ReviewCreate]]:
+    """Enable the review ingestion with a queue of 2 reviews, whose batches are written to the returned list."""
+    batches: list[list[schemas.ReviewCreate]] = []
+
+    async def write_queued_reviews(reviews: list[schemas.ReviewCreate]) -> list[schemas.BulkError]:
+        batches.append(reviews)
+        return []
+
+    monkeypatch.setattr(main.ingestion, 'default_queue', main.ingestion.ReviewQueue(maxsize=2, put_timeout=0.01))
+    monkeypatch.setattr(main, '_write_queued_reviews', write_queued_reviews)
+    return batches
+
+
+def test_create_review_queued(mock_db_service: MagicMock, review_queue: list[list[schemas.ReviewCreate]]):
+    review = schemas.ReviewCreate(media_id=1, user_id=1, rating=5, review='Great movie')
+    # Within the block, the lifespan of the app runs the worker of the queue
+    with TestClient(main.app) as queue_client:
+        response = queue_client.post('/reviews/', json=review.model_dump())
+        assert response.status_code == 202
+        assert schemas.PendingReview(**response.json()).pending_id
+    # Written by the time the app stopped
+    assert review_queue == [[review]]
+    mock_db_service.create_review.assert_not_called()
+
+
+def test_create_review_queue_rejected(review_queue: list[list[schemas.ReviewCreate]]):
+    review = schemas.ReviewCreate(media_id=1, user_id=1, rating=5, review='Great movie')
+    # Outside of the lifespan of the app the queue is closed, like when it is full
+    response = client.post('/reviews/', json=review.model_dump())
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_bulk_create_reviews(mock_db_service: MagicMock, patch_db_create_review: MockedResult):
+    def bulk_create_reviews(reviews: list[schemas.ReviewCreate]) -> schemas.BulkResult[schemas.Review]:
+        created = [patch_db_create_review.mock_function(review) for review in reviews]
+        return schemas.BulkResult[schemas.Review](created=created, errors=[])
+
+    mock_db_service.bulk_create_reviews.side_effect = bulk_create_reviews
+    reviews = [schemas.ReviewCreate(media_id=1, user_id=1, rating=i, review='Great movie') for i in range(1, 4)]
+    response = client.post('/reviews/bulk', json=[review.model_dump() for review in reviews])
+    assert response.status_code == 200
+    result = schemas.BulkResult[schemas.Review](**response.json())
+    assert [review.rating for review in result.created] == [1, 2, 3]
+    assert result.errors == []
+
+
+def test_bulk_create_reviews_invalid_item():
+    response = client.post('/reviews/bulk', json=[{'media_id': 1}])
+    assert response.status_code == 422
+
+
 def test_read_review(patch_db_get_review: MockedResult):
     response = client.get('/reviews/1')
     if patch_db_get_review.status == MockStatus.SUCCESS:
@@ -313,7 +474,7 @@ def patch_db_create_author(mock_db_service: MagicMock):
     def create_author(author: schemas.AuthorCreate) -> schemas.Author:
         return schemas.Author(id=1, **author.model_dump())
 
-    mock_db_service.create_author = create_author
+    mock_db_service.create_author.side_effect = create_author
     return MockedResult(status=MockStatus.DYNAMIC, mock_function=create_author)
 
 
@@ -322,10 +483,12 @@ def patch_db_get_author(request: ty.Any, mock_db_service: MagicMock):
     if request.param == 'success':
         get_author = schemas.Author(id=1, name='Test Author', alive=True)
         mock_db_service.get_author.return_value = get_author
+        mock_db_service.get_author_version.return_value = service.Version('"1"', MEDIA_VERSION.last_modified)
         return MockedResult(status=MockStatus.SUCCESS, result=get_author)
     else:
         error = service.NotFoundError('Author not found')
         mock_db_service.get_author.side_effect = error
+        mock_db_service.get_author_version.side_effect = error
         return MockedResult(status=MockStatus.ERROR, error=error)
 
 
@@ -339,6 +502,7 @@ def patch_db_get_author_highest_rated_media(request: ty.Any, mock_db_service: Ma
         )
         get_author_highest_rated_media = media
         mock_db_service.get_author_highest_rated_media.return_value = get_author_highest_rated_media
+        mock_db_service.get_author_highest_rated_media_version.return_value = MEDIA_VERSION._replace(last_modified=None)
         return MockedResult(
             status=MockStatus.SUCCESS,
             result=get_author_highest_rated_media,
@@ -347,9 +511,28 @@ def patch_db_get_author_highest_rated_media(request: ty.Any, mock_db_service: Ma
     else:
         error = service.NotFoundError('Author not found')
         mock_db_service.get_author_highest_rated_media.side_effect = error
+        mock_db_service.get_author_highest_rated_media_version.side_effect = error
         return MockedResult(status=MockStatus.ERROR, error=error, description='Author not found')
 
 
+def test_read_media_conditional(mock_db_service: MagicMock, patch_db_get_media: MockedResult):
+    response = client.get('/media/1', headers={'If-None-Match': '"0.1.1.1", W/"1.1.1.1"'})
+    if patch_db_get_media.status == MockStatus.SUCCESS:
+        # Answered from the version alone
+        assert response.status_code == 304
+        assert response.content == b''
+        assert response.headers['etag'] == '"1.1.1.1"'
+        assert response.headers['last-modified'] == 'Sat, 17 Oct 2026 08:30:05 GMT'
+        mock_db_service.get_media.assert_not_called()
+
+        response = client.get('/media/1', headers={'If-None-Match': '"0.1.1.1"'})
+        assert response.status_code == 200
+        assert response.headers['etag'] == '"1.1.1.1"'
+        assert response.json()['title'] == 'Test Media'
+    else:
+        assert response.status_code == 404
+
+
 def test_create_author(patch_db_create_author: MockedResult):
     author = schemas.AuthorCreate(name='Test Author', alive=True)
     response = client.post('/authors/', json=author.model_dump())
@@ -385,3 +568,207 @@ def test_read_author_highest_rated_media(
         assert media.author_id == 1
     else:
         assert response.status_code == 404
+
+
+def test_read_author_conditional(mock_db_service: MagicMock, patch_db_get_author: MockedResult):
+    response = client.get('/authors/1', headers={'If-None-Match': '*'})
+    if patch_db_get_author.status == MockStatus.SUCCESS:
+        assert response.status_code == 304
+        assert response.headers['etag'] == '"1"'
+        mock_db_service.get_author.assert_not_called()
+    else:
+        assert response.status_code == 404
+
+
+def test_read_author_highest_rated_media_conditional(
+    mock_db_service: MagicMock, patch_db_get_author_highest_rated_media: MockedResult
+):
+    response = client.get('/authors/1/highest_rated_media')
+    if patch_db_get_author_highest_rated_media.status == MockStatus.SUCCESS:
+        assert response.status_code == 200
+        # Without Last-Modified, the media ranked first can be replaced by an older one
+        assert 'last-modified' not in response.headers
+        response = client.get('/authors/1/highest_rated_media', headers={'If-None-Match': response.headers['etag']})
+        assert response.status_code == 304
+        mock_db_service.get_author_highest_rated_media.assert_called_once()
+    else:
+        assert response.status_code == 404
+
+
+@pytest.mark.parametrize('found', [True, False])
+def test_read_author_stats(mock_db_service: MagicMock, found: bool):
+    if found:
+        mock_db_service.get_author_stats.return_value = schemas.AuthorStats(
+            author_id=1,
+            works=2,
+            reviews=3,
+            rating_average=4.0,
+            rating_histogram=[0, 0, 1, 1, 1],
+            best_media=schemas.MediaRating(id=1, title='Test Media', rating_count=3, rating_average=4.0),
+            worst_media=None,
+        )
+    else:
+        mock_db_service.get_author_stats.side_effect = service.NotFoundError('Author not found')
+    response = client.get('/authors/1/stats')
+    if found:
+        assert response.status_code == 200
+        stats = schemas.AuthorStats(**response.json())
+        assert stats.rating_histogram == [0, 0, 1, 1, 1]
+        assert stats.best_media is not None and stats.best_media.title == 'Test Media'
+    else:
+        assert response.status_code == 404
+
+
+def test_read_rating_analytics(mock_db_service: MagicMock):
+    mock_db_service.get_rating_analytics.return_value = schemas.RatingAnalytics(
+        group='author',
+        ratings=[4, 5],
+        percentiles=[50.0],
+        total=3,
+        items=[schemas.RatingStats(id=1, count=2, mean=4.5, variance=0.25, percentiles=[4], histogram=[1, 1])],
+    )
+    response = client.get('/analytics/ratings/author?percentiles=50&limit=1&offset=2')
+    assert response.status_code == 200
+    assert schemas.RatingAnalytics(**response.json()).items[0].histogram == [1, 1]
+    mock_db_service.get_rating_analytics.assert_called_once_with(group='author', percentiles=[50.0], limit=1, offset=2)
+
+
+@pytest.mark.parametrize(
+    'url',
+    ['/analytics/ratings/review', '/analytics/ratings/media?percentiles=50,150', '/analytics/ratings/user?limit=0'],
+)
+def test_read_rating_analytics_invalid_params(mock_db_service: MagicMock, url: str):
+    assert client.get(url).status_code == 422
+    mock_db_service.get_rating_analytics.assert_not_called()
+
+
+# Search ----------------------------------------------------------------------
+def test_search_media(mock_db_service: MagicMock):
+    media = schemas.Media(
+        id=1,
+        title='The Hobbit',
+        media_type_id=1,
+        author_id=None,
+        media_type=schemas.MediaType(id=1, name='Book'),
+        author=None,
+    )
+    mock_db_service.search_media.return_value = [media]
+    response = client.get('/media/search', params={'q': 'hobbit', 'limit': 10, 'offset': 20})
+    assert response.status_code == 200
+    assert [schemas.Media(**item) for item in response.json()] == [media]
+    mock_db_service.search_media.assert_called_once_with(query='hobbit', limit=10, offset=20)
+
+
+def test_search_reviews(mock_db_service: MagicMock):
+    media = schemas.Media(
+        id=1,
+        title='The Hobbit',
+        media_type_id=1,
+        author_id=None,
+        media_type=schemas.MediaType(id=1, name='Book'),
+        author=None,
+    )
+    user = schemas.User(id=1, name='John Doe', age=25)
+    review = schemas.Review(id=1, media_id=1, user_id=1, rating=5, review='Great book!', media=media, user=user)
+    mock_db_service.search_reviews.return_value = [review]
+    response = client.get('/reviews/search', params={'q': 'great'})
+    assert response.status_code == 200
+    assert [schemas.Review(**item) for item in response.json()] == [review]
+    mock_db_service.search_reviews.assert_called_once_with(query='great', limit=20, offset=0)
+
+
+@pytest.mark.parametrize('path', ['/media/search', '/reviews/search'])
+@pytest.mark.parametrize('params', [{}, {'q': ''}, {'q': 'a', 'limit': 101}, {'q': 'a', 'offset': -1}])
+def test_search_invalid_params(path: str, params: dict[str, ty.Any]):
+    response = client.get(path, params=params)
+    assert response.status_code == 422
+
+
+# Rankings --------------------------------------------------------------------
+def test_read_top_rated_media(mock_db_service: MagicMock):
+    media = schemas.RatedMedia(
+        id=1,
+        title='The Hobbit',
+        media_type_id=1,
+        author_id=None,
+        media_type=schemas.MediaType(id=1, name='Book'),
+        author=None,
+        rating_count=2,
+        rating_average=4.5,
+        rating_score=3.25,
+    )
+    mock_db_service.get_top_rated_media.return_value = [media]
+    response = client.get('/rankings/media', params={'limit': 10, 'media_type_id': 1})
+    assert response.status_code == 200
+    assert [schemas.RatedMedia(**item) for item in response.json()] == [media]
+    mock_db_service.get_top_rated_media.assert_called_once_with(limit=10, media_type_id=1, min_reviews=1)
+
+
+@pytest.mark.parametrize('params', [{'limit': 0}, {'limit': 1001}, {'min_reviews': -1}])
+def test_read_top_rated_media_invalid_params(params: dict[str, int]):
+    response = client.get('/rankings/media', params=params)
+    assert response.status_code == 422
+
+
+# Read replicas ---------------------------------------------------------------
+def test_reads_go_to_primary_after_write(monkeypatch: ty.Any, mock_db_service: MagicMock):
+    monkeypatch.setattr(main.database, 'replica_pool', MagicMock())
+    read_from_primary = []
+
+    def create_user(user: schemas.UserCreate) -> schemas.User:
+        read_from_primary.append(main.database.read_from_primary.get())
+        return schemas.User(id=1, **user.model_dump())
+
+    def get_user(user_id: int) -> schemas.User:
+        read_from_primary.append(main.database.read_from_primary.get())
+        return schemas.User(id=user_id, name='John Doe', age=25)
+
+    mock_db_service.create_user.side_effect = create_user
+    mock_db_service.get_user.side_effect = get_user
+    # Own client, the cookie must not leak into the other tests
+    replica_client = TestClient(main.app)
+    assert replica_client.get('/users/1').status_code == 200
+    response = replica_client.post('/users/', json={'name': 'John Doe', 'age': 25})
+    assert main.PRIMARY_COOKIE in response.cookies
+    assert replica_client.get('/users/1').status_code == 200
+    assert read_from_primary == [False, True, True]
+
+
+# Status ---------------------------------------------------------------------
+def test_server_timing_header():
+    response = client.get('/status/pool')
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+
+def test_read_metrics(mock_db_service: MagicMock, patch_db_get_user: MockedResult):
+    mock_db_service.get_user.__name__ = 'get_user'  # Mocks have no name of their own
+    client.get('/users/1')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'review_app_request_duration_seconds_count{method="GET",route="/users/{user_id}"' in response.text
+    assert 'review_app_service_duration_seconds_count{method="get_user"}' in response.text
+    assert 'review_app_db_pool_checked_out{engine="primary"}' in response.text
+
+
+def test_read_pool_status():
+    response = client.get('/status/pool')
+    assert response.status_code == 200
+    status = schemas.PoolStatus(**response.json())
+    assert status.checked_out >= 0
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_read_cache_status(monkeypatch: ty.Any, enabled: bool):
+    default_cache = LRUCache() if enabled else None
+    if default_cache is not None:
+        default_cache.hits, default_cache.misses = 3, 1
+    monkeypatch.setattr(main.cache, 'default_cache', default_cache)
+    response = client.get('/status/cache')
+    assert response.status_code == 200
+    expected = (
+        schemas.CacheStatus(enabled=True, hits=3, misses=1)
+        if enabled
+        else schemas.CacheStatus(enabled=False, hits=0, misses=0)
+    )
+    assert schemas.CacheStatus(**response.json()) == expected
@@ -0,0 +1,94 @@
+"""Tests for the metrics registry and its Prometheus text rendering."""
+
+import json
+import threading
+import time
+import typing as ty
+
+import pytest
+
+from review_app import metrics
+
+
+@pytest.fixture
+def registry() -> metrics.Registry:
+    return metrics.Registry()
+
+
+def _samples(text: str) -> dict[str, float]:
+    return {
+        line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1].replace('+Inf', 'inf'))
+        for line in text.splitlines()
+        if not line.startswith('#')
+    }
+
+
+def test_histogram_aggregates_threads(registry: metrics.Registry):
+    histogram = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+
+    def observe() -> None:
+        for _ in range(1000):
+            histogram.observe(0.5, '/items')
+
+    threads = [threading.Thread(target=observe) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert histogram.collect() == {('/items',): [0, 4000, 0, 2000.0]}
+
+
+def test_render_histogram(registry: metrics.Registry):
+    histogram = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, '/items')
+    text = registry.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert _samples(text) == {
+        'latency_seconds_bucket{route="/items",le="0.1"}': 2,
+        'latency_seconds_bucket{route="/items",le="1"}': 3,
+        'latency_seconds_bucket{route="/items",le="+Inf"}': 4,
+        'latency_seconds_sum{route="/items"}': 3.65,
+        'latency_seconds_count{route="/items"}': 4,
+    }
+
+
+def test_render_counter(registry: metrics.Registry):
+    counter = registry.counter('calls_total', 'Calls.', ('outcome',))
+    counter.inc('executed')
+    counter.inc('coalesced', amount=3)
+    text = registry.render()
+    assert '# TYPE calls_total counter' in text
+    assert _samples(text) == {'calls_total{outcome="executed"}': 1, 'calls_total{outcome="coalesced"}': 3}
+
+
+def test_render_gauge(registry: metrics.Registry):
+    registry.gauge('connections', 'Connections.', ('engine',), lambda: {('primary',): 2, ('say "hi"\n',): 1})
+    assert _samples(registry.render()) == {
+        'connections{engine="primary"}': 2,
+        'connections{engine="say \\"hi\\"\\n"}': 1,
+    }
+
+
+def test_render_multiproc(registry: metrics.Registry, tmp_path: ty.Any):
+    histogram = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(1,))
+    histogram.observe(0.5, '/items')
+    registry.gauge('connections', 'Connections.', ('engine',), lambda: {('primary',): 2})
+    registry.counter('calls_total', 'Calls.', ()).inc()
+    other_worker = {
+        'time': time.time(),
+        'histograms': {'latency_seconds': [[['/items'], [0, 1, 2.0]]]},
+        'counters': {'calls_total': [[[], [2]]]},
+        'gauges': {'connections': [[['primary'], 3]]},
+    }
+    stopped_worker = {**other_worker, 'time': time.time() - 3600}
+    (tmp_path / '1.json').write_text(json.dumps(other_worker))
+    (tmp_path / '2.json').write_text(json.dumps(stopped_worker))
+
+    samples = _samples(registry.render(str(tmp_path)))
+    # Histograms and counters of every worker, gauges of the live ones only
+    assert samples['calls_total'] == 5
+    assert samples['latency_seconds_count{route="/items"}'] == 3
+    assert samples['latency_seconds_sum{route="/items"}'] == 4.5
+    assert samples['connections{engine="primary"}'] == 5
+    assert {path.name for path in tmp_path.iterdir()} == {'1.json', '2.json', f'{metrics.os.getpid()}.json'}
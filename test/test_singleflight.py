@@ -0,0 +1,116 @@
+"""Tests for the single-flight coalescing of concurrent identical calls."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from review_app import singleflight
+
+
+def _coalesced_calls(name: str) -> float:
+    return singleflight.CALLS.collect().get((name, 'coalesced'), [0])[0]
+
+
+def test_make_key():
+    assert singleflight.make_key('get', 1, ids=[1, 2]) == singleflight.make_key('get', 1, ids=[1, 2])
+    assert singleflight.make_key('get', 1) != singleflight.make_key('get', 2)
+    assert singleflight.make_key('get', b=2, a=1) == singleflight.make_key('get', a=1, b=2)
+    hash(singleflight.make_key('get', [1, 2]))
+
+
+def test_concurrent_calls_share_one_run():
+    flights = singleflight.SingleFlight()
+    release = threading.Event()
+    runs = []
+    n_callers = 8
+    coalesced_before = _coalesced_calls('share')
+
+    def run() -> int:
+        runs.append(1)
+        release.wait(timeout=10)
+        return 42
+
+    with ThreadPoolExecutor(n_callers) as executor:
+        futures = [executor.submit(flights.do, ('share', 1), run) for _ in range(n_callers)]
+        while _coalesced_calls('share') < coalesced_before + n_callers - 1:
+            threading.Event().wait(0.001)
+        release.set()
+        assert [future.result() for future in futures] == [42] * n_callers
+    assert len(runs) == 1
+
+
+def test_error_is_shared():
+    flights = singleflight.SingleFlight()
+    release = threading.Event()
+    coalesced_before = _coalesced_calls('fail')
+
+    def run() -> None:
+        release.wait(timeout=10)
+        raise KeyError('missing')
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flights.do, ('fail',), run) for _ in range(2)]
+        while _coalesced_calls('fail') < coalesced_before + 1:
+            threading.Event().wait(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(KeyError):
+                future.result()
+
+
+def test_sequential_calls_run_again():
+    flights = singleflight.SingleFlight()
+    runs = []
+    for _ in range(3):
+        flights.do(('again',), lambda: runs.append(1))
+    assert len(runs) == 3
+
+
+def test_forget():
+    flights = singleflight.SingleFlight()
+    runs = []
+
+    def run() -> None:
+        runs.append(1)
+        if len(runs) == 1:
+            # A commit happened while the first call ran, the next one must not join it
+            flights.forget()
+            flights.do(('forget',), run)
+
+    flights.do(('forget',), run)
+    assert len(runs) == 2
+
+
+def test_async_concurrent_calls_share_one_run():
+    flights = singleflight.AsyncSingleFlight()
+    runs = []
+
+    async def run() -> int:
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main() -> list[int]:
+        return await asyncio.gather(*(flights.do(('async_share', 1), run) for _ in range(8)))
+
+    assert asyncio.run(main()) == [42] * 8
+    assert len(runs) == 1
+
+
+def test_async_cancelled_caller_does_not_cancel_the_run():
+    flights = singleflight.AsyncSingleFlight()
+
+    async def run() -> int:
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main() -> int:
+        first = asyncio.ensure_future(flights.do(('async_cancel',), run))
+        second = asyncio.ensure_future(flights.do(('async_cancel',), run))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 42